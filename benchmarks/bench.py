@@ -0,0 +1,389 @@
+"""Drive a plugin tool's ``_invoke`` with N concurrent callers against the mock Ark server.
+
+Examples (from the repository root, with a plugin's requirements installed)::
+
+    python benchmarks/bench.py text_to_video --callers 8 --invocations 32 --queue 1 --run 3
+    python benchmarks/bench.py text_to_image -c 16 -n 64 --throttle-rate 0.05 --json out.json
+    python benchmarks/bench.py image_to_video -c 4 --compare baseline.json
+    python benchmarks/bench.py text_to_video -c 8 --callbacks --callback-drop-rate 0.3
+
+Reports throughput, end-to-end latency percentiles, Ark requests per
+invocation, polls per task, client-side phase timings (``ark/telemetry.py``)
+and the peak RSS of the process running the tools. The mock server runs in a
+separate process so its memory is not counted. With ``--compare`` the run
+exits non-zero when a metric regressed by more than ``--max-regression``.
+"""
+
+# Imported before anything that starts threads: importing dify_plugin runs gevent's
+# monkey.patch_all, and the tools' own pools deadlock when they are started from
+# threads created before the patch.
+import dify_plugin  # noqa: F401  isort: skip
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import mock_ark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    plugin: str
+    module: str
+    cls: str
+    parameters: dict
+
+
+TOOLS = {
+    "text_to_video": ToolSpec(
+        "doubaoToVideo", "tools.text_to_video", "TextToVideoTool",
+        {"prompt": "A paper boat drifting down a rainy street", "poll_interval": 1},
+    ),
+    "image_to_video": ToolSpec(
+        "doubaoToVideo", "tools.image_to_video", "ImageToVideoTool",
+        {
+            "prompt": "The subject turns towards the camera",
+            "reference_image": {"url": mock_ark.IMAGE_PATH},
+            "poll_interval": 1,
+        },
+    ),
+    "text_to_image": ToolSpec(
+        "doubaotoImage", "tools.text_to_image", "TextToImageTool",
+        {"prompt": "A lighthouse at dusk, oil painting", "size": "2K"},
+    ),
+    "image_to_image": ToolSpec(
+        "doubaotoImage", "tools.image_to_image", "ImageToImageTool",
+        {"prompt": "Turn this into a watercolor", "image": {"url": mock_ark.IMAGE_PATH}, "size": "2K"},
+    ),
+}
+
+# Metrics compared against a baseline, and whether a larger value is better.
+COMPARED = {
+    "throughput_per_second": True,
+    "latency_seconds.p50": False,
+    "latency_seconds.p99": False,
+    "requests_per_invocation.total": False,
+    "peak_rss_mb": False,
+}
+
+
+# Mock server counters that are not requests made by the client.
+NOT_API_REQUESTS = ("dropped", "throttled", "errors", "callbacks", "callbacks_dropped", "callback_errors")
+
+
+@dataclass
+class Outcome:
+    seconds: float
+    ok: bool
+    messages: int
+    error: Optional[str] = None
+
+
+class MockProcess:
+    """``mock_ark.py`` in a child process, so its memory stays out of the measurement."""
+
+    def __init__(self, config: mock_ark.MockConfig):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_ark.py")
+        self.process = subprocess.Popen(
+            [sys.executable, script, "--port", "0", *mock_ark.config_to_argv(config)],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.url = self.process.stdout.readline().strip()
+        if not self.url:
+            self.process.kill()
+            raise RuntimeError("mock Ark server failed to start")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+def load_tool_class(spec: ToolSpec) -> type:
+    sys.path.insert(0, os.path.join(ROOT, spec.plugin))
+    module = __import__(spec.module, fromlist=[spec.cls])
+    return getattr(module, spec.cls)
+
+
+def invoke_once(tool_cls: type, credentials: dict, parameters: dict) -> Outcome:
+    from dify_plugin.core.runtime import Session
+    from dify_plugin.entities.tool import ToolRuntime
+
+    tool = tool_cls(
+        runtime=ToolRuntime(credentials=credentials, user_id="bench", session_id=None),
+        session=Session.empty_session(),
+    )
+    started = time.monotonic()
+    ok, messages, error = False, 0, None
+    try:
+        for message in tool._invoke(parameters):
+            messages += 1
+            kind = message.type.value
+            if kind == "json":
+                ok = ok or _succeeded(message.message.json_object)
+            elif kind == "text" and error is None and _looks_like_error(message.message.text):
+                error = message.message.text
+    except Exception as caught:
+        ok, error = False, f"{type(caught).__name__}: {caught}"
+    return Outcome(time.monotonic() - started, ok, messages, None if ok else error or "no result")
+
+
+def _succeeded(result: dict) -> bool:
+    if result.get("status") == "succeeded" or result.get("data"):
+        return True
+    # Batch summaries.
+    return bool(result.get("batch_size")) and result.get("succeeded") == result.get("batch_size")
+
+
+def _looks_like_error(text: str) -> bool:
+    return text.startswith(("Error", "Task failed", "Failed", "Task did not complete"))
+
+
+def run(args: argparse.Namespace) -> dict:
+    spec = TOOLS[args.tool]
+    mock = None if args.mock_url else MockProcess(mock_ark.config_from_args(args))
+    base_url = args.mock_url or mock.url
+    try:
+        # Relative Dify file URLs (the reference images) resolve against the mock.
+        os.environ["DIFY_INNER_API_URL"] = base_url
+        if args.callbacks:
+            # Any free port for the plugin's callback receiver, unless one is configured.
+            os.environ.setdefault("ARK_CALLBACK_PORT", "0")
+        tool_cls = load_tool_class(spec)
+        traces = _collect_traces()
+        credentials = {"ark_api_key": "bench", "base_url": base_url, **_pairs(args.credential)}
+        parameters = {**spec.parameters, **_pairs(args.param)}
+        if args.callbacks:
+            from ark.callbacks import callback_receiver
+
+            callback_receiver.start()
+            credentials.setdefault("callback_base_url", f"http://127.0.0.1:{callback_receiver.port}")
+            parameters["completion_mode"] = "callback"
+        _post(f"{base_url}/_bench/reset")
+
+        rss_before = _peak_rss_mb()
+        started = time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=args.callers)
+        futures = [
+            pool.submit(invoke_once, tool_cls, credentials, _vary(parameters, index, args.same_prompt))
+            for index in range(args.invocations)
+        ]
+        _, pending = wait(futures, timeout=args.timeout)
+        timed_out = Outcome(args.timeout, False, 0, f"timed out: run did not finish within {args.timeout}s")
+        outcomes = [timed_out if future in pending else future.result() for future in futures]
+        # Hung callers are abandoned; main() exits without joining them.
+        pool.shutdown(wait=not pending, cancel_futures=True)
+        wall = time.monotonic() - started
+        server = json.loads(urllib.request.urlopen(f"{base_url}/_bench/stats").read())
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    return report(args, outcomes, wall, server, traces, rss_before)
+
+
+def report(args, outcomes: list[Outcome], wall: float, server: dict, traces: list, rss_before: float) -> dict:
+    latencies = sorted(outcome.seconds for outcome in outcomes)
+    counts = server["counts"]
+    api_requests = {name: value for name, value in counts.items() if name not in NOT_API_REQUESTS}
+    errors: dict[str, int] = {}
+    for outcome in outcomes:
+        if not outcome.ok:
+            key = outcome.error[:200]
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        "tool": args.tool,
+        "callers": args.callers,
+        "invocations": len(outcomes),
+        "succeeded": sum(outcome.ok for outcome in outcomes),
+        "failed": sum(not outcome.ok for outcome in outcomes),
+        "timed_out": sum(outcome.error is not None and outcome.error.startswith("timed out") for outcome in outcomes),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(outcomes) / wall, 3) if wall else None,
+        "latency_seconds": {
+            "min": round(latencies[0], 3),
+            "p50": _percentile(latencies, 0.50),
+            "p90": _percentile(latencies, 0.90),
+            "p99": _percentile(latencies, 0.99),
+            "max": round(latencies[-1], 3),
+        },
+        "requests_per_invocation": {
+            **{name: round(value / len(outcomes), 2) for name, value in sorted(api_requests.items())},
+            "total": round(sum(api_requests.values()) / len(outcomes), 2),
+        },
+        "tasks_created": server["tasks_created"],
+        "polls_per_task": server["polls_per_task"],
+        "injected": {name: counts.get(name, 0) for name in ("errors", "throttled", "dropped", "callbacks_dropped")},
+        "callbacks_sent": counts.get("callbacks", 0),
+        "client_phases_mean_seconds": _phase_means(traces),
+        "client_counters": _counter_totals(traces),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "peak_rss_mb_before_run": round(rss_before, 1),
+        "errors": errors,
+        "mock": server["config"],
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list[str]:
+    regressions = []
+    for path, higher_is_better in COMPARED.items():
+        current, previous = _lookup(result, path), _lookup(baseline, path)
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > max_regression:
+            regressions.append(f"{path}: {previous} -> {current} ({change:+.0%})")
+    return regressions
+
+
+def _collect_traces() -> list:
+    """Per-invocation telemetry summaries, when the plugin has ``ark/telemetry.py``."""
+    traces: list = []
+    try:
+        from ark import telemetry
+    except ImportError:
+        return traces
+    lock = threading.Lock()
+
+    def sink(summary: dict) -> None:
+        with lock:
+            traces.append(summary)
+
+    telemetry.add_sink(sink)
+    return traces
+
+
+def _phase_means(traces: list) -> dict:
+    totals: dict[str, float] = {}
+    for trace in traces:
+        for name, phase in trace["phases"].items():
+            totals[name] = totals.get(name, 0.0) + phase["seconds"]
+    return {name: round(total / len(traces), 3) for name, total in totals.items()} if traces else {}
+
+
+def _counter_totals(traces: list) -> dict:
+    totals: dict[str, float] = {}
+    for trace in traces:
+        for name, value in trace["counters"].items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    # Nearest rank: p99 of fewer than 100 samples is the maximum.
+    return round(values[max(math.ceil(fraction * len(values)) - 1, 0)], 3)
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _vary(parameters: dict, index: int, same_prompt: bool) -> dict:
+    if same_prompt or not parameters.get("prompt"):
+        return dict(parameters)
+    # Distinct prompts, so identical-request coalescing does not hide the load.
+    return {**parameters, "prompt": f"{parameters['prompt']} #{index}"}
+
+
+def _pairs(values: list[str]) -> dict:
+    pairs = {}
+    for value in values or []:
+        key, _, raw = value.partition("=")
+        try:
+            pairs[key] = json.loads(raw)
+        except ValueError:
+            pairs[key] = raw
+    return pairs
+
+
+def _lookup(data: dict, path: str) -> Any:
+    for key in path.split("."):
+        data = data.get(key) if isinstance(data, dict) else None
+    return data
+
+
+def _post(url: str) -> None:
+    urllib.request.urlopen(urllib.request.Request(url, data=b"{}", method="POST")).read()
+
+
+def _print_report(result: dict) -> None:
+    latency = result["latency_seconds"]
+    print(f"{result['tool']}: {result['invocations']} invocation(s), {result['callers']} concurrent caller(s)")
+    print(f"  succeeded {result['succeeded']}, failed {result['failed']} (timed out {result['timed_out']}), "
+          f"wall {result['wall_seconds']}s, "
+          f"throughput {result['throughput_per_second']}/s")
+    print(f"  latency p50 {latency['p50']}s  p90 {latency['p90']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"  requests per invocation {result['requests_per_invocation']}")
+    print(f"  tasks created {result['tasks_created']}, polls per task {result['polls_per_task']}")
+    print(f"  injected {result['injected']}, callbacks sent {result['callbacks_sent']}")
+    print(f"  client phases (mean s) {result['client_phases_mean_seconds']}")
+    print(f"  client counters {result['client_counters']}")
+    print(f"  peak RSS {result['peak_rss_mb']} MB (before run {result['peak_rss_mb_before_run']} MB)")
+    for error, count in result["errors"].items():
+        print(f"  error x{count}: {error}")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("tool", choices=sorted(TOOLS))
+    parser.add_argument("-c", "--callers", type=int, default=4, help="concurrent callers")
+    parser.add_argument("-n", "--invocations", type=int, default=None, help="total invocations (default: callers)")
+    parser.add_argument("--param", action="append", metavar="KEY=VALUE", help="tool parameter (JSON value or string)")
+    parser.add_argument("--credential", action="append", metavar="KEY=VALUE", help="provider credential")
+    parser.add_argument(
+        "--callbacks", action="store_true", help="video tools: completion_mode=callback against the mock's callbacks"
+    )
+    parser.add_argument("--same-prompt", action="store_true", help="send identical requests (exercises coalescing)")
+    parser.add_argument("--mock-url", help="use an already running mock server instead of starting one")
+    parser.add_argument("--json", metavar="PATH", help="write the result as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="baseline JSON from an earlier --json run")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="fail the run when it has not finished after this many seconds"
+    )
+    mock_ark.add_arguments(parser)
+    args = parser.parse_args(argv)
+    args.invocations = args.invocations or args.callers
+    if args.callbacks and TOOLS[args.tool].plugin != "doubaoToVideo":
+        parser.error("--callbacks only applies to the video tools")
+
+    result = run(args)
+    _print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+    if result["timed_out"]:
+        print(f"TIMEOUT {result['timed_out']} invocation(s) still running after {args.timeout}s")
+        sys.stdout.flush()
+        # Hung worker threads would block a normal interpreter exit.
+        os._exit(3)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("tool") != result["tool"]:
+            print(f"Baseline is for {baseline.get('tool')}, not {result['tool']}; not comparing")
+            return 2
+        regressions = compare(result, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
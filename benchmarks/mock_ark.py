@@ -0,0 +1,405 @@
+"""A local stand-in for the Ark API, for benchmarks and load tests.
+
+Serves the endpoints the plugins call, with configurable latencies and
+injected failures:
+
+- ``POST /api/v3/contents/generations/tasks`` creates a video task that stays
+  ``queued`` for ``--queue`` seconds, ``running`` for ``--run`` seconds, then
+  ``succeeded`` (or ``failed`` for ``--task-failure-rate`` of tasks)
+- ``GET /api/v3/contents/generations/tasks/{id}`` and the task list
+- ``POST /api/v3/images/generations`` answers after ``--image-latency``; with
+  ``"stream": true`` it sends one server-sent event per image instead, spread
+  over the same latency
+- ``GET /media/video.mp4`` and ``GET /media/image.png`` are the result files,
+  served after ``--download-latency``
+- a task created with ``callback_url`` gets the task object POSTed there on
+  every status change, like Ark's callbacks; ``--callback-drop-rate`` of them
+  are never sent, which leaves the client to fall back to polling
+
+Any API request may instead be answered with a 500 (``--error-rate``), a 429
+with ``Retry-After`` (``--throttle-rate``), or, for task creation, be
+processed and then dropped without a response (``--drop-rate``), which makes
+the client look the task up before retrying. ``--list-lag`` keeps new tasks
+out of the task list for a while, as Ark's list can lag behind creation.
+
+``GET /_bench/stats`` returns request counts; ``POST /_bench/reset`` clears
+them. Run standalone with ``python benchmarks/mock_ark.py --port 8000``; the
+first line printed is the listening URL.
+"""
+
+import argparse
+import io
+import itertools
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+from collections import Counter
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+VIDEO_TASKS_PATH = "/api/v3/contents/generations/tasks"
+IMAGES_PATH = "/api/v3/images/generations"
+VIDEO_PATH = "/media/video.mp4"
+IMAGE_PATH = "/media/image.png"
+
+
+@dataclass
+class MockConfig:
+    create_latency: float = 0.05
+    queue: float = 1.0
+    run: float = 3.0
+    image_latency: float = 1.0
+    images_per_request: int = 1
+    download_latency: float = 0.05
+    video_mb: float = 2.0
+    image_kb: float = 200.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    drop_rate: float = 0.0
+    list_lag: float = 0.0
+    task_failure_rate: float = 0.0
+    callback_drop_rate: float = 0.0
+    retry_after: float = 0.5
+    seed: Optional[int] = None
+
+
+class MockArk:
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # Task ids stay unique across mock runs, like Ark's.
+        self.run_id = f"{int(time.time() * 1000):x}"
+        self.tasks: dict[str, dict] = {}
+        self.counts: Counter = Counter()
+        self.polls_per_task: Counter = Counter()
+        self.video = bytes(int(config.video_mb * 1024 * 1024))
+        self.image = _png_bytes(int(config.image_kb * 1024))
+        self.server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self) -> "MockArk":
+        threading.Thread(target=self.server.serve_forever, name="mock-ark", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def roll(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self.random.random() < rate
+
+    def create_task(self, payload: dict, base_url: str) -> dict:
+        with self._lock:
+            task_id = f"cgt-mock-{self.run_id}-{next(self._ids)}"
+            task = {
+                "id": task_id,
+                "model": payload.get("model"),
+                # Echo the prompt (not the images) until the task has a result.
+                "content": [item for item in payload.get("content") or [] if item.get("type") == "text"],
+                "created_at": int(time.time()),
+                "started": time.monotonic(),
+                "fails": self.config.task_failure_rate > 0 and self.random.random() < self.config.task_failure_rate,
+                **{key: payload[key] for key in ("ratio", "duration", "generate_audio", "draft", "seed") if key in payload},
+            }
+            self.tasks[task_id] = task
+        if payload.get("callback_url"):
+            threading.Thread(
+                target=self.send_callbacks, args=(task, payload["callback_url"], base_url), daemon=True
+            ).start()
+        return task
+
+    def send_callbacks(self, task: dict, url: str, base_url: str) -> None:
+        """POST the task object to ``url`` on each status change (queued, running, final)."""
+        sent = None
+        for mark in (0.0, self.config.queue, self.config.queue + self.config.run):
+            time.sleep(max(task["started"] + mark + 0.01 - time.monotonic(), 0.0))
+            view = self.task_view(task, base_url)
+            if view["status"] == sent:
+                continue
+            sent = view["status"]
+            if self.roll(self.config.callback_drop_rate):
+                self.count("callbacks_dropped")
+                continue
+            self.count("callbacks")
+            request = urllib.request.Request(
+                url, data=json.dumps(view).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).read()
+            except OSError:
+                self.count("callback_errors")
+
+    def task_view(self, task: dict, base_url: str) -> dict:
+        age = time.monotonic() - task["started"]
+        view = {key: value for key, value in task.items() if key not in ("started", "fails")}
+        if age < self.config.queue:
+            view["status"] = "queued"
+        elif age < self.config.queue + self.config.run:
+            view["status"] = "running"
+        elif task["fails"]:
+            view["status"] = "failed"
+            view["error"] = {"code": "MockFailure", "message": "injected task failure"}
+        else:
+            view["status"] = "succeeded"
+            view["content"] = {"video_url": f"{base_url}{VIDEO_PATH}"}
+            view["usage"] = {"completion_tokens": 1000, "total_tokens": 1000}
+        view["updated_at"] = int(time.time())
+        return view
+
+    def stats(self) -> dict:
+        with self._lock:
+            polls = list(self.polls_per_task.values())
+            return {
+                "counts": dict(self.counts),
+                "tasks_created": len(self.tasks),
+                "polls_per_task": {
+                    "mean": round(sum(polls) / len(polls), 2) if polls else 0,
+                    "max": max(polls) if polls else 0,
+                },
+                "config": asdict(self.config),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts.clear()
+            self.polls_per_task.clear()
+            self.tasks.clear()
+
+
+def _handler_for(ark: MockArk) -> type:
+    class MockArkHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            body = self._read_body()
+            path = self.path.split("?", 1)[0]
+            if path == "/_bench/reset":
+                ark.reset()
+                return self._json(200, {})
+            if path not in (VIDEO_TASKS_PATH, IMAGES_PATH):
+                return self._json(404, {"error": {"message": "not found"}})
+            kind = "create_task" if path == VIDEO_TASKS_PATH else "images"
+            ark.count(kind)
+            if self._inject_failure():
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                return self._json(400, {"error": {"message": "invalid JSON"}})
+
+            if kind == "create_task":
+                time.sleep(ark.config.create_latency)
+                task = ark.create_task(payload, self._base_url())
+                if ark.roll(ark.config.drop_rate):
+                    ark.count("dropped")
+                    # The task exists but the client never hears about it.
+                    self.close_connection = True
+                    return
+                return self._json(200, {"id": task["id"]})
+
+            count = max(int((payload.get("sequential_image_generation_options") or {}).get("max_images") or 1), 1)
+            count = count if payload.get("sequential_image_generation") == "auto" else ark.config.images_per_request
+            if payload.get("stream"):
+                return self._image_events(payload, count)
+            time.sleep(ark.config.image_latency)
+            return self._json(200, {
+                "model": payload.get("model"),
+                "created": int(time.time()),
+                "data": [{"url": f"{self._base_url()}{IMAGE_PATH}", "size": payload.get("size")} for _ in range(count)],
+                "usage": {"generated_images": count, "output_tokens": 4096 * count, "total_tokens": 4096 * count},
+            })
+
+        def do_GET(self) -> None:
+            path = self.path.split("?", 1)[0]
+            if path == "/_bench/stats":
+                return self._json(200, ark.stats())
+            if path in (VIDEO_PATH, IMAGE_PATH):
+                ark.count("download")
+                time.sleep(ark.config.download_latency)
+                content_type = "video/mp4" if path == VIDEO_PATH else "image/png"
+                return self._bytes(200, ark.video if path == VIDEO_PATH else ark.image, content_type)
+            if path == VIDEO_TASKS_PATH:
+                ark.count("list_tasks")
+                if self._inject_failure():
+                    return
+                listed_before = time.monotonic() - ark.config.list_lag
+                with ark._lock:
+                    tasks = [task for task in ark.tasks.values() if task["started"] <= listed_before]
+                tasks = sorted(tasks, key=lambda task: task["started"], reverse=True)[:50]
+                items = [ark.task_view(task, self._base_url()) for task in tasks]
+                return self._json(200, {"items": items, "total": len(ark.tasks)})
+            if path.startswith(f"{VIDEO_TASKS_PATH}/"):
+                ark.count("get_task")
+                if self._inject_failure():
+                    return
+                task_id = path.rsplit("/", 1)[1]
+                task = ark.tasks.get(task_id)
+                if task is None:
+                    return self._json(404, {"error": {"code": "NotFound", "message": f"task {task_id} not found"}})
+                with ark._lock:
+                    ark.polls_per_task[task_id] += 1
+                return self._json(200, ark.task_view(task, self._base_url()))
+            self._json(404, {"error": {"message": "not found"}})
+
+        def _image_events(self, payload: dict, count: int) -> None:
+            # Images arrive one by one, spread over the same total latency as a blocking call.
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            created = int(time.time())
+            events = []
+            for index in range(count):
+                events.append({
+                    "type": "image_generation.partial_succeeded",
+                    "model": payload.get("model"),
+                    "created": created,
+                    "image_index": index,
+                    "url": f"{self._base_url()}{IMAGE_PATH}",
+                    "size": payload.get("size"),
+                })
+            events.append({
+                "type": "image_generation.completed",
+                "model": payload.get("model"),
+                "created": created,
+                "usage": {"generated_images": count, "output_tokens": 4096 * count, "total_tokens": 4096 * count},
+            })
+            try:
+                for event in events:
+                    if event["type"] != "image_generation.completed":
+                        time.sleep(ark.config.image_latency / count)
+                    self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+            except OSError:
+                self.close_connection = True
+
+        def _chunk(self, data: bytes) -> None:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _inject_failure(self) -> bool:
+            if ark.roll(ark.config.throttle_rate):
+                ark.count("throttled")
+                self._json(429, {"error": {"code": "RateLimitExceeded"}}, {"Retry-After": str(ark.config.retry_after)})
+                return True
+            if ark.roll(ark.config.error_rate):
+                ark.count("errors")
+                self._json(500, {"error": {"code": "InternalServiceError"}})
+                return True
+            return False
+
+        def _base_url(self) -> str:
+            return f"http://{self.headers.get('Host') or ark.url.split('//', 1)[1]}"
+
+        def _read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding") == "chunked":
+                data = io.BytesIO()
+                while True:
+                    size = int(self.rfile.readline().strip() or b"0", 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return data.getvalue()
+                    data.write(self.rfile.read(size))
+                    self.rfile.readline()
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _json(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+            self._bytes(status, json.dumps(body).encode("utf-8"), "application/json", headers)
+
+        def _bytes(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MockArkHandler
+
+
+def _png_bytes(size: int) -> bytes:
+    """A valid RGB noise PNG of roughly ``size`` bytes (noise does not compress)."""
+    side = max(int((size / 3) ** 0.5), 1)
+    noise = random.Random(side)
+    raw = b"".join(b"\x00" + noise.randbytes(side * 3) for _ in range(side))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Mock latency and failure options, shared with ``bench.py``."""
+    defaults = MockConfig()
+    group = parser.add_argument_group("mock Ark server")
+    group.add_argument("--create-latency", type=float, default=defaults.create_latency, help="seconds per task creation")
+    group.add_argument("--queue", type=float, default=defaults.queue, help="seconds a video task stays queued")
+    group.add_argument("--run", type=float, default=defaults.run, help="seconds a video task stays running")
+    group.add_argument("--image-latency", type=float, default=defaults.image_latency, help="seconds per image generation")
+    group.add_argument("--images-per-request", type=int, default=defaults.images_per_request)
+    group.add_argument("--download-latency", type=float, default=defaults.download_latency, help="seconds before a result file is sent")
+    group.add_argument("--video-mb", type=float, default=defaults.video_mb, help="size of the generated video")
+    group.add_argument("--image-kb", type=float, default=defaults.image_kb, help="size of generated and reference images")
+    group.add_argument("--error-rate", type=float, default=defaults.error_rate, help="fraction of API requests answered with 500")
+    group.add_argument("--throttle-rate", type=float, default=defaults.throttle_rate, help="fraction of API requests answered with 429")
+    group.add_argument("--drop-rate", type=float, default=defaults.drop_rate, help="fraction of task creations dropped after the task exists")
+    group.add_argument("--list-lag", type=float, default=defaults.list_lag, help="seconds before a new task shows up in the task list")
+    group.add_argument("--task-failure-rate", type=float, default=defaults.task_failure_rate, help="fraction of tasks that end failed")
+    group.add_argument("--callback-drop-rate", type=float, default=defaults.callback_drop_rate, help="fraction of task callbacks never sent")
+    group.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Retry-After seconds sent with 429")
+    group.add_argument("--seed", type=int, default=None, help="seed for failure injection")
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(**{name: getattr(args, name) for name in MockConfig.__dataclass_fields__})
+
+
+def config_to_argv(config: MockConfig) -> list[str]:
+    argv = []
+    for name, value in asdict(config).items():
+        if value is not None:
+            argv += [f"--{name.replace('_', '-')}", str(value)]
+    return argv
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    ark = MockArk(config_from_args(args), args.host, args.port)
+    print(ark.url, flush=True)
+    try:
+        ark.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ark.server.server_close()
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
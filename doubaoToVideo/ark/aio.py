@@ -0,0 +1,366 @@
+"""Asyncio Ark engine with HTTP/2 multiplexing, plus a synchronous adapter.
+
+``AsyncArkEngine`` runs every Ark request of the process (task creation,
+status polls, image generation and result downloads) on one ``httpx``
+``AsyncClient`` living on a single background event loop. With the optional
+``h2`` package installed, concurrent requests to the same host are multiplexed
+as streams over one HTTP/2 connection instead of each holding its own socket.
+
+Tools keep their synchronous ``_invoke`` generators: ``ArkEngineClient`` is a
+drop-in replacement for ``ArkClient`` that submits coroutines to the loop and
+hands back ``requests``-compatible responses and exceptions, so the calling
+code (``raise_for_status``, ``iter_content``, ``RequestException`` handlers)
+is unchanged. Select it with the provider credential ``http_engine: asyncio``.
+
+Single-task status polling runs entirely on the loop: ``poll_task`` drives
+``polling.apoll_task``, whose waits are ``asyncio.sleep`` calls and whose
+status queries are coroutines, and the tool's generator only relays the
+events. Other requests (creation, downloads, batch and callback-mode polls)
+still go through the shared synchronous rate limiting and retries, and the
+caller blocks on each one while it runs on the loop.
+"""
+
+import asyncio
+import hashlib
+import selectors
+import threading
+import time
+from collections import Counter
+from functools import partial
+from typing import Any, AsyncIterator, Generator, Optional
+
+import requests
+
+try:
+    import httpcore  # noqa: F401 - fail at import time if the transport cannot load
+    import httpx
+except AttributeError as error:  # pragma: no cover - depends on the installed packages
+    # httpcore imports trio when it is installed, and trio fails on gevent's patched select.
+    raise ImportError(f"httpx cannot load here: {error}") from error
+from requests.structures import CaseInsensitiveDict
+
+from ark.client import (
+    DEFAULT_BASE_URL,
+    VIDEO_TASKS_PATH,
+    ClientConfig,
+    ConnectionStats,
+    Timeout,
+    post_json,
+    send_api_request,
+)
+from ark.endpoints import EndpointPool, parse_base_urls, task_owners
+from ark.payload import JSONBody
+from ark.ratelimit import rate_limiter
+from ark.retry import NotSent
+
+try:
+    import h2  # noqa: F401 - only needed for httpx's HTTP/2 support
+
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - h2 is optional
+    HTTP2_AVAILABLE = False
+
+
+class EventLoopThread:
+    """A process-wide event loop running on a daemon thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.SelectorEventLoop(_selector())
+                threading.Thread(target=loop.run_forever, name="ark-event-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coroutine, timeout: Optional[float] = None) -> Any:
+        """Run ``coroutine`` on the loop and block the caller until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def iterate(self, iterator: AsyncIterator) -> Generator[Any, None, None]:
+        """Drive an async iterator from synchronous code, one item at a time."""
+        try:
+            while True:
+                try:
+                    yield self.run(_anext(iterator))
+                except StopAsyncIteration:
+                    return
+        finally:
+            if hasattr(iterator, "aclose"):
+                self.run(_aclose(iterator))
+
+
+def _selector() -> selectors.BaseSelector:
+    # gevent's monkey patching removes select.epoll, which the default selector
+    # captured at import time; poll/select are patched to cooperate instead.
+    if hasattr(selectors, "PollSelector") and hasattr(selectors.select, "poll"):
+        return selectors.PollSelector()
+    return selectors.SelectSelector()
+
+
+async def _anext(iterator: AsyncIterator) -> Any:
+    return await iterator.__anext__()
+
+
+async def _aclose(iterator) -> None:
+    await iterator.aclose()
+
+
+event_loop = EventLoopThread()
+
+
+class EngineStats(ConnectionStats):
+    """Connection stats that also count responses per HTTP version."""
+
+    def __init__(self):
+        super().__init__()
+        self.http_versions: Counter = Counter()
+
+    def record_response(self, http_version: str) -> None:
+        with self._lock:
+            self.http_versions[http_version] += 1
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        with self._lock:
+            snapshot["http_versions"] = dict(self.http_versions)
+        return snapshot
+
+
+class AsyncArkEngine:
+    """Async core shared by all tools for one ``(base_url, api_key)`` pair (``base_url`` may list several)."""
+
+    def __init__(self, base_url: str, api_key: Optional[str], config: ClientConfig):
+        self.config = config
+        self.base_url = base_url
+        self.endpoints = EndpointPool(parse_base_urls(base_url, DEFAULT_BASE_URL), config.connect_timeout)
+        self.key_digest = hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()
+        self.stats = EngineStats()
+        self._auth_headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.endpoints.primary}{path}"
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the engine's event loop.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=self.config.pool_maxsize,
+                    max_keepalive_connections=self.config.pool_maxsize,
+                ),
+            )
+        return self._client
+
+    def _timeout(self, timeout: Timeout) -> httpx.Timeout:
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect, read = self.config.connect_timeout, float(timeout or self.config.download_timeout)
+        return httpx.Timeout(read, connect=connect)
+
+    async def _trace(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            self.stats.record_connection()
+
+    def _build(self, method: str, url: str, timeout: Timeout, authenticated: bool, json: Any = None,
+               data: Any = None, headers: Optional[dict] = None, params: Optional[dict] = None) -> httpx.Request:
+        request_headers = dict(self._auth_headers) if authenticated else {}
+        request_headers.update(headers or {})
+        content = None
+        if isinstance(data, JSONBody):
+            # Keep streaming large inline images; an explicit length avoids chunked encoding.
+            request_headers["Content-Length"] = str(len(data))
+            content = _aiter(data)
+        elif data is not None:
+            content = data
+        return self._http().build_request(
+            method,
+            self.url(url),
+            json=json,
+            params=params,
+            content=content,
+            headers=request_headers,
+            timeout=self._timeout(timeout),
+            extensions={"trace": self._trace},
+        )
+
+    async def request(self, method: str, url: str, timeout: Timeout = None, authenticated: bool = True,
+                      stream: bool = False, **kwargs) -> httpx.Response:
+        self.stats.record_request()
+        request = self._build(method, url, timeout, authenticated, **kwargs)
+        response = await self._http().send(request, stream=stream)
+        self.stats.record_response(response.http_version)
+        return response
+
+    async def get_task(self, task_id: str) -> dict:
+        """One status query on the endpoint that created the task; raises ``requests`` exceptions."""
+        base = task_owners.get(task_id) or self.endpoints.primary
+        health = self.endpoints.health.get(base)
+        started = time.monotonic()
+        try:
+            response = await self.request("GET", f"{base}{VIDEO_TASKS_PATH}/{task_id}", self.config.poll_timeout)
+        except httpx.HTTPError as error:
+            if health:
+                health.record(None, ok=False)
+            raise _requests_error(error) from error
+        if health:
+            health.record(time.monotonic() - started, ok=response.status_code < 500)
+        converted = _to_requests_response(response, response.content)
+        converted.raise_for_status()
+        return converted.json()
+
+
+class ArkEngineClient:
+    """Synchronous, ``ArkClient``-compatible facade over an ``AsyncArkEngine``."""
+
+    def __init__(self, engine: AsyncArkEngine, authenticated: bool = True):
+        self.engine = engine
+        self._authenticated = authenticated
+
+    @property
+    def config(self) -> ClientConfig:
+        return self.engine.config
+
+    @property
+    def stats(self) -> ConnectionStats:
+        return self.engine.stats
+
+    @property
+    def base_url(self) -> str:
+        return self.engine.base_url
+
+    @property
+    def endpoints(self) -> EndpointPool:
+        return self.engine.endpoints
+
+    @property
+    def key_digest(self) -> str:
+        return self.engine.key_digest
+
+    @property
+    def downloads(self) -> "ArkEngineClient":
+        """Unauthenticated view sharing the same connections, for result URLs."""
+        return ArkEngineClient(self.engine, authenticated=False)
+
+    def url(self, path: str) -> str:
+        return self.engine.url(path)
+
+    def request(self, method: str, url: str, timeout: Timeout = None, stream: bool = False,
+                **kwargs) -> requests.Response:
+        send = partial(self._send, method, timeout=timeout, stream=stream)
+        if not self._authenticated:
+            return send(url, **kwargs)
+        return send_api_request(self, method, url, send, **kwargs)
+
+    def rate_limit_stats(self) -> dict:
+        return rate_limiter.snapshot(self.key_digest)
+
+    def poll_task(self, task_id: str, scheduler) -> Generator:
+        """Relay the ``PollEvent``s of a poll loop that sleeps and queries on the event loop."""
+        # Video tasks only: the image plugin's copy of this module has no ark.polling to import.
+        from ark.polling import apoll_task
+
+        return event_loop.iterate(apoll_task(partial(self.engine.get_task, task_id), scheduler))
+
+    def _send(self, method: str, url: str, timeout: Timeout = None, stream: bool = False,
+              **kwargs) -> requests.Response:
+        try:
+            response = event_loop.run(
+                self.engine.request(
+                    method, url, timeout=timeout, authenticated=self._authenticated, stream=stream, **kwargs
+                )
+            )
+            if not stream:
+                return _to_requests_response(response, response.content)
+        except httpx.HTTPError as error:
+            raise _requests_error(error) from error
+        return _StreamedResponse(response)
+
+    def get(self, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    def post(self, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return self.request("POST", url, timeout=timeout, **kwargs)
+
+    def post_json(self, url: str, payload: dict, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return post_json(self, url, payload, timeout=timeout, **kwargs)
+
+
+class _StreamedResponse(requests.Response):
+    """A ``requests.Response`` whose body is read lazily from the event loop."""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__()
+        _copy_meta(self, response)
+        self._source = response
+
+    def iter_content(self, chunk_size: int = 1, decode_unicode: bool = False):
+        chunks = self._source.aiter_bytes(chunk_size)
+        try:
+            yield from event_loop.iterate(chunks)
+        except httpx.TimeoutException as error:
+            raise requests.exceptions.Timeout(str(error)) from error
+        except httpx.HTTPError as error:
+            raise requests.exceptions.ChunkedEncodingError(str(error)) from error
+
+    def close(self) -> None:
+        event_loop.run(self._source.aclose())
+
+
+def _requests_error(error: httpx.HTTPError) -> requests.exceptions.RequestException:
+    """The ``requests`` exception the retry logic expects for an httpx failure."""
+    if isinstance(error, (httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return requests.exceptions.ConnectTimeout(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(str(error))
+    if isinstance(error, httpx.ConnectError):
+        return NotSent(str(error))
+    return requests.exceptions.ConnectionError(str(error))
+
+
+def _to_requests_response(response: httpx.Response, content: bytes) -> requests.Response:
+    converted = requests.Response()
+    _copy_meta(converted, response)
+    converted._content = content
+    converted._content_consumed = True
+    return converted
+
+
+def _copy_meta(target: requests.Response, response: httpx.Response) -> None:
+    target.status_code = response.status_code
+    target.headers = CaseInsensitiveDict(response.headers.items())
+    target.url = str(response.url)
+    target.reason = response.reason_phrase
+    target.encoding = response.encoding
+
+
+async def _aiter(body: JSONBody):
+    # Large inline images are read back from temp files; keep those reads off the loop.
+    loop = asyncio.get_running_loop()
+    chunks = iter(body)
+    while (chunk := await loop.run_in_executor(None, next, chunks, None)) is not None:
+        yield chunk
+
+
+_engines: dict[tuple, AsyncArkEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine_client(base_url: str, api_key: Optional[str], config: ClientConfig) -> ArkEngineClient:
+    """Return a facade over the process-wide engine for these credentials."""
+    key = (base_url, hashlib.sha256(str(api_key).encode("utf-8")).hexdigest(), config)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = AsyncArkEngine(base_url, api_key, config)
+            _engines[key] = engine
+    return ArkEngineClient(engine)
@@ -0,0 +1,266 @@
+"""Batch submission and multiplexed polling for many video tasks.
+
+Instead of one blocking poll loop per task, ``run_batch`` keeps at most
+``max_in_flight`` tasks outstanding, tracks all of them in a single loop and
+polls whichever tasks are due in round-robin order, each on its own
+``PollScheduler``. New prompts are submitted as slots free up, and events are
+yielded as they happen, so finished tasks surface in completion order rather
+than submission order. ``batch_messages`` turns those events into tool
+messages for both video tools (prompt batches and parallel drafts).
+"""
+
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Generator, NamedTuple, Optional
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from ark import telemetry
+from ark.client import VIDEO_TASKS_PATH, ArkClient, metrics_fields
+from ark.polling import TERMINAL_STATUSES, PollPolicy, PollScheduler
+
+DEFAULT_MAX_IN_FLIGHT = 4
+MAX_BATCH_SIZE = 100
+
+
+@dataclass
+class BatchItem:
+    index: int
+    prompt: str
+    payload: dict
+    task_id: Optional[str] = None
+    status: str = "pending"
+    task_data: Optional[dict] = None
+    error: Optional[str] = None
+    scheduler: Optional[PollScheduler] = field(default=None, repr=False)
+    due: float = 0.0
+    polls: int = 0
+    submitted_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def seconds(self) -> Optional[float]:
+        if self.submitted_at is None or self.finished_at is None:
+            return None
+        return round(self.finished_at - self.submitted_at, 2)
+
+    def summary(self) -> dict:
+        content = (self.task_data or {}).get("content") or {}
+        return {
+            "index": self.index,
+            "prompt": self.prompt,
+            "task_id": self.task_id,
+            "status": self.status,
+            "video_url": content.get("video_url"),
+            "error": self.error,
+            "polls": self.polls,
+            "seconds": self.seconds,
+            "usage": (self.task_data or {}).get("usage"),
+        }
+
+
+class BatchEvent(NamedTuple):
+    kind: str  # "submitted", "status", "error" (transient poll error) or "finished"
+    item: BatchItem
+    detail: Optional[str] = None
+
+
+def parse_prompts(raw) -> list[str]:
+    """Accept a JSON array of prompts or one prompt per line."""
+    if isinstance(raw, list):
+        values = raw
+    elif isinstance(raw, str) and raw.strip().startswith("["):
+        values = json.loads(raw)
+    elif isinstance(raw, str):
+        values = raw.splitlines()
+    else:
+        return []
+    return [str(value).strip() for value in values if str(value).strip()]
+
+
+def parse_variants(raw) -> list[dict]:
+    """Accept a JSON array of parameter overrides (e.g. ``[{"ratio": "9:16"}]``)."""
+    if not raw:
+        return [{}]
+    values = json.loads(raw) if isinstance(raw, str) else raw
+    if isinstance(values, dict):
+        values = [values]
+    if not isinstance(values, list) or not all(isinstance(value, dict) for value in values):
+        raise ValueError("variants must be a JSON object or an array of objects")
+    return values or [{}]
+
+
+def build_items(base_payload: dict, prompts: list[str], variants: list[dict]) -> list[BatchItem]:
+    """One item per prompt x variant combination, in submission order."""
+    items = []
+    for index, (prompt, variant) in enumerate(itertools.product(prompts, variants)):
+        payload = {**base_payload, **{k: v for k, v in variant.items() if k not in ("content", "prompt")}}
+        payload["content"] = [{"type": "text", "text": prompt}]
+        items.append(BatchItem(index=index, prompt=prompt, payload=payload))
+    return items
+
+
+def run_batch(
+    client: ArkClient,
+    items: list[BatchItem],
+    policy: PollPolicy,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> Generator[BatchEvent, None, None]:
+    pending = list(reversed(items))
+    active: list[BatchItem] = []
+    cursor = 0
+
+    while pending or active:
+        while pending and len(active) < max_in_flight:
+            item = pending.pop()
+            event = _submit(client, item, policy)
+            if item.task_id:
+                active.append(item)
+            yield event
+
+        if not active:
+            continue
+
+        now = time.monotonic()
+        next_due = min(item.due for item in active)
+        if next_due > now:
+            time.sleep(next_due - now)
+            continue
+
+        # Round-robin: start after the task polled last so none is starved.
+        cursor %= len(active)
+        ordered = active[cursor:] + active[:cursor]
+        for item in ordered:
+            if item.due > time.monotonic():
+                continue
+            position = active.index(item)
+            event = _poll(client, item)
+            if event is not None and event.kind == "finished":
+                active.remove(item)
+                cursor = position
+            else:
+                cursor = position + 1
+            if event is not None:
+                yield event
+            if pending and len(active) < max_in_flight:
+                # Fill the freed slot before polling the rest.
+                break
+
+
+def batch_messages(
+    tool: Tool,
+    client: ArkClient,
+    items: list[BatchItem],
+    policy: PollPolicy,
+    max_in_flight: int,
+    extra: Optional[Callable[[list[BatchItem]], dict]] = None,
+) -> Generator[ToolInvokeMessage, None, None]:
+    """Run ``items`` and report each task as it finishes, then one summary JSON.
+
+    ``extra`` maps the finished items (completion order) to additional summary fields.
+    """
+    started = time.monotonic()
+    finished = []
+    for event in run_batch(client, items, policy, max_in_flight=max_in_flight):
+        item = event.item
+        label = f"[{item.index + 1}/{len(items)}]"
+        if event.kind == "submitted":
+            yield tool.create_text_message(f"{label} Task created, task ID: {item.task_id}")
+        elif event.kind == "status":
+            yield tool.create_text_message(f"{label} Task {item.task_id} status is {item.status}")
+        elif event.kind == "error":
+            yield tool.create_text_message(f"{label} Error polling task status: {event.detail}")
+        else:
+            finished.append(item)
+            summary = item.summary()
+            if item.status == "succeeded" and summary["video_url"]:
+                yield tool.create_text_message(
+                    f"{label} Video generation completed ({item.seconds}s), task ID: {item.task_id}"
+                )
+                yield tool.create_link_message(summary["video_url"])
+            else:
+                yield tool.create_text_message(
+                    f"{label} Task {item.task_id or '-'} ended with status {item.status}: {item.error}"
+                )
+
+    succeeded = sum(1 for item in finished if item.status == "succeeded")
+    yield tool.create_json_message({
+        "batch_size": len(items),
+        "succeeded": succeeded,
+        "failed": len(finished) - succeeded,
+        "max_in_flight": max_in_flight,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+        # Completion order; ``index`` gives the submission order.
+        "tasks": [item.summary() for item in finished],
+        **(extra(finished) if extra else {}),
+        **metrics_fields(client),
+    })
+
+
+def _submit(client: ArkClient, item: BatchItem, policy: PollPolicy) -> BatchEvent:
+    item.submitted_at = time.monotonic()
+    try:
+        with telemetry.span("create"):
+            response = client.post_json(VIDEO_TASKS_PATH, item.payload, timeout=client.config.create_timeout)
+            response.raise_for_status()
+            task_id = response.json().get("id")
+    except (requests.exceptions.RequestException, ValueError) as error:
+        return _finish(item, "failed", error=f"Error creating task: {str(error)}")
+    if not task_id:
+        return _finish(item, "failed", error="Failed to create video generation task")
+
+    item.task_id = task_id
+    item.status = "queued"
+    item.scheduler = PollScheduler(policy, model=item.payload.get("model"))
+    item.due = time.monotonic() + item.scheduler.first_delay()
+    return BatchEvent("submitted", item)
+
+
+def _poll(client: ArkClient, item: BatchItem) -> Optional[BatchEvent]:
+    scheduler = item.scheduler
+    item.polls += 1
+    telemetry.count("polls")
+    try:
+        response = client.get(f"{VIDEO_TASKS_PATH}/{item.task_id}", timeout=client.config.poll_timeout)
+        response.raise_for_status()
+        task_data = response.json()
+    except requests.exceptions.RequestException as error:
+        if scheduler.expired():
+            return _finish(item, item.status, error=f"{_timed_out(scheduler)} (last poll failed: {str(error)})")
+        item.due = time.monotonic() + scheduler.error_delay()
+        return BatchEvent("error", item, str(error))
+
+    item.task_data = task_data
+    status = task_data.get("status")
+    if status in TERMINAL_STATUSES:
+        if status == "succeeded":
+            scheduler.record_completion()
+        error = None if status == "succeeded" else (task_data.get("error") or {}).get("message", "Unknown error")
+        return _finish(item, status, error=error)
+
+    if scheduler.expired():
+        # Polled once more after the deadline, and still not done.
+        return _finish(item, status, error=_timed_out(scheduler))
+    item.due = time.monotonic() + scheduler.next_delay(status)
+    if status == item.status:
+        return None
+    item.status = status
+    return BatchEvent("status", item, status)
+
+
+def _timed_out(scheduler: PollScheduler) -> str:
+    return f"did not complete within {scheduler.policy.max_wait:.0f}s"
+
+
+def _finish(item: BatchItem, status: str, error: Optional[str] = None) -> BatchEvent:
+    item.status = status
+    item.error = error
+    item.finished_at = time.monotonic()
+    if item.scheduler is not None:
+        for phase, seconds in item.scheduler.phases().items():
+            telemetry.record_span(phase, seconds)
+    return BatchEvent("finished", item)
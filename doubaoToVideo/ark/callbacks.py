@@ -0,0 +1,205 @@
+"""Callback-driven task completion with a sparse polling fallback.
+
+Ark POSTs the task object to a task's ``callback_url`` whenever its status
+changes. ``CallbackReceiver`` is a small HTTP server embedded in the plugin
+process: each waiting invocation registers an unguessable per-task path,
+passes the resulting public URL to Ark and then sleeps until its callback
+arrives. ``wait_for_callback`` only polls when no callback has arrived for
+``fallback_interval`` seconds, so a healthy task needs only one status query:
+a terminal callback is confirmed with a GET of the task before its result is
+used, so a forged or stale callback cannot hand the tool a video URL.
+
+The receiver listens on ``ARK_CALLBACK_HOST``:``ARK_CALLBACK_PORT`` (default
+``127.0.0.1:8790``; set the host to ``0.0.0.0`` or put a reverse proxy in
+front for Ark to reach it); the provider credential ``callback_base_url``
+must be the address at which Ark can reach that port.
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Generator, Optional
+
+import requests
+
+from ark import telemetry
+from ark.client import VIDEO_TASKS_PATH, ArkClient
+from ark.polling import TERMINAL_STATUSES, PollEvent, PollScheduler
+
+CALLBACK_PATH = "/ark/callbacks/"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8790
+FALLBACK_POLL_INTERVAL = 60.0
+MAX_CALLBACK_BYTES = 1024 * 1024
+
+
+class CallbackWaiter:
+    """Queue of callback payloads for one task."""
+
+    def __init__(self, token: str, url: str):
+        self.token = token
+        self.url = url
+        self.task_id: Optional[str] = None
+        self.received = 0
+        self._condition = threading.Condition()
+        self._updates: deque = deque()
+
+    def push(self, task_data: dict) -> None:
+        with self._condition:
+            self.received += 1
+            self._updates.append(task_data)
+            self._condition.notify_all()
+
+    def next_update(self, timeout: float) -> Optional[dict]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._updates, timeout=max(timeout, 0.0))
+            return self._updates.popleft() if self._updates else None
+
+
+class CallbackReceiver:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._waiters: dict[str, CallbackWaiter] = {}
+
+    def start(self) -> None:
+        """Bind the server on first use; raises ``OSError`` if the port is taken."""
+        with self._lock:
+            if self._server is not None:
+                return
+            server = ThreadingHTTPServer((self.host, self.port), _handler_for(self))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="ark-callbacks", daemon=True).start()
+            self._server = server
+            self.port = server.server_address[1]
+
+    def register(self, public_base_url: str) -> CallbackWaiter:
+        self.start()
+        token = secrets.token_urlsafe(24)
+        waiter = CallbackWaiter(token, f"{public_base_url.rstrip('/')}{CALLBACK_PATH}{token}")
+        with self._lock:
+            self._waiters[token] = waiter
+        return waiter
+
+    def unregister(self, waiter: CallbackWaiter) -> None:
+        with self._lock:
+            self._waiters.pop(waiter.token, None)
+
+    def deliver(self, token: str, task_data: dict) -> bool:
+        with self._lock:
+            waiter = self._waiters.get(token)
+        if waiter is None:
+            return False
+        # Ignore payloads for other tasks posted to a leaked URL.
+        if waiter.task_id and task_data.get("id") not in (None, waiter.task_id):
+            return False
+        waiter.push(task_data)
+        return True
+
+
+def _handler_for(receiver: CallbackReceiver) -> type:
+    class CallbackHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            token = self.path[len(CALLBACK_PATH):] if self.path.startswith(CALLBACK_PATH) else ""
+            length = int(self.headers.get("Content-Length") or 0)
+            if not token or length > MAX_CALLBACK_BYTES:
+                return self._reply(404 if not token else 413)
+            try:
+                task_data = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._reply(400)
+            if not isinstance(task_data, dict):
+                return self._reply(400)
+            self._reply(200 if receiver.deliver(token, task_data) else 404)
+
+        def _reply(self, status: int) -> None:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    return CallbackHandler
+
+
+def wait_for_callback(
+    client: ArkClient,
+    task_id: str,
+    waiter: CallbackWaiter,
+    scheduler: PollScheduler,
+    fallback_interval: float = FALLBACK_POLL_INTERVAL,
+) -> Generator[PollEvent, None, None]:
+    """Yield status updates from callbacks, polling only when they go quiet."""
+    waiter.task_id = task_id
+    polls = 0
+    wait = fallback_interval
+    queried = False
+    while True:
+        remaining = scheduler.deadline - time.monotonic()
+        if remaining <= 0:
+            if not queried:
+                # Only callbacks were seen since the last query; check the task once more before giving up.
+                polls += 1
+                yield _query_task(client, task_id, polls, "poll")
+            return
+        task_data = waiter.next_update(min(wait, remaining))
+        wait = fallback_interval
+        if task_data is not None:
+            telemetry.count("callbacks")
+            status = task_data.get("status")
+            if status not in TERMINAL_STATUSES:
+                if status == "running":
+                    scheduler.mark_running()
+                yield PollEvent(polls, status, task_data, None, source="callback")
+                queried = False
+                continue
+
+        # Quiet for too long, or a terminal callback: ask Ark for the task itself.
+        polls += 1
+        event = _query_task(client, task_id, polls, "poll" if task_data is None else "callback")
+        queried = True
+        if event.status == "running":
+            scheduler.mark_running()
+        yield event
+        if event.status in TERMINAL_STATUSES:
+            return
+        if task_data is not None:
+            # The terminal callback is not confirmed yet; ask again soon rather than after the fallback interval.
+            wait = scheduler.error_delay()
+
+
+def _query_task(client: ArkClient, task_id: str, polls: int, source: str) -> PollEvent:
+    telemetry.count("polls")
+    try:
+        response = client.get(f"{VIDEO_TASKS_PATH}/{task_id}", timeout=client.config.poll_timeout)
+        response.raise_for_status()
+        task_data = response.json()
+    except requests.exceptions.RequestException as error:
+        return PollEvent(polls, None, None, error, source=source)
+    return PollEvent(polls, task_data.get("status"), task_data, None, source=source)
+
+
+def fallback_interval() -> float:
+    try:
+        return float(os.getenv("ARK_CALLBACK_FALLBACK_INTERVAL", FALLBACK_POLL_INTERVAL))
+    except ValueError:
+        return FALLBACK_POLL_INTERVAL
+
+
+def _port() -> int:
+    try:
+        return int(os.getenv("ARK_CALLBACK_PORT", DEFAULT_PORT))
+    except ValueError:
+        return DEFAULT_PORT
+
+
+callback_receiver = CallbackReceiver(os.getenv("ARK_CALLBACK_HOST") or DEFAULT_HOST, _port())
@@ -0,0 +1,44 @@
+"""Run resolution generators concurrently while keeping the message protocol.
+
+Image resolution helpers are generators that may yield ``ToolInvokeMessage``
+objects and ``return`` their result. ``resolve_concurrently`` drives each one
+to completion on a bounded thread pool, then replays the collected messages
+and returns the results in submission order, so callers keep using
+``yield from`` exactly as with the serial version.
+"""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Generator, Iterable
+
+MAX_RESOLVE_WORKERS = 8
+
+
+def drain(generator: Generator) -> tuple[list, Any]:
+    """Exhaust ``generator``; return its yielded items and its return value."""
+    items = []
+    try:
+        while True:
+            items.append(next(generator))
+    except StopIteration as stop:
+        return items, stop.value
+
+
+def resolve_concurrently(
+    generators: Iterable[Generator], max_workers: int = MAX_RESOLVE_WORKERS
+) -> Generator[Any, None, list]:
+    generators = list(generators)
+    if not generators:
+        return []
+    if len(generators) == 1:
+        return [(yield from generators[0])]
+
+    with ThreadPoolExecutor(max_workers=min(len(generators), max_workers)) as pool:
+        # Each worker runs in a copy of the caller's context so it records into the same trace.
+        futures = [pool.submit(contextvars.copy_context().run, drain, generator) for generator in generators]
+        results = []
+        for future in futures:
+            items, value = future.result()
+            yield from items
+            results.append(value)
+    return results
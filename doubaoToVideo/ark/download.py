@@ -0,0 +1,110 @@
+"""Streaming downloads of generated media.
+
+Results are read from the network in chunks into a ``SpooledTemporaryFile``
+(memory up to a small threshold, disk beyond it) and handed to the runtime as
+``BLOB_CHUNK`` messages, so peak memory stays roughly constant however large
+the video is. The requests read timeout applies per chunk, so a slow but
+progressing download is no longer killed by a fixed overall timeout.
+"""
+
+import tempfile
+import uuid
+from typing import Generator, Optional
+
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from ark import telemetry
+from ark.client import PooledSession
+
+# The Dify API merges blob chunks of at most 8 KiB each.
+BLOB_CHUNK_SIZE = 8192
+READ_CHUNK_SIZE = 64 * 1024
+SPOOL_THRESHOLD = 1024 * 1024
+DEFAULT_MAX_BYTES = 30 * 1024 * 1024
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+class SpooledDownload:
+    def __init__(self, mime_type: Optional[str]):
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+        self.size = 0
+        self.mime_type = mime_type
+
+    def write(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def iter_chunks(self, chunk_size: int = BLOB_CHUNK_SIZE) -> Generator[bytes, None, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "SpooledDownload":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def download_to_spool(
+    session: PooledSession,
+    url: str,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    timeout: Optional[float] = None,
+) -> SpooledDownload:
+    """Stream ``url`` into a spooled temp file, enforcing ``max_bytes``."""
+    with session.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise DownloadTooLarge(f"{declared} bytes exceeds the {max_bytes} byte limit")
+
+        download = SpooledDownload(response.headers.get("Content-Type"))
+        try:
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                download.write(chunk)
+                if download.size > max_bytes:
+                    raise DownloadTooLarge(f"download exceeds the {max_bytes} byte limit")
+        except BaseException:
+            download.close()
+            raise
+        finally:
+            telemetry.count("bytes_downloaded", download.size)
+        return download
+
+
+def blob_chunk_messages(download: SpooledDownload, meta: dict) -> Generator[ToolInvokeMessage, None, None]:
+    """Emit a spooled download as the runtime's chunked blob protocol."""
+    blob_id = uuid.uuid4().hex
+    sequence = 0
+    for chunk in download.iter_chunks():
+        yield ToolInvokeMessage(
+            type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+            message=ToolInvokeMessage.BlobChunkMessage(
+                id=blob_id,
+                sequence=sequence,
+                total_length=download.size,
+                blob=chunk,
+                end=False,
+            ),
+            meta=meta,
+        )
+        sequence += 1
+
+    yield ToolInvokeMessage(
+        type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+        message=ToolInvokeMessage.BlobChunkMessage(
+            id=blob_id,
+            sequence=sequence,
+            total_length=download.size,
+            blob=b"",
+            end=True,
+        ),
+        meta=meta,
+    )
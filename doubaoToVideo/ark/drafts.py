@@ -0,0 +1,46 @@
+"""Draft-then-final video pipeline.
+
+Seedance can render a cheap, low-resolution draft (``"draft": true``) and
+later promote a chosen draft to a final video by referencing it in
+``content`` as a ``draft_task``. Ark reuses the draft's model, prompt,
+reference images, audio, seed, ratio, duration and camera settings, so the
+promotion request carries only the draft id plus output options; inline
+base64 images are never uploaded a second time.
+"""
+
+from typing import Optional
+
+from ark.batch import BatchItem
+
+MAX_DRAFTS = 4
+# Output options that may still be set when promoting; everything else comes from the draft.
+PROMOTION_OPTIONS = ("watermark", "resolution", "return_last_frame")
+
+
+def draft_items(payload: dict, count: int, prompt: Optional[str] = None) -> list[BatchItem]:
+    """``count`` draft renders of the same request; each draws its own random seed."""
+    count = min(max(int(count or 1), 1), MAX_DRAFTS)
+    draft = {**payload, "draft": True}
+    return [BatchItem(index=index, prompt=prompt, payload=dict(draft)) for index in range(count)]
+
+
+def promotion_payload(model: str, draft_task_id: str, options: dict) -> dict:
+    payload = {
+        "model": model,
+        "content": [
+            {
+                "type": "draft_task",
+                "draft_task": {"id": draft_task_id}
+            }
+        ],
+    }
+    payload.update({key: options[key] for key in PROMOTION_OPTIONS if options.get(key) is not None})
+    return payload
+
+
+def draft_review(finished: list[BatchItem]) -> dict:
+    """Summary fields pointing the caller at the drafts it can promote."""
+    return {
+        "draft": True,
+        "draft_task_ids": [item.task_id for item in finished if item.status == "succeeded"],
+    }
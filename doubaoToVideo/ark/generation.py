@@ -0,0 +1,277 @@
+"""One video generation from submission to the attached file, shared by both video tools.
+
+The tools only build the request payload; ``video_messages`` creates the
+task (registering a callback waiter in callback mode), waits for it by
+polling or callbacks, shares the result with identical in-flight calls and
+reports the outcome. ``draft_messages`` and ``submit_detached`` cover the
+parallel draft and ``wait=false`` paths.
+"""
+
+from typing import Generator, Optional
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from ark.batch import batch_messages
+from ark.callbacks import CallbackWaiter, callback_receiver, fallback_interval, wait_for_callback
+from ark.client import VIDEO_TASKS_PATH, ArkClient, metrics_fields
+from ark.download import DownloadTooLarge, blob_chunk_messages, download_to_spool
+from ark.drafts import MAX_DRAFTS, draft_items, draft_review
+from ark.polling import PollPolicy, PollScheduler, poll_task
+from ark.singleflight import generation_flights, request_key
+from ark.tasks import create_task
+from ark.telemetry import record_span, span
+
+FAILED_STATUSES = ("failed", "expired", "cancelled")
+
+
+def video_messages(
+    tool: Tool,
+    client: ArkClient,
+    payload: dict,
+    poll_policy: PollPolicy,
+    model: str,
+    tool_parameters: dict,
+    metrics: Optional[dict] = None,
+    echo_responses: bool = False,
+) -> Generator[ToolInvokeMessage, None, None]:
+    """Create one task, wait for it and attach the video.
+
+    ``metrics`` are tool-specific statistics added to the success JSON with
+    the client's when ``emit_metrics`` is set; ``echo_responses`` also returns
+    the raw creation response, as the image-to-video tool always has.
+    """
+    # 回调模式：方舟在任务状态变化时推送结果，仅在长时间无回调时低频轮询
+    callback_base_url = None
+    if tool_parameters.get("completion_mode") == "callback":
+        callback_base_url = (tool.runtime.credentials or {}).get("callback_base_url")
+        if not callback_base_url:
+            yield tool.create_text_message(
+                "Callback mode needs a Callback Base URL in the provider settings, polling instead"
+            )
+
+    # 相同请求并发时只创建一个任务，其余调用等待并共享结果
+    flight, leader = None, True
+    if tool_parameters.get("coalesce", True):
+        flight_key = request_key(VIDEO_TASKS_PATH, payload, client.base_url, client.key_digest)
+        flight, leader = generation_flights.begin(flight_key)
+
+    if not leader:
+        yield tool.create_text_message("An identical request is already in flight, waiting for its result")
+        try:
+            task_data = flight.wait()
+        except Exception as error:
+            yield tool.create_text_message(f"Error waiting for the in-flight task: {str(error)}")
+            return
+        if task_data is None:
+            yield tool.create_text_message("The in-flight request failed to create a video generation task")
+            return
+        yield tool.create_text_message(f"Attached to in-flight task, task ID: {task_data.get('id')}")
+    else:
+        try:
+            task_data = yield from run_task(tool, client, payload, poll_policy, model, callback_base_url, echo_responses)
+            if flight:
+                flight.resolve(task_data)
+                if flight.waiters:
+                    yield tool.create_text_message(
+                        f"Result shared with {flight.waiters} identical in-flight request(s)"
+                    )
+        finally:
+            if flight:
+                generation_flights.finish(flight_key, flight)
+        if task_data is None:
+            return
+
+    status = task_data.get("status")
+    if status == "succeeded":
+        max_download_mb = tool_parameters.get("max_download_mb") or 30
+        yield from _success_messages(tool, client, task_data, max_download_mb, metrics, echo_responses)
+    elif status in FAILED_STATUSES:
+        error_msg = task_data.get("error", {}).get("message", "Unknown error")
+        yield tool.create_text_message(f"Task failed: {error_msg}")
+        yield tool.create_json_message(task_data)
+    else:
+        yield tool.create_text_message(
+            f"Task did not complete within {poll_policy.max_wait:.0f}s. Status: {status}"
+        )
+
+
+def run_task(
+    tool: Tool,
+    client: ArkClient,
+    payload: dict,
+    poll_policy: PollPolicy,
+    model: str,
+    callback_base_url: Optional[str] = None,
+    echo_responses: bool = False,
+) -> Generator[ToolInvokeMessage, None, Optional[dict]]:
+    """Create the task and wait for it; return the last task data seen."""
+    waiter = None
+    if callback_base_url:
+        try:
+            waiter = callback_receiver.register(callback_base_url)
+            payload = {**payload, "callback_url": waiter.url}
+        except OSError as error:
+            yield tool.create_text_message(f"Callback receiver unavailable ({str(error)}), polling instead")
+    try:
+        return (yield from _create_and_wait(tool, client, payload, poll_policy, model, waiter, echo_responses))
+    finally:
+        if waiter:
+            callback_receiver.unregister(waiter)
+
+
+def draft_messages(
+    tool: Tool,
+    client: ArkClient,
+    payload: dict,
+    prompt: str,
+    poll_policy: PollPolicy,
+    tool_parameters: dict,
+) -> Generator[ToolInvokeMessage, None, None]:
+    """Render ``draft_count`` drafts in parallel and return each as soon as it is ready."""
+    items = draft_items(payload, tool_parameters.get("draft_count") or 1, prompt)
+    if not tool_parameters.get("wait", True):
+        yield from submit_detached(tool, client, [item.payload for item in items])
+        return
+
+    yield tool.create_text_message(
+        f"Draft: rendering {len(items)} draft(s) in parallel (at most {MAX_DRAFTS})"
+    )
+    # 多份样片共用同一个已编码的参考图，不会重复编码
+    yield from batch_messages(tool, client, items, poll_policy, len(items), extra=draft_review)
+
+
+def submit_detached(tool: Tool, client: ArkClient, payloads: list[dict]) -> Generator[ToolInvokeMessage, None, None]:
+    """Create the tasks and return their ids without waiting; see the get_video_task tool."""
+    submitted, failed = [], []
+    for index, payload in enumerate(payloads):
+        prompt = payload["content"][0].get("text")
+        try:
+            with span("create"):
+                data = create_task(client, payload)
+        except requests.exceptions.RequestException as e:
+            failed.append({"index": index, "prompt": prompt, "error": str(e)})
+            yield tool.create_text_message(f"Error creating video generation task: {str(e)}")
+            continue
+        task_id = data.get("id")
+        if not task_id:
+            failed.append({"index": index, "prompt": prompt, "error": "no task id returned"})
+            yield tool.create_text_message("Failed to create video generation task")
+            continue
+        submitted.append({"index": index, "prompt": prompt, "task_id": task_id})
+        yield tool.create_text_message(f"Task submitted, task ID: {task_id}")
+
+    yield tool.create_json_message({
+        "task_ids": [task["task_id"] for task in submitted],
+        "tasks": submitted,
+        "failed": failed,
+        "status": "submitted",
+    })
+
+
+def _create_and_wait(
+    tool: Tool,
+    client: ArkClient,
+    payload: dict,
+    poll_policy: PollPolicy,
+    model: str,
+    waiter: Optional[CallbackWaiter],
+    echo_responses: bool,
+) -> Generator[ToolInvokeMessage, None, Optional[dict]]:
+    # Step 1: 创建视频生成任务
+    try:
+        if echo_responses:
+            yield tool.create_text_message("正在创建视频生成任务...")
+        with span("create"):
+            data = create_task(client, payload)
+    except requests.exceptions.RequestException as e:
+        yield tool.create_text_message(f"Error creating video generation task: {str(e)}")
+        return None
+
+    if echo_responses:
+        yield tool.create_text_message("任务创建成功，返回内容：")
+        yield tool.create_json_message(data)
+
+    task_id = data.get("id")
+    if not task_id:
+        yield tool.create_text_message("Failed to create video generation task")
+        return None
+
+    yield tool.create_text_message(f"Task created successfully, task ID: {task_id}")
+
+    # Step 2: 轮询查询任务状态（首次快速检查，之后按状态指数退避）
+    scheduler = PollScheduler(poll_policy, model=model)
+    task_data = {"id": task_id, "status": "queued"}
+    if waiter:
+        events = wait_for_callback(client, task_id, waiter, scheduler, fallback_interval())
+    else:
+        events = poll_task(client, task_id, scheduler)
+    for event in events:
+        if event.error is not None:
+            yield tool.create_text_message(f"Error polling task status: {str(event.error)}")
+            continue
+
+        task_data = event.task_data
+        source = "Callback" if event.source == "callback" else f"Poll {event.poll_count}"
+        yield tool.create_text_message(
+            f"{source} ({scheduler.elapsed():.0f}s): Task status is {event.status}"
+        )
+
+    for phase, seconds in scheduler.phases().items():
+        record_span(phase, seconds)
+    task_data.setdefault("id", task_id)
+    return task_data
+
+
+def _success_messages(
+    tool: Tool,
+    client: ArkClient,
+    task_data: dict,
+    max_download_mb: float,
+    metrics: Optional[dict],
+    echo_responses: bool,
+) -> Generator[ToolInvokeMessage, None, None]:
+    video_url = task_data.get("content", {}).get("video_url")
+    if not video_url:
+        yield tool.create_text_message("Task succeeded but no video URL found")
+        return
+
+    yield tool.create_text_message("Video generation completed!")
+    yield tool.create_text_message(f"Download URL: {video_url}")
+
+    # 尝试下载视频文件
+    try:
+        with span("download"):
+            video = download_to_spool(
+                client.downloads,
+                video_url,
+                max_bytes=int(float(max_download_mb) * 1024 * 1024),
+                timeout=client.config.download_timeout,
+            )
+        with video:
+            yield from blob_chunk_messages(video, {"mime_type": "video/mp4", "filename": "generated_video.mp4"})
+    except DownloadTooLarge as e:
+        yield tool.create_text_message(f"Note: Video not attached ({str(e)}), use the download URL instead")
+    except Exception as e:
+        yield tool.create_text_message(f"Note: Could not download video directly: {str(e)}")
+
+    if echo_responses:
+        yield tool.create_text_message("任务成功，返回 JSON 结果：")
+
+    # 返回详细信息
+    yield tool.create_json_message({
+        "task_id": task_data.get("id"),
+        "model": task_data.get("model"),
+        "status": task_data.get("status"),
+        "video_url": video_url,
+        "resolution": task_data.get("resolution"),
+        "ratio": task_data.get("ratio"),
+        "duration": task_data.get("duration"),
+        "framespersecond": task_data.get("framespersecond"),
+        "seed": task_data.get("seed"),
+        "usage": task_data.get("usage"),
+        "created_at": task_data.get("created_at"),
+        "updated_at": task_data.get("updated_at"),
+        **metrics_fields(client, **(metrics or {})),
+    })
@@ -0,0 +1,238 @@
+"""Adaptive status polling for Ark video generation tasks.
+
+Replaces the fixed ``time.sleep(poll_interval)`` loop with a scheduler that
+checks once quickly (to surface instant failures), backs off exponentially
+with jitter while the task is queued, and, while running, aims the next poll
+at the expected completion time learned from earlier tasks of the same model.
+Polling stops at a wall-clock deadline rather than after a raw poll count.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator, Awaitable, Callable, Generator, NamedTuple, Optional
+
+import requests
+
+from ark import telemetry
+from ark.client import VIDEO_TASKS_PATH, ArkClient
+
+TERMINAL_STATUSES = ("succeeded", "failed", "expired", "cancelled")
+
+
+@dataclass(frozen=True)
+class PollPolicy:
+    first_delay: float = 1.0
+    base_interval: float = 5.0
+    multiplier: float = 1.6
+    queued_ceiling: float = 30.0
+    running_ceiling: float = 15.0
+    near_completion_interval: float = 2.0
+    error_initial: float = 1.0
+    error_ceiling: float = 30.0
+    jitter: float = 0.2
+    max_wait: float = 600.0
+
+    @classmethod
+    def from_parameters(cls, tool_parameters: dict) -> "PollPolicy":
+        base_interval = _positive(tool_parameters.get("poll_interval"), cls.base_interval)
+        max_wait = _positive(tool_parameters.get("max_wait"), None)
+        if max_wait is None:
+            # Older workflows still pass max_polls; keep their overall budget.
+            max_polls = _positive(tool_parameters.get("max_polls"), None)
+            max_wait = max_polls * base_interval if max_polls else cls.max_wait
+        return cls(
+            base_interval=base_interval,
+            running_ceiling=max(cls.running_ceiling, base_interval),
+            queued_ceiling=max(cls.queued_ceiling, base_interval),
+            near_completion_interval=min(cls.near_completion_interval, base_interval),
+            max_wait=max_wait,
+        )
+
+
+class RunTimeEstimator:
+    """Process-wide EWMA of observed running time per model."""
+
+    def __init__(self, alpha: float = 0.3):
+        self._alpha = alpha
+        self._lock = threading.Lock()
+        self._estimates: dict[str, float] = {}
+
+    def expected(self, model: Optional[str]) -> Optional[float]:
+        with self._lock:
+            return self._estimates.get(model or "")
+
+    def observe(self, model: Optional[str], seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            previous = self._estimates.get(model or "")
+            if previous is None:
+                self._estimates[model or ""] = seconds
+            else:
+                self._estimates[model or ""] = previous + self._alpha * (seconds - previous)
+
+
+run_time_estimator = RunTimeEstimator()
+
+
+class PollScheduler:
+    def __init__(self, policy: PollPolicy, model: Optional[str] = None,
+                 estimator: RunTimeEstimator = run_time_estimator):
+        self.policy = policy
+        self.model = model
+        self.estimator = estimator
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + policy.max_wait
+        self.running_since: Optional[float] = None
+        self._last_status: Optional[str] = None
+        self._interval = policy.base_interval
+        self._error_delay = policy.error_initial
+
+    def first_delay(self) -> float:
+        return self._clip(self.policy.first_delay)
+
+    def next_delay(self, status: Optional[str]) -> float:
+        """Delay before the next poll after observing ``status``."""
+        now = time.monotonic()
+        self._error_delay = self.policy.error_initial
+        if status != self._last_status:
+            self._interval = self.policy.base_interval
+            if status == "running" and self.running_since is None:
+                self.running_since = now
+        self._last_status = status
+
+        if status == "running":
+            delay = self._running_delay(now)
+        else:
+            delay = self._interval
+            self._interval = min(self._interval * self.policy.multiplier, self.policy.queued_ceiling)
+        return self._clip(self._jitter(delay))
+
+    def error_delay(self) -> float:
+        delay = self._error_delay
+        self._error_delay = min(self._error_delay * 2, self.policy.error_ceiling)
+        return self._clip(self._jitter(delay))
+
+    def mark_running(self) -> None:
+        """Note the first time the task is seen running, for updates not passed to ``next_delay``."""
+        if self.running_since is None:
+            self.running_since = time.monotonic()
+
+    def record_completion(self) -> None:
+        if self.running_since is not None:
+            self.estimator.observe(self.model, time.monotonic() - self.running_since)
+
+    def phases(self) -> dict[str, float]:
+        """Seconds the task was seen queued and running, measured from when the scheduler started."""
+        now = time.monotonic()
+        if self.running_since is None:
+            return {"queue": now - self.started_at}
+        return {"queue": self.running_since - self.started_at, "run": now - self.running_since}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def _running_delay(self, now: float) -> float:
+        expected = self.estimator.expected(self.model)
+        if expected is not None and self.running_since is not None:
+            remaining = expected - (now - self.running_since)
+            if remaining > self.policy.near_completion_interval:
+                # Sleep most of the way to the expected finish, then tighten up.
+                return min(remaining * 0.8, self.policy.running_ceiling)
+            return self.policy.near_completion_interval
+
+        delay = self._interval
+        self._interval = min(self._interval * self.policy.multiplier, self.policy.running_ceiling)
+        return delay
+
+    def _jitter(self, delay: float) -> float:
+        spread = delay * self.policy.jitter
+        return max(delay + random.uniform(-spread, spread), 0.0)
+
+    def _clip(self, delay: float) -> float:
+        return max(min(delay, self.deadline - time.monotonic()), 0.0)
+
+
+class PollEvent(NamedTuple):
+    poll_count: int
+    status: Optional[str]
+    task_data: Optional[dict]
+    error: Optional[Exception]
+    source: str = "poll"  # or "callback"
+
+
+def poll_task(client: ArkClient, task_id: str, scheduler: PollScheduler) -> Generator[PollEvent, None, None]:
+    """Poll a task until it reaches a terminal status or the deadline passes."""
+    engine_poll = getattr(client, "poll_task", None)
+    if engine_poll is not None:
+        # The asyncio engine sleeps and polls on its event loop; this generator only relays the events.
+        for event in engine_poll(task_id, scheduler):
+            telemetry.count("polls")
+            yield event
+        return
+
+    task_url = f"{VIDEO_TASKS_PATH}/{task_id}"
+    poll_count = 0
+    delay = scheduler.first_delay()
+    while delay is not None:
+        # The last delay ends at the deadline; the poll after it is the final status check.
+        time.sleep(delay)
+        poll_count += 1
+        telemetry.count("polls")
+        try:
+            response = client.get(task_url, timeout=client.config.poll_timeout)
+            response.raise_for_status()
+            event = status_event(poll_count, response.json(), scheduler)
+        except requests.exceptions.RequestException as error:
+            event = PollEvent(poll_count, None, None, error)
+        yield event
+        delay = delay_after(event, scheduler)
+
+
+async def apoll_task(
+    get_task: Callable[[], Awaitable[dict]], scheduler: PollScheduler
+) -> AsyncGenerator[PollEvent, None]:
+    """``poll_task`` as a coroutine for event-loop clients; ``get_task`` performs one status query."""
+    poll_count = 0
+    delay = scheduler.first_delay()
+    while delay is not None:
+        await asyncio.sleep(delay)
+        poll_count += 1
+        try:
+            event = status_event(poll_count, await get_task(), scheduler)
+        except requests.exceptions.RequestException as error:
+            event = PollEvent(poll_count, None, None, error)
+        yield event
+        delay = delay_after(event, scheduler)
+
+
+def status_event(poll_count: int, task_data: dict, scheduler: PollScheduler) -> PollEvent:
+    status = task_data.get("status")
+    if status == "succeeded":
+        scheduler.record_completion()
+    return PollEvent(poll_count, status, task_data, None)
+
+
+def delay_after(event: PollEvent, scheduler: PollScheduler) -> Optional[float]:
+    """Seconds until the next poll, or ``None`` once the task is terminal or the deadline has passed."""
+    if scheduler.expired():
+        return None
+    if event.error is not None:
+        return scheduler.error_delay()
+    if event.status in TERMINAL_STATUSES:
+        return None
+    return scheduler.next_delay(event.status)
+
+
+def _positive(value, default):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if number > 0 else default
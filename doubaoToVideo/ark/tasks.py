@@ -0,0 +1,57 @@
+"""Single-shot task operations shared by detached submission and task queries.
+
+``wait=false`` invocations only create tasks and return their ids; the
+``get_video_task`` tool later fetches one or many of them. Both report tasks
+through ``task_summary`` so workflows see the same fields either way.
+"""
+
+import json
+from typing import Optional
+
+from ark.client import VIDEO_TASKS_PATH, ArkClient
+
+
+def create_task(client: ArkClient, payload: dict) -> dict:
+    """POST a generation task; raises ``requests`` errors like the callers expect."""
+    response = client.post_json(VIDEO_TASKS_PATH, payload, timeout=client.config.create_timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_task(client: ArkClient, task_id: str) -> dict:
+    response = client.get(f"{VIDEO_TASKS_PATH}/{task_id}", timeout=client.config.poll_timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def task_summary(task_data: dict, task_id: Optional[str] = None) -> dict:
+    content = task_data.get("content") or {}
+    error = task_data.get("error") or {}
+    return {
+        "task_id": task_data.get("id") or task_id,
+        "model": task_data.get("model"),
+        "status": task_data.get("status"),
+        "video_url": content.get("video_url"),
+        "resolution": task_data.get("resolution"),
+        "ratio": task_data.get("ratio"),
+        "duration": task_data.get("duration"),
+        "framespersecond": task_data.get("framespersecond"),
+        "seed": task_data.get("seed"),
+        "usage": task_data.get("usage"),
+        "error": error.get("message") if isinstance(error, dict) else error or None,
+        "created_at": task_data.get("created_at"),
+        "updated_at": task_data.get("updated_at"),
+    }
+
+
+def parse_task_ids(raw) -> list[str]:
+    """Accept one id, a JSON array, or ids separated by commas or whitespace."""
+    if isinstance(raw, list):
+        values = raw
+    elif isinstance(raw, str) and raw.strip().startswith("["):
+        values = json.loads(raw)
+    elif isinstance(raw, str):
+        values = raw.replace(",", " ").split()
+    else:
+        return []
+    return list(dict.fromkeys(str(value).strip() for value in values if str(value).strip()))
@@ -0,0 +1,297 @@
+"""Per-phase timing spans and counters for tool invocations.
+
+Each tool's ``_invoke`` is wrapped with ``traced(tool_name)``, which makes a
+``Trace`` current for the invocation. Code anywhere below it times phases
+with ``span("create")`` (or ``record_span`` for durations measured
+elsewhere) and counts events with ``count("polls")``; both are no-ops outside
+an invocation. Worker threads join the caller's trace when they are started
+through ``contextvars.copy_context().run``.
+
+A finished trace is:
+
+- appended as a trailing ``{"metrics": ...}`` JSON message when the tool
+  parameter ``emit_metrics`` is true (``emitting_metrics`` tells result
+  builders to add their connection and cache statistics too),
+- aggregated into a process-wide registry rendered in the Prometheus text
+  format, served on ``http://ARK_METRICS_HOST:ARK_METRICS_PORT/metrics`` when
+  ``ARK_METRICS_PORT`` is set,
+- passed to every sink registered with ``add_sink`` or named by
+  ``ARK_METRICS_SINK`` (``package.module:function``).
+"""
+
+import contextvars
+import functools
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Reported even when zero, so dashboards see a stable set of series.
+COUNTERS = ("polls", "retries", "throttled", "bytes_uploaded", "bytes_downloaded")
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Trace:
+    """Spans and counters of one tool invocation; safe to update from several threads."""
+
+    def __init__(self, tool: str, emit_metrics: bool = False):
+        self.tool = tool
+        self.emit_metrics = emit_metrics
+        self.started_at = time.monotonic()
+        self.total: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._spans: dict[str, list[float]] = {}
+        self._counters: dict[str, float] = dict.fromkeys(COUNTERS, 0)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._spans.setdefault(name, []).append(max(seconds, 0.0))
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def spans(self) -> dict[str, list[float]]:
+        with self._lock:
+            return {name: list(durations) for name, durations in self._spans.items()}
+
+    def counters(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def summary(self) -> dict:
+        """Phases in the order they first finished, with per-phase totals for repeated spans."""
+        total = self.total if self.total is not None else time.monotonic() - self.started_at
+        return {
+            "tool": self.tool,
+            "total_seconds": round(total, 3),
+            "error": self.error,
+            "phases": {
+                name: {
+                    "count": len(durations),
+                    "seconds": round(sum(durations), 3),
+                    "max_seconds": round(max(durations), 3),
+                }
+                for name, durations in self.spans().items()
+            },
+            "counters": self.counters(),
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("ark_trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as phase ``name`` of the current invocation."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record_span(name, time.monotonic() - started)
+
+
+def record_span(name: str, seconds: float) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.record(name, seconds)
+
+
+def count(name: str, value: float = 1) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, value)
+
+
+def emitting_metrics() -> bool:
+    """Whether the current invocation asked for metrics with ``emit_metrics``."""
+    trace = _current.get()
+    return trace is not None and trace.emit_metrics
+
+
+@contextmanager
+def invocation(tool: str, emit_metrics: bool = False) -> Iterator[Trace]:
+    """Make a new trace current for the enclosed block and publish it on exit."""
+    trace = Trace(tool, emit_metrics)
+    token = _current.set(trace)
+    try:
+        yield trace
+    except BaseException as error:
+        trace.error = type(error).__name__
+        raise
+    finally:
+        trace.total = time.monotonic() - trace.started_at
+        try:
+            _current.reset(token)
+        except ValueError:
+            # The generator was closed from another context; nothing to restore there.
+            pass
+        publish(trace)
+
+
+def traced(tool: str) -> Callable:
+    """Decorate a tool's ``_invoke`` generator so each call runs inside ``invocation(tool)``."""
+
+    def decorate(invoke: Callable) -> Callable:
+        @functools.wraps(invoke)
+        def wrapper(self, tool_parameters: dict):
+            with invocation(tool, bool(tool_parameters.get("emit_metrics", False))) as trace:
+                yield from invoke(self, tool_parameters)
+            if trace.emit_metrics:
+                yield self.create_json_message({"metrics": trace.summary()})
+
+        return wrapper
+
+    return decorate
+
+
+class Registry:
+    """Process-wide aggregates of finished traces, rendered as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._invocations: dict[tuple[str, str], int] = {}
+        self._histograms: dict[tuple[str, str], list] = {}
+        self._counters: dict[tuple[str, str], float] = {}
+
+    def observe(self, trace: Trace) -> None:
+        spans = trace.spans()
+        spans["total"] = [trace.total or 0.0]
+        counters = trace.counters()
+        outcome = "error" if trace.error else "ok"
+        with self._lock:
+            key = (trace.tool, outcome)
+            self._invocations[key] = self._invocations.get(key, 0) + 1
+            for name, durations in spans.items():
+                histogram = self._histograms.setdefault((trace.tool, name), [[0] * len(BUCKETS), 0.0, 0])
+                for seconds in durations:
+                    for index, bound in enumerate(BUCKETS):
+                        if seconds <= bound:
+                            histogram[0][index] += 1
+                    histogram[1] += seconds
+                    histogram[2] += 1
+            for name, value in counters.items():
+                self._counters[(trace.tool, name)] = self._counters.get((trace.tool, name), 0) + value
+
+    def render(self) -> str:
+        with self._lock:
+            invocations = sorted(self._invocations.items())
+            histograms = sorted((key, (list(value[0]), value[1], value[2])) for key, value in self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = [
+            "# HELP ark_invocations_total Tool invocations by outcome.",
+            "# TYPE ark_invocations_total counter",
+        ]
+        for (tool, outcome), value in invocations:
+            lines.append(f'ark_invocations_total{{tool="{tool}",outcome="{outcome}"}} {value}')
+
+        lines += [
+            "# HELP ark_phase_seconds Time spent per invocation phase.",
+            "# TYPE ark_phase_seconds histogram",
+        ]
+        for (tool, phase), (buckets, total, observations) in histograms:
+            labels = f'tool="{tool}",phase="{phase}"'
+            for bound, value in zip(BUCKETS, buckets):
+                lines.append(f'ark_phase_seconds_bucket{{{labels},le="{bound}"}} {value}')
+            lines.append(f'ark_phase_seconds_bucket{{{labels},le="+Inf"}} {observations}')
+            lines.append(f"ark_phase_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"ark_phase_seconds_count{{{labels}}} {observations}")
+
+        lines += [
+            "# HELP ark_events_total Polls, retries and bytes transferred by tool invocations.",
+            "# TYPE ark_events_total counter",
+        ]
+        for (tool, name), value in counters:
+            lines.append(f'ark_events_total{{tool="{tool}",event="{name}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_sinks: list[Callable[[dict], None]] = []
+_sinks_lock = threading.Lock()
+_env_sink_loaded = False
+_serving = False
+
+
+def add_sink(sink: Callable[[dict], None]) -> None:
+    """Call ``sink(summary)`` with every finished trace's summary."""
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def publish(trace: Trace) -> None:
+    registry.observe(trace)
+    _serve_metrics()
+    summary = trace.summary()
+    for sink in _load_sinks():
+        try:
+            sink(summary)
+        except Exception:
+            # A broken exporter must never fail the invocation.
+            logger.exception("Metrics sink %r failed", sink)
+
+
+def _load_sinks() -> list[Callable[[dict], None]]:
+    global _env_sink_loaded
+    with _sinks_lock:
+        if not _env_sink_loaded:
+            _env_sink_loaded = True
+            target = os.getenv("ARK_METRICS_SINK")
+            if target:
+                module, _, name = target.partition(":")
+                try:
+                    _sinks.append(getattr(importlib.import_module(module), name))
+                except (ImportError, AttributeError, ValueError):
+                    logger.exception("Cannot load ARK_METRICS_SINK %r", target)
+        return list(_sinks)
+
+
+def _serve_metrics() -> None:
+    """Start the ``/metrics`` endpoint on first use when ``ARK_METRICS_PORT`` is set."""
+    global _serving
+    port = os.getenv("ARK_METRICS_PORT")
+    if not port or _serving:
+        return
+    with _sinks_lock:
+        if _serving:
+            return
+        # Bind once; a failed bind is not retried on every invocation.
+        _serving = True
+        try:
+            server = ThreadingHTTPServer((os.getenv("ARK_METRICS_HOST", "0.0.0.0"), int(port)), _MetricsHandler)
+        except (OSError, ValueError):
+            logger.exception("Cannot serve metrics on port %r", port)
+            return
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="ark-metrics", daemon=True).start()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            body, status = b"", 404
+        else:
+            body, status = registry.render().encode("utf-8"), 200
+        self.send_response(status)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,61 @@
+from typing import Generator
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from ark.client import ArkClient, get_client
+from ark.concurrency import resolve_concurrently
+from ark.polling import TERMINAL_STATUSES
+from ark.tasks import get_task, parse_task_ids, task_summary
+
+MAX_TASK_IDS = 100
+
+
+class GetVideoTaskTool(Tool):
+    def _invoke(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, None]:
+        client = get_client(self.runtime.credentials or {})
+
+        try:
+            task_ids = parse_task_ids(tool_parameters.get("task_ids"))
+        except ValueError as e:
+            yield self.create_text_message(f"Invalid task_ids: {str(e)}")
+            return
+        if not task_ids:
+            yield self.create_text_message("task_ids is required")
+            return
+        if len(task_ids) > MAX_TASK_IDS:
+            yield self.create_text_message(
+                f"Too many task ids: {len(task_ids)} requested, at most {MAX_TASK_IDS} allowed"
+            )
+            return
+
+        # 多个任务并发查询，单个失败不影响其他任务
+        summaries = yield from resolve_concurrently(self._fetch(client, task_id) for task_id in task_ids)
+
+        for summary in summaries:
+            status = summary["status"]
+            if status == "succeeded" and summary["video_url"]:
+                yield self.create_text_message(f"Task {summary['task_id']} succeeded")
+                yield self.create_link_message(summary["video_url"])
+            elif summary["error"]:
+                yield self.create_text_message(f"Task {summary['task_id']} is {status}: {summary['error']}")
+            else:
+                yield self.create_text_message(f"Task {summary['task_id']} is {status}")
+
+        counts = {}
+        for summary in summaries:
+            counts[summary["status"]] = counts.get(summary["status"], 0) + 1
+        yield self.create_json_message({
+            "tasks": summaries,
+            "counts": counts,
+            "done": all(summary["status"] in TERMINAL_STATUSES for summary in summaries),
+        })
+
+    def _fetch(self, client: ArkClient, task_id: str) -> Generator[ToolInvokeMessage, None, dict]:
+        # Generator so it can run on the shared resolution pool.
+        yield from ()
+        try:
+            return task_summary(get_task(client, task_id), task_id)
+        except requests.exceptions.RequestException as e:
+            return {**task_summary({}, task_id), "status": "unknown", "error": str(e)}
@@ -1,40 +1,102 @@
-import base64
 import json
-import os
-import time
-from typing import Generator, Optional
+from typing import Generator, Optional, Union
 from urllib.parse import urlparse
 
-import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from ark.cache import content_key, image_cache, missing_files
+from ark.client import download_session, get_client
+from ark.concurrency import resolve_concurrently
+from ark.drafts import promotion_payload
+from ark.generation import draft_messages, submit_detached, video_messages
+from ark.imaging import ImagePolicy, preprocess_image
+from ark.payload import InlineImage
+from ark.relative import configured_bases, relative_urls
+from ark.polling import PollPolicy
+from ark.schema import file_parameters, looks_like_file_id
+from ark.staging import stager_for
+from ark.telemetry import count, span, traced
+
+# Variable names older workflows map reference images to, before the YAML-declared file parameters.
+IMAGE_PARAMETERS = ("reference_image_url", "reference_image", "image", "sys.files", "sys_files")
+
 
 class ImageToVideoTool(Tool):
+    @traced("image_to_video")
     def _invoke(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, None]:
         credentials = self.runtime.credentials or {}
-        api_key = credentials.get("ark_api_key")
-        base_url = credentials.get("base_url") or "https://ark.cn-beijing.volces.com"
+        client = get_client(credentials)
         model = tool_parameters.get("model") or "doubao-seedance-1-5-pro-251215"
 
         prompt = tool_parameters.get("prompt")
-        if not prompt:
+        draft_task_id = (tool_parameters.get("draft_task_id") or "").strip()
+        if not prompt and not draft_task_id:
             yield self.create_text_message("prompt is required")
             return
 
-        image_urls = yield from self._resolve_all_images(tool_parameters)
+        self._image_policy = ImagePolicy.from_parameters(tool_parameters, model)
+        self._image_reports = []
+        self._stager = None
+        watermark = tool_parameters.get("watermark", False)
+        poll_policy = PollPolicy.from_parameters(tool_parameters)
+
+        if draft_task_id:
+            # 将样片升级为正式视频：参考图、提示词与参数沿用样片任务，不再读取和上传图片
+            payload = promotion_payload(model, draft_task_id, {"watermark": watermark})
+            yield self.create_text_message(f"Promoting draft task {draft_task_id} to a final video")
+        else:
+            payload = yield from self._build_payload(tool_parameters, model, prompt, watermark)
+            if payload is None:
+                return
+            if tool_parameters.get("draft", False):
+                payload["draft"] = True
+                yield from draft_messages(self, client, payload, prompt, poll_policy, tool_parameters)
+                return
+
+        if not tool_parameters.get("wait", True):
+            yield from submit_detached(self, client, [payload])
+            return
+
+        yield from video_messages(
+            self, client, payload, poll_policy, model, tool_parameters,
+            metrics={
+                "image_cache": image_cache.stats(),
+                "image_preprocessing": self._image_reports,
+                "image_staging": self._stager.stats() if self._stager else None,
+            },
+            echo_responses=True,
+        )
+
+    def _build_payload(
+        self, tool_parameters: dict, model: str, prompt: str, watermark: bool
+    ) -> Generator[ToolInvokeMessage, None, Optional[dict]]:
+        with span("resolve_images"):
+            image_urls = yield from self._resolve_all_images(tool_parameters)
         if not image_urls:
             yield self.create_text_message(
                 "At least one image is required, or local file content could not be resolved"
             )
-            return
+            return None
+
+        if self._image_reports:
+            saved = sum(report["saved_bytes"] for report in self._image_reports)
+            yield self.create_text_message(
+                f"Preprocessed {len(self._image_reports)} reference image(s), saved {saved / 1024:.0f} KB"
+            )
+
+        # 配置了暂存地址时，参考图按内容哈希只上传一次，请求中改为传图片 URL
+        self._stager = stager_for(self.runtime.credentials or {})
+        if self._stager:
+            image_urls, errors = self._stager.stage_all(image_urls)
+            if errors:
+                yield self.create_text_message(
+                    f"Could not stage {len(errors)} image(s) ({errors[0]}), sending them inline"
+                )
 
         generate_audio = tool_parameters.get("generate_audio", True)
         ratio = tool_parameters.get("ratio", "adaptive")
         duration = tool_parameters.get("duration", 5)
-        watermark = tool_parameters.get("watermark", False)
-        poll_interval = tool_parameters.get("poll_interval", 5)
-        max_polls = tool_parameters.get("max_polls", 120)
         image_role = tool_parameters.get("image_role")
 
         payload = {
@@ -64,136 +126,38 @@ class ImageToVideoTool(Tool):
                 if item["type"] == "image_url":
                     item["role"] = image_role
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-
-        url = f"{base_url.rstrip('/')}/api/v3/contents/generations/tasks"
-
-        try:
-            yield self.create_text_message("正在创建视频生成任务...")
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            yield self.create_text_message("任务创建成功，返回内容：")
-            yield self.create_json_message(data)
-
-            task_id = data.get("id")
-            if not task_id:
-                yield self.create_text_message("Failed to create video generation task")
-                return
-
-            yield self.create_text_message(f"Task created successfully, task ID: {task_id}")
-
-            poll_count = 0
-            status = "queued"
-            while poll_count < max_polls:
-                poll_count += 1
-                task_url = f"{url}/{task_id}"
+        return payload
 
-                try:
-                    task_response = requests.get(task_url, headers=headers, timeout=10)
-                    task_response.raise_for_status()
-                    task_data = task_response.json()
-
-                    status = task_data.get("status")
-                    yield self.create_text_message(f"Poll {poll_count}/{max_polls}: Task status is {status}")
-
-                    if status == "succeeded":
-                        video_url = task_data.get("content", {}).get("video_url")
-                        if video_url:
-                            yield self.create_text_message("Video generation completed!")
-                            yield self.create_text_message(f"Download URL: {video_url}")
-
-                            try:
-                                video_resp = requests.get(video_url, timeout=30)
-                                if video_resp.status_code == 200:
-                                    yield self.create_file(
-                                        data=video_resp.content,
-                                        filename="generated_video.mp4",
-                                        mime_type="video/mp4",
-                                    )
-                            except Exception as error:
-                                yield self.create_text_message(
-                                    f"Note: Could not download video directly: {str(error)}"
-                                )
-
-                            yield self.create_text_message("任务成功，返回 JSON 结果：")
-
-                            yield self.create_json_message(
-                                {
-                                    "task_id": task_id,
-                                    "model": task_data.get("model"),
-                                    "status": status,
-                                    "video_url": video_url,
-                                    "resolution": task_data.get("resolution"),
-                                    "ratio": task_data.get("ratio"),
-                                    "duration": task_data.get("duration"),
-                                    "framespersecond": task_data.get("framespersecond"),
-                                    "seed": task_data.get("seed"),
-                                    "usage": task_data.get("usage"),
-                                    "created_at": task_data.get("created_at"),
-                                    "updated_at": task_data.get("updated_at"),
-                                }
-                            )
-                        else:
-                            yield self.create_text_message("Task succeeded but no video URL found")
-                        return
-
-                    if status == "failed":
-                        error_msg = task_data.get("error", {}).get("message", "Unknown error")
-                        yield self.create_text_message(f"Task failed: {error_msg}")
-                        yield self.create_json_message(task_data)
-                        return
-
-                    if status in ["queued", "running"]:
-                        time.sleep(poll_interval)
-                        continue
-
-                except requests.exceptions.RequestException as error:
-                    yield self.create_text_message(f"Error polling task status: {str(error)}")
-                    time.sleep(poll_interval)
-
-            yield self.create_text_message(
-                f"Task did not complete after {max_polls} polls. Status: {status}"
-            )
-
-        except requests.exceptions.RequestException as error:
-            yield self.create_text_message(f"Error creating video generation task: {str(error)}")
-
-    def _resolve_all_images(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, list[str]]:
-        all_images = []
-        for key in ["reference_image_url", "reference_image", "image", "sys.files", "sys_files"]:
-            resolved_list = yield from self._resolve_image_like_parameter(tool_parameters.get(key))
-            all_images.extend(resolved_list)
+    def _resolve_all_images(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, list[Union[str, InlineImage]]]:
+        # Collect every candidate first, then resolve them on a bounded pool so
+        # pre-submit latency is the slowest single image rather than the sum.
+        # Only parameters declared as files in the YAML (plus the legacy
+        # variable names) are inspected; prompts and options never reach the
+        # file manager.
+        candidates = []
+        for key in file_parameters(__file__, IMAGE_PARAMETERS):
+            candidates.extend(self._split_candidates(tool_parameters.get(key)))
 
         # Backward-compatible fallback for previous array-based parameter.
         legacy_images = tool_parameters.get("reference_images")
         if isinstance(legacy_images, list) and legacy_images:
-            for item in legacy_images:
-                all_images.extend((yield from self._resolve_image_like_parameter(item)))
-
-        skip_keys = {
-            "prompt",
-            "generate_audio",
-            "ratio",
-            "duration",
-            "watermark",
-            "poll_interval",
-            "max_polls",
-            "model",
-        }
-        for key, value in tool_parameters.items():
-            if key in skip_keys:
-                continue
-            all_images.extend((yield from self._resolve_image_like_parameter(value)))
+            candidates.extend(self._split_candidates(legacy_images))
+
+        resolved_lists = yield from resolve_concurrently(
+            self._resolve_image_like_parameter(value) for value in candidates
+        )
+        all_images = [url for resolved_list in resolved_lists for url in resolved_list]
 
         # Deduplicate while preserving order
         return list(dict.fromkeys(all_images))
 
-    def _resolve_image_like_parameter(self, value) -> Generator[ToolInvokeMessage, None, list[str]]:
+    def _split_candidates(self, value) -> list:
+        # Resolve list items independently so each one can run in parallel.
+        if isinstance(value, list):
+            return [item for item in value if item]
+        return [value] if value else []
+
+    def _resolve_image_like_parameter(self, value) -> Generator[ToolInvokeMessage, None, list[Union[str, InlineImage]]]:
         if not value:
             return []
 
@@ -228,7 +192,7 @@ class ImageToVideoTool(Tool):
 
         return []
 
-    def _extract_image_url(self, image_input: dict) -> Generator[ToolInvokeMessage, None, Optional[str]]:
+    def _extract_image_url(self, image_input: dict) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
         transfer_method = image_input.get("transfer_method")
 
         if transfer_method == "remote_url":
@@ -264,7 +228,7 @@ class ImageToVideoTool(Tool):
 
         return self._url_to_data_uri(image_input.get("url") or image_input.get("remote_url"))
 
-    def _extract_from_file_object(self, value) -> Generator[ToolInvokeMessage, None, Optional[str]]:
+    def _extract_from_file_object(self, value) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
         if value is None:
             return None
 
@@ -277,12 +241,14 @@ class ImageToVideoTool(Tool):
 
         blob = self._safe_getattr(value, "blob")
         if isinstance(blob, bytes) and blob:
-            mime_type = self._normalize_image_mime_type(self._safe_getattr(value, "mime_type"))
-            return f"data:{mime_type};base64,{base64.b64encode(blob).decode('utf-8')}"
+            cache_key = self._cache_key(content_key(blob))
+            if cached := image_cache.get(cache_key):
+                return cached
+            return self._encode_image(blob, self._safe_getattr(value, "mime_type"), cache_key)
 
         return self._url_to_data_uri(self._safe_getattr(value, "url"))
 
-    def _url_to_data_uri(self, raw_url) -> Optional[str]:
+    def _url_to_data_uri(self, raw_url) -> Optional[Union[str, InlineImage]]:
         if not isinstance(raw_url, str) or not raw_url.strip():
             return None
 
@@ -292,25 +258,25 @@ class ImageToVideoTool(Tool):
         if not (url.startswith("/") or self._looks_like_url_or_data_uri(url)):
             return None
 
-        candidates = [url]
-        if url.startswith("/"):
-            candidates = []
-            for env_key in ["DIFY_INNER_API_URL", "DIFY_API_URL", "DIFY_BASE_URL", "CONSOLE_API_URL"]:
-                base = os.getenv(env_key)
-                if isinstance(base, str) and base.strip():
-                    candidates.append(f"{base.rstrip('/')}{url}")
+        cache_key = self._cache_key(f"url:{url}")
+        if cached := image_cache.get(cache_key):
+            return cached
 
-        for candidate in candidates:
-            try:
-                response = requests.get(candidate, timeout=20)
+        def get(candidate: str):
+            with span("fetch_image"):
+                response = download_session().get(candidate, timeout=20)
                 response.raise_for_status()
-                content_type = response.headers.get("Content-Type")
-                mime_type = self._normalize_image_mime_type(content_type)
-                return f"data:{mime_type};base64,{base64.b64encode(response.content).decode('utf-8')}"
-            except Exception:
-                continue
+            return response
 
-        return None
+        try:
+            # Relative paths race every configured Dify base and reuse the one that answered last time.
+            response = relative_urls.fetch(url, get) if url.startswith("/") else get(url)
+            if response is None:
+                return None
+            count("bytes_downloaded", len(response.content))
+            return self._encode_image(response.content, response.headers.get("Content-Type"), cache_key)
+        except Exception:
+            return None
 
     def _safe_getattr(self, obj, attr: str):
         try:
@@ -334,18 +300,54 @@ class ImageToVideoTool(Tool):
             return self._extract_file_id(nested_value)
         return None
 
-    def _file_id_to_data_uri(self, file_id: Optional[str]) -> Generator[ToolInvokeMessage, None, Optional[str]]:
-        if not file_id:
+    def _file_id_to_data_uri(self, file_id: Optional[str]) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
+        # Free text and ids that recently failed to resolve skip the file manager.
+        if not file_id or not looks_like_file_id(file_id):
             return None
+        file_key = self._file_key(file_id)
+        if file_key in missing_files:
+            return None
+
+        cache_key = self._cache_key(f"file:{file_key}")
+        if cached := image_cache.get(cache_key):
+            return cached
 
-        file_content, mime_type = yield from self._read_file_content(file_id)
+        count("file_lookups")
+        with span("read_file"):
+            file_content, mime_type = yield from self._read_file_content(file_id)
         if not file_content:
+            missing_files.add(file_key)
             return None
 
-        mime_type = self._normalize_image_mime_type(mime_type)
-        return f"data:{mime_type};base64,{base64.b64encode(file_content).decode('utf-8')}"
+        return self._encode_image(file_content, mime_type, cache_key)
+
+    def _file_key(self, file_id: str) -> str:
+        # A file id only resolves on the Dify instance, and for the user, it was looked up for.
+        session = getattr(self, "session", None)
+        base = getattr(session, "dify_plugin_daemon_url", None) or ",".join(configured_bases())
+        user_id = getattr(getattr(self, "runtime", None), "user_id", None)
+        return f"{base}|{user_id}|{file_id}"
+
+    def _cache_key(self, source_key: str) -> str:
+        # Preprocessing settings change the encoded output, so they are part of the key.
+        policy = getattr(self, "_image_policy", None) or ImagePolicy()
+        return f"{source_key}|{policy.cache_tag}"
+
+    def _encode_image(self, content: bytes, raw_mime_type: Optional[str], cache_key: str) -> InlineImage:
+        policy = getattr(self, "_image_policy", None) or ImagePolicy()
+        with span("encode"):
+            result = preprocess_image(content, self._normalize_image_mime_type(raw_mime_type), policy)
+            # Encoded once into memory or a temp file; the request body streams it.
+            image = InlineImage.from_bytes(result.content, self._normalize_image_mime_type(result.mime_type))
+        if result.report is not None and getattr(self, "_image_reports", None) is not None:
+            self._image_reports.append(result.report)
+        image_cache.put(cache_key, image)
+        return image
 
     def _read_file_content(self, file_id: str) -> Generator[ToolInvokeMessage, None, tuple[Optional[bytes], Optional[str]]]:
+        # Must stay a generator: callers `yield from` it, and iterating a
+        # plain tuple would leak the bytes as messages and return None.
+        yield from ()
         runtime = getattr(self, "runtime", None)
         file_manager = getattr(runtime, "file_manager", None) if runtime else None
         if file_manager:
@@ -1,19 +1,39 @@
 from typing import Generator
-import time
-import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from ark.batch import (
+    DEFAULT_MAX_IN_FLIGHT,
+    MAX_BATCH_SIZE,
+    batch_messages,
+    build_items,
+    parse_prompts,
+    parse_variants,
+)
+from ark.client import ArkClient, get_client
+from ark.drafts import draft_review, promotion_payload
+from ark.generation import draft_messages, submit_detached, video_messages
+from ark.polling import PollPolicy
+from ark.telemetry import traced
+
 
 class TextToVideoTool(Tool):
+    @traced("text_to_video")
     def _invoke(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, None]:
         credentials = self.runtime.credentials or {}
-        api_key = credentials.get("ark_api_key")
-        base_url = credentials.get("base_url") or "https://ark.cn-beijing.volces.com"
+        client = get_client(credentials)
         model = tool_parameters.get("model") or "doubao-seedance-1-5-pro-251215"
 
         prompt = tool_parameters.get("prompt")
-        if not prompt:
+        try:
+            prompts = parse_prompts(tool_parameters.get("prompts"))
+            variants = parse_variants(tool_parameters.get("variants"))
+        except ValueError as e:
+            yield self.create_text_message(f"Invalid batch input: {str(e)}")
+            return
+        draft = tool_parameters.get("draft", False)
+        draft_task_id = (tool_parameters.get("draft_task_id") or "").strip()
+        if not prompt and not prompts and not draft_task_id:
             yield self.create_text_message("prompt is required")
             return
 
@@ -21,8 +41,7 @@ class TextToVideoTool(Tool):
         ratio = tool_parameters.get("ratio", "adaptive")
         duration = tool_parameters.get("duration", 5)
         watermark = tool_parameters.get("watermark", False)
-        poll_interval = tool_parameters.get("poll_interval", 5)
-        max_polls = tool_parameters.get("max_polls", 120)
+        poll_policy = PollPolicy.from_parameters(tool_parameters)
 
         payload = {
             "model": model,
@@ -38,93 +57,51 @@ class TextToVideoTool(Tool):
             "watermark": watermark
         }
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-
-        url = f"{base_url.rstrip('/')}/api/v3/contents/generations/tasks"
-
-        # Step 1: 创建视频生成任务
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-
-            task_id = data.get("id")
-            if not task_id:
-                yield self.create_text_message("Failed to create video generation task")
+        if draft_task_id:
+            # 将样片升级为正式视频：提示词与参数沿用样片任务，无需重新提交
+            payload = promotion_payload(model, draft_task_id, {"watermark": watermark})
+            yield self.create_text_message(f"Promoting draft task {draft_task_id} to a final video")
+        elif draft:
+            payload["draft"] = True
+            if not prompts:
+                yield from draft_messages(self, client, payload, prompt, poll_policy, tool_parameters)
                 return
 
-            yield self.create_text_message(f"Task created successfully, task ID: {task_id}")
-
-            # Step 2: 轮询查询任务状态
-            poll_count = 0
-            while poll_count < max_polls:
-                poll_count += 1
-                task_url = f"{url}/{task_id}"
-
-                try:
-                    task_response = requests.get(task_url, headers=headers, timeout=10)
-                    task_response.raise_for_status()
-                    task_data = task_response.json()
-
-                    status = task_data.get("status")
-                    yield self.create_text_message(f"Poll {poll_count}/{max_polls}: Task status is {status}")
-
-                    if status == "succeeded":
-                        video_url = task_data.get("content", {}).get("video_url")
-                        if video_url:
-                            yield self.create_text_message(f"Video generation completed!")
-                            yield self.create_text_message(f"Download URL: {video_url}")
-
-                            # 尝试下载视频文件
-                            try:
-                                video_resp = requests.get(video_url, timeout=30)
-                                if video_resp.status_code == 200:
-                                    yield self.create_file(
-                                        data=video_resp.content,
-                                        filename="generated_video.mp4",
-                                        mime_type="video/mp4"
-                                    )
-                            except Exception as e:
-                                yield self.create_text_message(f"Note: Could not download video directly: {str(e)}")
-
-                            # 返回详细信息
-                            yield self.create_json_message({
-                                "task_id": task_id,
-                                "model": task_data.get("model"),
-                                "status": status,
-                                "video_url": video_url,
-                                "resolution": task_data.get("resolution"),
-                                "ratio": task_data.get("ratio"),
-                                "duration": task_data.get("duration"),
-                                "framespersecond": task_data.get("framespersecond"),
-                                "seed": task_data.get("seed"),
-                                "usage": task_data.get("usage"),
-                                "created_at": task_data.get("created_at"),
-                                "updated_at": task_data.get("updated_at")
-                            })
-                        else:
-                            yield self.create_text_message("Task succeeded but no video URL found")
-                        return
+        if prompts and not draft_task_id:
+            yield from self._invoke_batch(client, payload, prompts, variants, poll_policy, tool_parameters)
+            return
 
-                    elif status == "failed":
-                        error_msg = task_data.get("error", {}).get("message", "Unknown error")
-                        yield self.create_text_message(f"Task failed: {error_msg}")
-                        yield self.create_json_message(task_data)
-                        return
+        if not tool_parameters.get("wait", True):
+            yield from submit_detached(self, client, [payload])
+            return
 
-                    elif status in ["queued", "running"]:
-                        # 继续轮询
-                        time.sleep(poll_interval)
-                        continue
+        yield from video_messages(self, client, payload, poll_policy, model, tool_parameters)
+
+    def _invoke_batch(
+        self,
+        client: ArkClient,
+        base_payload: dict,
+        prompts: list[str],
+        variants: list[dict],
+        poll_policy: PollPolicy,
+        tool_parameters: dict,
+    ) -> Generator[ToolInvokeMessage, None, None]:
+        """Submit every prompt x variant with bounded concurrency; report tasks as they finish."""
+        items = build_items(base_payload, prompts, variants)
+        if len(items) > MAX_BATCH_SIZE:
+            yield self.create_text_message(
+                f"Batch too large: {len(items)} tasks requested, at most {MAX_BATCH_SIZE} allowed"
+            )
+            return
 
-                except requests.exceptions.RequestException as e:
-                    yield self.create_text_message(f"Error polling task status: {str(e)}")
-                    time.sleep(poll_interval)
+        if not tool_parameters.get("wait", True):
+            yield from submit_detached(self, client, [item.payload for item in items])
+            return
 
-            yield self.create_text_message(f"Task did not complete after {max_polls} polls. Status: {status}")
+        max_in_flight = int(tool_parameters.get("batch_concurrency") or DEFAULT_MAX_IN_FLIGHT)
+        max_in_flight = min(max(max_in_flight, 1), len(items))
+        yield self.create_text_message(f"Batch: {len(items)} task(s), up to {max_in_flight} in flight")
 
-        except requests.exceptions.RequestException as e:
-            yield self.create_text_message(f"Error creating video generation task: {str(e)}")
+        # 批量样片同样返回可升级的样片任务 ID
+        extra = draft_review if base_payload.get("draft") else None
+        yield from batch_messages(self, client, items, poll_policy, max_in_flight, extra=extra)
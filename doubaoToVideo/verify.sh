@@ -11,6 +11,8 @@ files=(
     "tools/text_to_video.py"
     "tools/image_to_video.yaml"
     "tools/image_to_video.py"
+    "tools/get_video_task.yaml"
+    "tools/get_video_task.py"
     "_assets/icon.svg"
     "requirements.txt"
 )
@@ -25,6 +27,36 @@ for file in "${files[@]}"; do
     fi
 done
 
+# 两个插件共用的 ark 模块必须逐字节一致（修改后需同步复制到另一个插件）
+shared=(
+    "__init__.py"
+    "aio.py"
+    "cache.py"
+    "client.py"
+    "download.py"
+    "endpoints.py"
+    "imaging.py"
+    "payload.py"
+    "ratelimit.py"
+    "relative.py"
+    "retry.py"
+    "schema.py"
+    "singleflight.py"
+    "staging.py"
+    "telemetry.py"
+)
+
+echo ""
+in_sync=true
+for module in "${shared[@]}"; do
+    if cmp -s "ark/$module" "../doubaotoImage/ark/$module"; then
+        echo "✓ ark/$module 与 doubaotoImage 一致"
+    else
+        echo "✗ ark/$module 与 ../doubaotoImage/ark/$module 不一致"
+        in_sync=false
+    fi
+done
+
 echo ""
 if [ "$all_exist" = true ]; then
     echo "✅ 所有核心文件存在"
@@ -34,3 +66,9 @@ if [ "$all_exist" = true ]; then
 else
     echo "❌ 部分文件缺失，请检查"
 fi
+if [ "$in_sync" != true ]; then
+    echo "❌ 共用的 ark 模块与 doubaotoImage 不一致，请同步后再打包"
+fi
+if [ "$all_exist" != true ] || [ "$in_sync" != true ]; then
+    exit 1
+fi
@@ -0,0 +1,150 @@
+"""Process-wide, byte-bounded LRU cache for resolved reference images.
+
+Workflows keep reusing the same uploaded images, so resolved inline images
+(see ``ark.payload.InlineImage``) are cached by file id, source URL or content
+hash. A hit skips both the file manager (or HTTP) round trip and the base64
+encoding. The cache is bounded by the total size of its values and evicts
+least recently used entries first; entries may also expire after a TTL.
+
+Sizing is controlled by environment variables:
+``ARK_IMAGE_CACHE_MB`` (default 64, ``0`` disables caching) and
+``ARK_IMAGE_CACHE_TTL`` in seconds (default 3600, ``0`` means no expiry).
+
+File ids the file manager could not resolve are remembered in
+``missing_files`` for ``ARK_MISSING_FILE_TTL`` seconds (default 300), so a
+workflow re-sending a stale id does not pay for the lookup again. Like cached
+file contents, they are keyed by the Dify instance and user the lookup was
+made for, so a miss on one never hides the file on another.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Optional, TypeVar
+
+from ark.payload import InlineImage
+
+V = TypeVar("V")
+
+
+class ByteLRUCache(Generic[V]):
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None, sizeof: Callable[[V], int] = len):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[V, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: V) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class NegativeCache:
+    """Bounded set of keys that recently resolved to nothing, forgotten after ``ttl`` seconds."""
+
+    def __init__(self, ttl: float, max_entries: int = 4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self.hits = 0
+
+    def add(self, key: str) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = time.monotonic()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            added = self._entries.get(key)
+            if added is None:
+                return False
+            if time.monotonic() - added > self.ttl:
+                del self._entries[key]
+                return False
+            self.hits += 1
+            return True
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits}
+
+
+def content_key(data: bytes) -> str:
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+image_cache: ByteLRUCache[InlineImage] = ByteLRUCache(
+    max_bytes=int(_env_number("ARK_IMAGE_CACHE_MB", 64) * 1024 * 1024),
+    ttl=_env_number("ARK_IMAGE_CACHE_TTL", 3600) or None,
+    # Large entries live in temp files, but the bound still counts their size.
+    sizeof=lambda image: image.uri_length,
+)
+missing_files = NegativeCache(ttl=_env_number("ARK_MISSING_FILE_TTL", 300))
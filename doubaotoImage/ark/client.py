@@ -0,0 +1,336 @@
+"""Pooled, keep-alive HTTP client shared by the Doubao Ark tools.
+
+One ``ArkClient`` is kept per ``(base_url, api_key)`` pair for the lifetime of
+the plugin process, so task creation, status polls and image generation calls
+reuse TCP/TLS connections instead of handshaking on every request. Downloads of
+signed result URLs and Dify file URLs go through a separate unauthenticated
+session so the API key never leaks to storage hosts. Authenticated calls are
+queued through ``ark/ratelimit.py`` per API key and endpoint, retried per
+``ark/retry.py`` and routed across base URLs by ``ark/endpoints.py``.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Optional, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from ark import telemetry
+from ark.endpoints import EndpointPool, parse_base_urls, task_owners
+from ark.payload import JSONBody
+from ark.ratelimit import Governor, rate_limiter, send_governed
+from ark.retry import (
+    REQUEST_ID_HEADER,
+    RetryPolicy,
+    new_request_id,
+    recover_created_task,
+    send_with_retries,
+    task_ledger,
+)
+
+DEFAULT_BASE_URL = "https://ark.cn-beijing.volces.com"
+VIDEO_TASKS_PATH = "/api/v3/contents/generations/tasks"
+IMAGES_PATH = "/api/v3/images/generations"
+
+logger = logging.getLogger(__name__)
+
+Timeout = Union[float, tuple[float, float], None]
+
+
+@dataclass(frozen=True)
+class ClientConfig:
+    pool_connections: int = 4
+    pool_maxsize: int = 16
+    connect_timeout: float = 10.0
+    create_timeout: float = 30.0
+    poll_timeout: float = 10.0
+    image_timeout: float = 120.0
+    download_timeout: float = 30.0
+    rate_limit_rpm: float = 0.0  # generation requests per minute per API key, 0 = unlimited
+    max_concurrency: int = 0  # concurrent requests per API key and endpoint, 0 = pool_maxsize
+    max_retries: int = 3
+    retry_unconfirmed: bool = False  # retry POSTs that may already have been billed (image calls)
+
+    @classmethod
+    def from_credentials(cls, credentials: dict) -> "ClientConfig":
+        defaults = cls()
+        read_timeout = _positive_number(credentials.get("read_timeout"), None)
+        return cls(
+            pool_connections=defaults.pool_connections,
+            pool_maxsize=int(_positive_number(credentials.get("pool_maxsize"), defaults.pool_maxsize)),
+            connect_timeout=_positive_number(credentials.get("connect_timeout"), defaults.connect_timeout),
+            # read_timeout tunes the short task API calls only; image generation takes minutes.
+            create_timeout=read_timeout or defaults.create_timeout,
+            poll_timeout=read_timeout or defaults.poll_timeout,
+            image_timeout=_positive_number(credentials.get("image_timeout"), defaults.image_timeout),
+            download_timeout=defaults.download_timeout,
+            rate_limit_rpm=_positive_number(credentials.get("rate_limit_rpm"), defaults.rate_limit_rpm),
+            max_concurrency=int(_positive_number(credentials.get("max_concurrency"), defaults.max_concurrency)),
+            max_retries=int(_non_negative_number(credentials.get("max_retries"), defaults.max_retries)),
+            retry_unconfirmed=str(credentials.get("retry_image_timeouts")).lower() == "true",
+        )
+
+    def retry_policy(self) -> RetryPolicy:
+        return RetryPolicy(max_retries=self.max_retries, retry_unconfirmed=self.retry_unconfirmed)
+
+
+class ConnectionStats:
+    """Counts requests against freshly opened connections for one session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self) -> None:
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            requests_sent = self.requests
+            opened = self.connections_opened
+        reused = max(requests_sent - opened, 0)
+        return {
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / requests_sent, 4) if requests_sent else 0.0,
+        }
+
+
+def _counting_pool(base: type, stats: ConnectionStats) -> type:
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.record_connection()
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._stats),
+            "https": _counting_pool(HTTPSConnectionPool, self._stats),
+        }
+
+
+class PooledSession:
+    """A ``requests.Session`` with a bounded keep-alive pool and reuse stats."""
+
+    def __init__(self, config: ClientConfig, headers: Optional[dict] = None):
+        self.config = config
+        self.stats = ConnectionStats()
+        self.session = requests.Session()
+        adapter = _CountingAdapter(
+            self.stats,
+            pool_connections=config.pool_connections,
+            pool_maxsize=config.pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def request(self, method: str, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        self.stats.record_request()
+        return self.session.request(method, url, timeout=self._timeout(timeout), **kwargs)
+
+    def get(self, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    def post(self, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return self.request("POST", url, timeout=timeout, **kwargs)
+
+    def _timeout(self, timeout: Timeout) -> tuple[float, float]:
+        # A bare number is the read timeout; the connect timeout comes from config.
+        if isinstance(timeout, tuple):
+            return timeout
+        return self.config.connect_timeout, float(timeout or self.config.download_timeout)
+
+
+class ArkClient(PooledSession):
+    def __init__(self, base_url: str, api_key: Optional[str], config: ClientConfig):
+        super().__init__(
+            config,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {api_key}",
+            },
+        )
+        # One or more comma separated endpoints; requests are routed per call.
+        self.base_url = base_url
+        self.endpoints = EndpointPool(parse_base_urls(base_url, DEFAULT_BASE_URL), config.connect_timeout)
+        # Identifies the account without keeping the raw key around.
+        self.key_digest = hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()
+
+    @property
+    def downloads(self) -> PooledSession:
+        """Session for result URLs; never carries the API key."""
+        return download_session()
+
+    def url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.endpoints.primary}{path}"
+
+    def request(self, method: str, url: str, timeout: Timeout = None, **kwargs) -> requests.Response:
+        return send_api_request(self, method, url, partial(super().request, method, timeout=timeout), **kwargs)
+
+    def rate_limit_stats(self) -> dict:
+        return rate_limiter.snapshot(self.key_digest)
+
+    def post_json(self, url: str, payload: dict, timeout: Timeout = None, **kwargs) -> requests.Response:
+        """POST ``payload`` as a streamed body so inline images are never joined in memory."""
+        return post_json(self, url, payload, timeout=timeout, **kwargs)
+
+
+_clients: dict[tuple, ArkClient] = {}
+_clients_lock = threading.Lock()
+_download_session: Optional[PooledSession] = None
+
+
+def get_client(credentials: dict) -> ArkClient:
+    """Return the process-wide pooled client for these provider credentials."""
+    api_key = credentials.get("ark_api_key")
+    base_url = ",".join(parse_base_urls(credentials.get("base_url"), DEFAULT_BASE_URL))
+    config = ClientConfig.from_credentials(credentials)
+    if credentials.get("http_engine") == "asyncio":
+        get_engine_client = _engine_client_factory()
+        if get_engine_client is not None:
+            return get_engine_client(base_url, api_key, config)
+    key = (base_url, hashlib.sha256(str(api_key).encode("utf-8")).hexdigest(), config)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ArkClient(base_url, api_key, config)
+            _clients[key] = client
+        return client
+
+
+def _engine_client_factory():
+    """``ark.aio.get_engine_client``, or None (warned about once) when httpx cannot load."""
+    with _clients_lock:
+        return _load_engine_client_factory()
+
+
+@lru_cache(maxsize=None)
+def _load_engine_client_factory():
+    try:
+        # Imported lazily: the async engine builds on this module.
+        from ark.aio import get_engine_client
+    except ImportError as error:
+        logger.warning("http_engine asyncio is unavailable (%s); using the requests pool", error)
+        return None
+    return get_engine_client
+
+
+def send_api_request(client, method: str, url: str, send, recover=None, headers: Optional[dict] = None,
+                     **kwargs) -> requests.Response:
+    """Rate limiting, routing and retries around one authenticated call.
+
+    ``send(url, **kwargs)`` performs a single attempt against an absolute URL;
+    every attempt shares one request id.
+    """
+    headers = {**(headers or {}), REQUEST_ID_HEADER: new_request_id()}
+    governor = governor_for(client.key_digest, client.config, method, url)
+    path = urlparse(url).path
+    task_id = path[len(VIDEO_TASKS_PATH) + 1:].split("/")[0] if path.startswith(f"{VIDEO_TASKS_PATH}/") else None
+    route = client.endpoints.route(url, task_id)
+    # Image generation time says nothing about endpoint latency.
+    routed = partial(route.send, lambda target: send(target, headers=headers, **kwargs), path != IMAGES_PATH)
+    lookup = (lambda: recover(route.base)) if recover else None
+    return send_with_retries(partial(send_governed, governor, routed), client.config.retry_policy(), method, lookup)
+
+
+def post_json(client, url: str, payload: dict, timeout: Timeout = None, **kwargs) -> requests.Response:
+    creates_task = url == VIDEO_TASKS_PATH
+    if creates_task:
+        # After an unconfirmed attempt, look the task up instead of creating a second one.
+        kwargs.setdefault("recover", partial(recover_created_task, client, VIDEO_TASKS_PATH, payload, time.time()))
+    body = JSONBody(payload)
+    telemetry.count("bytes_uploaded", len(body))
+    response = client.post(url, data=body, timeout=timeout, **kwargs)
+    if creates_task and response.ok:
+        try:
+            task_id = response.json().get("id")
+        except ValueError:
+            return response
+        task_ledger.claim(task_id)
+        # Status queries for this task must go to the endpoint that created it.
+        task_owners.assign(task_id, response.url[: -len(VIDEO_TASKS_PATH)] if response.url else None)
+    return response
+
+
+def governor_for(key_digest: str, config: ClientConfig, method: str, url: str) -> Governor:
+    """The rate/concurrency governor for one API key and endpoint."""
+    path = urlparse(url).path
+    if path == VIDEO_TASKS_PATH:
+        endpoint = "create_task" if method == "POST" else f"{method} tasks"
+    elif path.startswith(f"{VIDEO_TASKS_PATH}/"):
+        endpoint = "get_task" if method == "GET" else f"{method} task"
+    elif path == IMAGES_PATH:
+        endpoint = "images"
+    else:
+        endpoint = f"{method} {path}"
+    # Quotas are counted on generation requests; queries only share the concurrency cap.
+    rpm = config.rate_limit_rpm if method == "POST" else 0
+    return rate_limiter.governor(key_digest, endpoint, rpm, config.max_concurrency or config.pool_maxsize)
+
+
+def download_session() -> PooledSession:
+    """Return the shared unauthenticated session used for result and file URLs."""
+    global _download_session
+    with _clients_lock:
+        if _download_session is None:
+            _download_session = PooledSession(ClientConfig())
+        return _download_session
+
+
+def metrics_fields(client, **details) -> dict:
+    """Connection, rate-limit and endpoint statistics (plus ``details``) for a result JSON.
+
+    Empty unless the invocation sets ``emit_metrics``.
+    """
+    if not telemetry.emitting_metrics():
+        return {}
+    return {
+        "connection_stats": client.stats.snapshot(),
+        "rate_limits": client.rate_limit_stats(),
+        "endpoints": client.endpoints.snapshot(),
+        **details,
+    }
+
+
+def _non_negative_number(value, default):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if number >= 0 else default
+
+
+def _positive_number(value, default):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if number > 0 else default
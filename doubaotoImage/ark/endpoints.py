@@ -0,0 +1,208 @@
+"""Health-aware routing across several Ark base URLs.
+
+The ``base_url`` credential may list several endpoints (comma or newline
+separated). Each endpoint keeps a process-wide ``EndpointHealth``: an EWMA of
+response latency and of the error rate, fed by every API call plus a one-off
+background probe when a multi-endpoint client is created. New requests go to
+the healthiest endpoint whose circuit is closed; after ``FAILURE_THRESHOLD``
+consecutive failures (transport errors or 5xx) the circuit opens for a
+cooldown that doubles on every repeated trip, then lets trial requests
+through again (half-open).
+
+Video tasks only exist on the endpoint that created them, so ``Route``
+pins status queries to the owning endpoint. Queries for tasks this process
+did not create try each endpoint in health order until one knows the task.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import requests
+
+FAILURE_THRESHOLD = 3
+BASE_COOLDOWN = 30.0
+MAX_COOLDOWN = 300.0
+UNKNOWN_LATENCY = 1.0
+ALPHA = 0.3
+
+
+def parse_base_urls(raw: Optional[str], default: str) -> tuple[str, ...]:
+    urls = [part.strip().rstrip("/") for part in (raw or "").replace("\n", ",").split(",")]
+    urls = [url for url in urls if url]
+    return tuple(dict.fromkeys(urls)) or (default,)
+
+
+class EndpointHealth:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self._open_until = 0.0
+        self._cooldown = BASE_COOLDOWN
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            if latency is not None:
+                self.latency = latency if self.latency is None else self.latency + ALPHA * (latency - self.latency)
+            self.error_rate += ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.consecutive_failures = 0
+                self._cooldown = BASE_COOLDOWN
+                self._open_until = 0.0
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            half_open = self._open_until and time.monotonic() >= self._open_until
+            if half_open or self.consecutive_failures == FAILURE_THRESHOLD:
+                if half_open:
+                    self._cooldown = min(self._cooldown * 2, MAX_COOLDOWN)
+                self._open_until = time.monotonic() + self._cooldown
+                self.trips += 1
+
+    def state(self) -> str:
+        with self._lock:
+            if not self._open_until:
+                return "closed"
+            return "open" if time.monotonic() < self._open_until else "half_open"
+
+    def score(self) -> float:
+        with self._lock:
+            return (self.latency if self.latency is not None else UNKNOWN_LATENCY) * (1 + 4 * self.error_rate)
+
+    def snapshot(self) -> dict:
+        state = self.state()
+        with self._lock:
+            return {
+                "state": state,
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                "requests": self.requests,
+                "failures": self.failures,
+                "trips": self.trips,
+            }
+
+
+class EndpointPool:
+    def __init__(self, base_urls: tuple[str, ...], connect_timeout: float = 10.0):
+        self.base_urls = base_urls
+        self.health = {url: _health_for(url) for url in base_urls}
+        if len(base_urls) > 1:
+            threading.Thread(target=self.probe, args=(connect_timeout,), name="ark-probe", daemon=True).start()
+
+    @property
+    def primary(self) -> str:
+        return self.ranked()[0]
+
+    def ranked(self, exclude: tuple = ()) -> list[str]:
+        """Usable endpoints, healthiest first; configured order breaks ties."""
+        candidates = [url for url in self.base_urls if url not in exclude] or list(self.base_urls)
+        return sorted(
+            candidates,
+            key=lambda url: (
+                self.health[url].state() == "open",
+                self.health[url].score(),
+                self.base_urls.index(url),
+            ),
+        )
+
+    def route(self, url: str, task_id: Optional[str] = None) -> "Route":
+        return Route(self, url, task_id)
+
+    def probe(self, connect_timeout: float) -> None:
+        """Time one unauthenticated round trip to every endpoint."""
+        for url in self.base_urls:
+            started = time.monotonic()
+            try:
+                response = requests.get(url, timeout=(connect_timeout, 5), allow_redirects=False)
+                response.close()
+            except requests.exceptions.RequestException:
+                self.health[url].record(None, ok=False)
+                continue
+            self.health[url].record(time.monotonic() - started, ok=response.status_code < 500)
+
+    def snapshot(self) -> dict:
+        return {url: self.health[url].snapshot() for url in self.base_urls}
+
+
+class Route:
+    """Endpoint choice for one logical call, across its retries."""
+
+    def __init__(self, pool: EndpointPool, url: str, task_id: Optional[str]):
+        self.pool = pool
+        self.task_id = task_id
+        self.fixed = url.startswith(("http://", "https://"))
+        self.path = url
+        self.base: Optional[str] = None
+        self._avoid: set = set()
+
+    def send(self, do: Callable[[str], requests.Response], timed: bool = True) -> requests.Response:
+        """Call ``do(url)`` on the chosen endpoint and record the outcome."""
+        if self.fixed:
+            return do(self.path)
+        while True:
+            owner = task_owners.get(self.task_id) if self.task_id else None
+            self.base = owner if owner in self.pool.health else self.pool.ranked(tuple(self._avoid))[0]
+            health = self.pool.health[self.base]
+            started = time.monotonic()
+            try:
+                response = do(f"{self.base}{self.path}")
+            except requests.exceptions.RequestException:
+                health.record(None, ok=False)
+                # Let the retry fail over unless the task lives here.
+                self._avoid.add(self.base)
+                raise
+            health.record(time.monotonic() - started if timed else None, ok=response.status_code < 500)
+            if response.status_code >= 500:
+                self._avoid.add(self.base)
+            unknown_task = self.task_id and owner is None and response.status_code == 404
+            if unknown_task and len(self._avoid) + 1 < len(self.pool.base_urls):
+                # A task created elsewhere (another process or endpoint): ask the next endpoint.
+                self._avoid.add(self.base)
+                response.close()
+                continue
+            if self.task_id and response.ok:
+                task_owners.assign(self.task_id, self.base)
+            return response
+
+
+class TaskOwners:
+    """Which endpoint created each task, bounded to the most recent ids."""
+
+    def __init__(self, limit: int = 10000):
+        self._lock = threading.Lock()
+        self._owners: OrderedDict[str, str] = OrderedDict()
+        self._limit = limit
+
+    def assign(self, task_id: Optional[str], base_url: Optional[str]) -> None:
+        if not task_id or not base_url:
+            return
+        with self._lock:
+            self._owners[task_id] = base_url
+            self._owners.move_to_end(task_id)
+            while len(self._owners) > self._limit:
+                self._owners.popitem(last=False)
+
+    def get(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            return self._owners.get(task_id)
+
+
+task_owners = TaskOwners()
+_health: dict[str, EndpointHealth] = {}
+_health_lock = threading.Lock()
+
+
+def _health_for(base_url: str) -> EndpointHealth:
+    with _health_lock:
+        health = _health.get(base_url)
+        if health is None:
+            health = _health[base_url] = EndpointHealth(base_url)
+        return health
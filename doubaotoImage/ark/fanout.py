@@ -0,0 +1,76 @@
+"""Bounded-concurrency fan-out of independent image generation calls.
+
+``fan_out`` runs one call per input on a thread pool of at most
+``max_workers`` threads and yields each outcome as soon as it completes, so
+callers can stream images out while slower prompts are still generating.
+Throughput then scales with the concurrency limit rather than the number of
+prompts.
+"""
+
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Generator, NamedTuple, Optional
+
+DEFAULT_CONCURRENCY = 4
+MAX_BATCH_SIZE = 500
+
+
+class FanOutResult(NamedTuple):
+    index: int
+    item: Any
+    value: Any
+    error: Optional[BaseException]
+    seconds: float
+
+
+def parse_prompts(raw) -> list[str]:
+    """Accept a JSON array of prompts or one prompt per line."""
+    if isinstance(raw, list):
+        values = raw
+    elif isinstance(raw, str) and raw.strip().startswith("["):
+        values = json.loads(raw)
+    elif isinstance(raw, str):
+        values = raw.splitlines()
+    else:
+        return []
+    return [str(value).strip() for value in values if str(value).strip()]
+
+
+def fan_out(
+    fn: Callable[[Any], Any], items: list, max_workers: int = DEFAULT_CONCURRENCY
+) -> Generator[FanOutResult, None, None]:
+    """Call ``fn`` for every item; yield results in completion order."""
+    if not items:
+        return
+
+    def timed(item):
+        started = time.monotonic()
+        try:
+            return fn(item), None, time.monotonic() - started
+        except Exception as error:
+            return None, error, time.monotonic() - started
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        # Workers join the caller's trace (see ark/telemetry.py).
+        futures = {pool.submit(contextvars.copy_context().run, timed, item): index for index, item in enumerate(items)}
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                value, error, seconds = future.result()
+                yield FanOutResult(index, items[index], value, error, seconds)
+        finally:
+            # If the consumer stops early, drop calls that have not started yet.
+            for future in futures:
+                future.cancel()
+
+
+def sum_usage(usages: list[Optional[dict]]) -> dict:
+    """Add up the numeric fields of several ``usage`` objects."""
+    totals: dict[str, float] = {}
+    for usage in usages:
+        for key, value in (usage or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+    return totals
@@ -0,0 +1,200 @@
+"""Optional downscale and recompress stage for reference images.
+
+Phone photos are often far larger than the model can use, and every byte is
+inlined into the JSON body as base64. ``preprocess_image`` shrinks images to a
+configured max edge / pixel count (clamped to the target model's input
+limits) and re-encodes them as JPEG or WebP. Decoding and encoding run in a
+small process pool so CPU-heavy work does not stall other invocations.
+
+Pillow is optional: without it images pass through unchanged. The pool size
+is controlled by ``ARK_IMAGE_WORKERS`` (default 2, ``0`` runs inline).
+"""
+
+import io
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+    ImageOps = None
+
+
+class ModelLimits(NamedTuple):
+    min_edge: int
+    max_edge: int
+    max_pixels: int
+
+
+# Input limits from the Seedance / Seedream docs; unknown models (e.g. ep-...
+# access points) get the loosest of them.
+MODEL_LIMITS = {
+    "doubao-seedance": ModelLimits(min_edge=300, max_edge=6000, max_pixels=6000 * 6000),
+    "doubao-seedream": ModelLimits(min_edge=14, max_edge=6000, max_pixels=6000 * 6000),
+}
+DEFAULT_LIMITS = ModelLimits(min_edge=300, max_edge=6000, max_pixels=6000 * 6000)
+
+OUTPUT_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+@dataclass(frozen=True)
+class ImagePolicy:
+    max_edge: int = DEFAULT_LIMITS.max_edge
+    max_pixels: int = DEFAULT_LIMITS.max_pixels
+    min_edge: int = DEFAULT_LIMITS.min_edge
+    output_format: str = "keep"
+    quality: int = 85
+
+    @classmethod
+    def from_parameters(cls, tool_parameters: dict, model: Optional[str]) -> "ImagePolicy":
+        limits = limits_for_model(model)
+        max_edge = _positive_int(tool_parameters.get("image_max_edge"))
+        max_pixels = _positive_int(tool_parameters.get("image_max_pixels"))
+        output_format = str(tool_parameters.get("image_format") or "keep").lower()
+        return cls(
+            max_edge=min(max_edge or limits.max_edge, limits.max_edge),
+            max_pixels=min(max_pixels or limits.max_pixels, limits.max_pixels),
+            min_edge=limits.min_edge,
+            output_format=output_format if output_format in OUTPUT_FORMATS else "keep",
+            quality=min(max(_positive_int(tool_parameters.get("image_quality")) or 85, 1), 100),
+        )
+
+    @property
+    def cache_tag(self) -> str:
+        return f"{self.max_edge}x{self.max_pixels}/{self.output_format}/{self.quality}"
+
+
+class PreprocessResult(NamedTuple):
+    content: bytes
+    mime_type: Optional[str]
+    report: Optional[dict]
+
+
+def limits_for_model(model: Optional[str]) -> ModelLimits:
+    for prefix, limits in MODEL_LIMITS.items():
+        if model and model.startswith(prefix):
+            return limits
+    return DEFAULT_LIMITS
+
+
+def preprocess_image(content: bytes, mime_type: Optional[str], policy: ImagePolicy) -> PreprocessResult:
+    """Return a smaller encoding of ``content`` when the policy calls for one."""
+    if Image is None or not content:
+        return PreprocessResult(content, mime_type, None)
+
+    # Header-only probe in-process; only images that need work go to the pool.
+    try:
+        with Image.open(io.BytesIO(content)) as probe:
+            size = probe.size
+            animated = getattr(probe, "n_frames", 1) > 1
+    except Exception:
+        return PreprocessResult(content, mime_type, None)
+    if animated or not _needs_work(size, policy):
+        return PreprocessResult(content, mime_type, None)
+
+    pool = _process_pool()
+    try:
+        if pool is not None:
+            return pool.submit(_transform, content, mime_type, policy).result()
+    except Exception:
+        # A broken pool (e.g. no fork support) should not fail the invocation.
+        pass
+    try:
+        return _transform(content, mime_type, policy)
+    except Exception:
+        return PreprocessResult(content, mime_type, None)
+
+
+def _needs_work(size: tuple[int, int], policy: ImagePolicy) -> bool:
+    width, height = size
+    return (
+        policy.output_format != "keep"
+        or max(width, height) > policy.max_edge
+        or width * height > policy.max_pixels
+    )
+
+
+def _target_size(size: tuple[int, int], policy: ImagePolicy) -> tuple[int, int]:
+    width, height = size
+    scale = min(1.0, policy.max_edge / max(width, height))
+    scale = min(scale, math.sqrt(policy.max_pixels / (width * height)))
+    # Never shrink below the model's minimum edge length.
+    scale = max(scale, min(1.0, policy.min_edge / min(width, height)))
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def _transform(content: bytes, mime_type: Optional[str], policy: ImagePolicy) -> PreprocessResult:
+    with Image.open(io.BytesIO(content)) as source:
+        image = ImageOps.exif_transpose(source)
+        original_size = image.size
+        target_size = _target_size(original_size, policy)
+        if target_size != original_size:
+            image = image.resize(target_size, Image.Resampling.LANCZOS)
+
+        if policy.output_format in OUTPUT_FORMATS:
+            pil_format, out_mime = OUTPUT_FORMATS[policy.output_format]
+        else:
+            pil_format, out_mime = source.format or "PNG", mime_type
+
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = _flatten(image)
+        buffer = io.BytesIO()
+        save_options = {"optimize": True}
+        if pil_format in ("JPEG", "WEBP"):
+            save_options["quality"] = policy.quality
+        image.save(buffer, format=pil_format, **save_options)
+
+    output = buffer.getvalue()
+    if len(output) >= len(content) and target_size == original_size:
+        # Re-encoding alone did not help; keep the original bytes.
+        return PreprocessResult(content, mime_type, None)
+    return PreprocessResult(
+        output,
+        out_mime,
+        {
+            "original_bytes": len(content),
+            "output_bytes": len(output),
+            "saved_bytes": len(content) - len(output),
+            "original_size": f"{original_size[0]}x{original_size[1]}",
+            "output_size": f"{target_size[0]}x{target_size[1]}",
+            "format": pil_format.lower(),
+        },
+    )
+
+
+def _flatten(image):
+    rgba = image.convert("RGBA")
+    background = Image.new("RGB", rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel("A"))
+    return background
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    try:
+        workers = int(os.getenv("ARK_IMAGE_WORKERS", "2"))
+    except ValueError:
+        workers = 2
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def _positive_int(value) -> int:
+    try:
+        number = int(float(value))
+    except (TypeError, ValueError):
+        return 0
+    return max(number, 0)
@@ -0,0 +1,165 @@
+"""Memory-lean JSON request bodies for payloads with large inline images.
+
+Building a data URI the obvious way keeps several full copies of every image
+alive at once: raw bytes, the base64 bytes, the decoded str, the f-string,
+and finally the serialized JSON body. Instead, ``InlineImage`` base64-encodes
+the raw bytes once, in chunks, into memory (small images) or a temp file, and
+``JSONBody`` streams the request: the JSON skeleton is serialized with
+placeholders and each image is spliced in chunk by chunk while the request is
+being sent. ``JSONBody`` knows its exact length, so requests still sends a
+``Content-Length`` header rather than chunked transfer encoding.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+import weakref
+from typing import Any, Generator, Optional
+
+# Raw bytes per encode step; a multiple of 3 so chunk encodings concatenate.
+ENCODE_CHUNK_SIZE = 48 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+# Encoded images up to this size stay in memory; larger ones go to disk.
+MEMORY_THRESHOLD = 256 * 1024
+
+
+class InlineImage:
+    """A base64-encoded image that is emitted as a data URI on demand."""
+
+    def __init__(self, mime_type: str, digest: str, size: int,
+                 buffer: Optional[bytes] = None, path: Optional[str] = None, raw_size: Optional[int] = None):
+        self.mime_type = mime_type
+        self.digest = digest
+        self.size = size
+        self.raw_size = raw_size
+        self._buffer = buffer
+        self._path = path
+        if path is not None:
+            # Cached entries are shared; the file goes away with the last reference.
+            weakref.finalize(self, _unlink, path)
+
+    @classmethod
+    def from_bytes(cls, content: bytes, mime_type: str) -> "InlineImage":
+        digest = hashlib.sha256(content).hexdigest()
+        encoded_size = 4 * ((len(content) + 2) // 3)
+        view = memoryview(content)
+        if encoded_size <= MEMORY_THRESHOLD:
+            return cls(mime_type, digest, encoded_size, buffer=base64.b64encode(content), raw_size=len(content))
+
+        handle = tempfile.NamedTemporaryFile(prefix="ark-inline-", suffix=".b64", delete=False)
+        with handle:
+            for start in range(0, len(view), ENCODE_CHUNK_SIZE):
+                handle.write(base64.b64encode(view[start:start + ENCODE_CHUNK_SIZE]))
+        return cls(mime_type, digest, encoded_size, path=handle.name, raw_size=len(content))
+
+    @property
+    def prefix(self) -> bytes:
+        return f"data:{self.mime_type};base64,".encode("ascii")
+
+    @property
+    def uri_length(self) -> int:
+        return len(self.prefix) + self.size
+
+    def iter_data_uri(self, chunk_size: int = STREAM_CHUNK_SIZE) -> Generator[bytes, None, None]:
+        yield self.prefix
+        if self._buffer is not None:
+            for start in range(0, len(self._buffer), chunk_size):
+                yield self._buffer[start:start + chunk_size]
+            return
+        with open(self._path, "rb") as handle:
+            while chunk := handle.read(chunk_size):
+                yield chunk
+
+    def iter_bytes(self, chunk_size: int = STREAM_CHUNK_SIZE) -> Generator[bytes, None, None]:
+        """Decode the image back to raw bytes, chunk by chunk (for uploads)."""
+        # Whole base64 quanta per step, so each chunk decodes on its own.
+        chunk_size -= chunk_size % 4
+        encoded = self.iter_data_uri(chunk_size)
+        next(encoded)
+        for chunk in encoded:
+            yield base64.b64decode(chunk)
+
+    @property
+    def data_uri(self) -> str:
+        """Materialize the full data URI; avoid on hot paths."""
+        return b"".join(self.iter_data_uri()).decode("ascii")
+
+    def __str__(self) -> str:
+        return self.data_uri
+
+    def __repr__(self) -> str:
+        return f"InlineImage({self.mime_type}, sha256={self.digest[:12]}, {self.size} bytes)"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, InlineImage) and (self.digest, self.mime_type) == (other.digest, other.mime_type)
+
+    def __hash__(self) -> int:
+        return hash((self.digest, self.mime_type))
+
+
+class JSONBody:
+    """Re-iterable, length-aware JSON body that streams ``InlineImage`` values."""
+
+    def __init__(self, payload: Any):
+        images: dict[str, InlineImage] = {}
+        skeleton = _substitute(payload, images)
+        text = json.dumps(skeleton, ensure_ascii=False)
+        self._parts: list[Any] = []
+        for piece in _split_on_tokens(text, images):
+            self._parts.append(images[piece] if piece in images else piece.encode("utf-8"))
+
+    def __len__(self) -> int:
+        return sum(part.uri_length if isinstance(part, InlineImage) else len(part) for part in self._parts)
+
+    def __iter__(self):
+        for part in self._parts:
+            if isinstance(part, InlineImage):
+                yield from part.iter_data_uri()
+            elif part:
+                yield part
+
+
+def json_default(value: Any) -> Any:
+    """``json.dumps`` fallback that identifies inline images by content hash."""
+    if isinstance(value, InlineImage):
+        return f"inline:{value.mime_type}:{value.digest}"
+    return str(value)
+
+
+def _substitute(value: Any, images: dict[str, InlineImage]) -> Any:
+    if isinstance(value, InlineImage):
+        token = f"__ark_inline_{uuid.uuid4().hex}__"
+        images[token] = value
+        return token
+    if isinstance(value, dict):
+        return {key: _substitute(item, images) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_substitute(item, images) for item in value]
+    return value
+
+
+def _split_on_tokens(text: str, images: dict[str, InlineImage]) -> list[str]:
+    # Tokens serialize as plain ASCII strings, so they appear verbatim between quotes.
+    pieces = [text]
+    for token in images:
+        next_pieces = []
+        for piece in pieces:
+            if piece in images:
+                next_pieces.append(piece)
+                continue
+            head, sep, tail = piece.partition(token)
+            next_pieces.append(head)
+            if sep:
+                next_pieces.extend([token, tail])
+        pieces = next_pieces
+    return pieces
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,235 @@
+"""Process-wide rate limiting and concurrency governing per API key and endpoint.
+
+Every authenticated Ark call passes through a ``Governor`` keyed by the API
+key digest and the endpoint (task creation, task queries, image generation).
+A governor combines a token bucket (requests per minute, generation endpoints
+only), a cap on concurrent requests and a strict FIFO queue, so bursts wait
+their turn instead of failing. A 429 (or a 503 carrying ``Retry-After``)
+pauses the whole governor for the advertised time, or an exponential backoff
+when the header is missing, and the throttled caller retries from the front
+of the queue. Queue depth, wait times and throttling counts are exposed via
+``rate_limiter.snapshot``.
+
+Tuning via environment variables:
+
+- ``ARK_RATE_LIMIT_RETRIES``: retries of a throttled request (default ``5``)
+- ``ARK_RATE_LIMIT_MAX_WAIT``: longest time a caller may queue, in seconds (default ``300``)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterator, Optional
+
+import requests
+
+from ark import telemetry
+
+THROTTLE_STATUSES = (429, 503)
+MAX_BACKOFF = 30.0
+MAX_RETRY_AFTER = 120.0
+
+
+class QueueTimeout(requests.exceptions.Timeout):
+    """Raised when a request waited longer than the queue allows for its turn."""
+
+
+class Governor:
+    def __init__(self, endpoint: str, rpm: float = 0.0, concurrency: int = 16):
+        self.endpoint = endpoint
+        self._condition = threading.Condition()
+        self._queue: deque = deque()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._backoff = 1.0
+        self._acquired = 0
+        self._waited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._throttled = 0
+        self.configure(rpm, concurrency)
+
+    def configure(self, rpm: float, concurrency: int) -> None:
+        with self._condition:
+            self.rpm = max(float(rpm or 0), 0.0)
+            self.concurrency = max(int(concurrency or 1), 1)
+            # Allow roughly six seconds' worth of requests as a burst.
+            self._capacity = max(self.rpm / 10, 1.0)
+            self._tokens = self._capacity
+            self._refilled_at = time.monotonic()
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, max_wait: Optional[float] = None, front: bool = False) -> Iterator[float]:
+        """Hold one request slot; yields how long the caller queued for it."""
+        waited = self._acquire(max_wait, front)
+        try:
+            yield waited
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def throttle(self, retry_after: Optional[float]) -> float:
+        """Pause every caller after a throttling response; returns the pause length."""
+        with self._condition:
+            if retry_after is None:
+                delay = self._backoff
+                self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+            else:
+                delay = min(retry_after, MAX_RETRY_AFTER)
+            self._throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._condition.notify_all()
+            return delay
+
+    def recovered(self) -> None:
+        with self._condition:
+            self._backoff = 1.0
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            return {
+                "endpoint": self.endpoint,
+                "rpm": self.rpm or None,
+                "max_concurrency": self.concurrency,
+                "queue_depth": len(self._queue),
+                "in_flight": self._in_flight,
+                "requests": self._acquired,
+                "queued": self._waited,
+                "wait_avg_ms": round(self._wait_total / self._acquired * 1000, 1) if self._acquired else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 1),
+                "throttled": self._throttled,
+                "paused_for_s": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+            }
+
+    def _acquire(self, max_wait: Optional[float], front: bool) -> float:
+        ticket = object()
+        started = time.monotonic()
+        deadline = started + max_wait if max_wait else None
+        with self._condition:
+            if front:
+                self._queue.appendleft(ticket)
+            else:
+                self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay(ticket, now)
+                    if delay == 0:
+                        break
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise QueueTimeout(
+                                f"Waited {now - started:.0f}s for a {self.endpoint} request slot"
+                            )
+                        delay = deadline - now if delay is None else min(delay, deadline - now)
+                    self._condition.wait(delay)
+            except BaseException:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+                raise
+
+            self._queue.popleft()
+            self._in_flight += 1
+            if self.rpm:
+                self._tokens -= 1
+            waited = time.monotonic() - started
+            self._acquired += 1
+            if waited >= 0.001:
+                self._waited += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            # The next caller in line may be able to go as well.
+            self._condition.notify_all()
+            return waited
+
+    def _delay(self, ticket: object, now: float) -> Optional[float]:
+        """0 when ``ticket`` may go now, else seconds to wait (``None``: until notified)."""
+        if self._queue[0] is not ticket or self._in_flight >= self.concurrency:
+            return None
+        if now < self._paused_until:
+            return self._paused_until - now
+        if not self.rpm:
+            return 0
+        rate = self.rpm / 60
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / rate
+
+
+class RateLimiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._governors: dict[tuple[str, str], Governor] = {}
+
+    def governor(self, key_digest: str, endpoint: str, rpm: float, concurrency: int) -> Governor:
+        with self._lock:
+            governor = self._governors.get((key_digest, endpoint))
+            if governor is None:
+                governor = Governor(endpoint, rpm, concurrency)
+                self._governors[(key_digest, endpoint)] = governor
+        if (governor.rpm, governor.concurrency) != (max(float(rpm or 0), 0.0), max(int(concurrency or 1), 1)):
+            governor.configure(rpm, concurrency)
+        return governor
+
+    def snapshot(self, key_digest: str) -> dict:
+        with self._lock:
+            governors = [g for (digest, _), g in self._governors.items() if digest == key_digest]
+        return {governor.endpoint: governor.snapshot() for governor in governors}
+
+
+def send_governed(governor: Governor, send: Callable[[], requests.Response]) -> requests.Response:
+    """Run ``send`` inside a governor slot, retrying throttled responses after the advertised pause."""
+    retries = _env_number("ARK_RATE_LIMIT_RETRIES", 5)
+    max_wait = _env_number("ARK_RATE_LIMIT_MAX_WAIT", 300)
+    attempt = 0
+    while True:
+        with governor.slot(max_wait, front=attempt > 0):
+            response = send()
+        if not _throttled(response):
+            governor.recovered()
+            return response
+        governor.throttle(retry_after(response))
+        telemetry.count("throttled")
+        if attempt >= retries:
+            return response
+        attempt += 1
+        response.close()
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds from a ``Retry-After`` header (delta-seconds or HTTP date), if any."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _throttled(response: requests.Response) -> bool:
+    if response.status_code == 429:
+        return True
+    # A 503 is only retried when the server says when to come back.
+    return response.status_code in THROTTLE_STATUSES and "Retry-After" in response.headers
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+rate_limiter = RateLimiter()
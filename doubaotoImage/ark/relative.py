@@ -0,0 +1,124 @@
+"""Fetch relative Dify file URLs against the first base URL that works.
+
+File variables sometimes carry a path such as ``/files/...`` instead of an
+absolute URL. The API base it belongs to comes from one of ``BASE_URL_ENV``;
+deployments usually set several, and only some of them are reachable from
+the plugin process. Instead of trying them one after another, each with its
+own timeout, ``RelativeUrlResolver.fetch`` races every candidate and returns
+the first successful response.
+
+The winning base is remembered for the life of the process, so later fetches
+go straight to it (the others are still raced when it returns an error), and
+it is forgotten once it stops being reachable. Bases that could not be
+reached (connection errors and timeouts) are skipped for
+``ARK_UNREACHABLE_BASE_TTL`` seconds (default 300), unless no other base is
+left to try.
+"""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+import requests
+
+from ark.cache import NegativeCache
+
+BASE_URL_ENV = ("DIFY_INNER_API_URL", "DIFY_API_URL", "DIFY_BASE_URL", "CONSOLE_API_URL")
+
+
+def configured_bases() -> list[str]:
+    """Candidate bases in ``BASE_URL_ENV`` order, without duplicates."""
+    bases = []
+    for env_key in BASE_URL_ENV:
+        base = os.getenv(env_key)
+        if isinstance(base, str) and base.strip():
+            bases.append(base.strip().rstrip("/"))
+    return list(dict.fromkeys(bases))
+
+
+class RelativeUrlResolver:
+    def __init__(self, unreachable_ttl: float):
+        self.unreachable = NegativeCache(ttl=unreachable_ttl)
+        self._lock = threading.Lock()
+        self._winner: Optional[str] = None
+
+    @property
+    def winner(self) -> Optional[str]:
+        with self._lock:
+            return self._winner
+
+    def fetch(
+        self, path: str, get: Callable[[str], requests.Response], bases: Optional[list[str]] = None
+    ) -> Optional[requests.Response]:
+        """Return ``get(base + path)`` for the first base that succeeds, or None.
+
+        ``get`` must raise for an unusable response (for example through
+        ``raise_for_status``).
+        """
+        bases = configured_bases() if bases is None else bases
+        if not bases:
+            return None
+
+        winner = self.winner
+        if winner in bases:
+            try:
+                return get(f"{winner}{path}")
+            except Exception as error:
+                self._failed(winner, error)
+            bases = [base for base in bases if base != winner]
+
+        candidates = [base for base in bases if base not in self.unreachable] or bases
+        return self._race(path, get, candidates)
+
+    def _race(
+        self, path: str, get: Callable[[str], requests.Response], bases: list[str]
+    ) -> Optional[requests.Response]:
+        if not bases:
+            return None
+        pool = ThreadPoolExecutor(max_workers=len(bases), thread_name_prefix="ark-relative")
+        try:
+            # Each worker runs in a copy of the caller's context so it records into the same trace.
+            pending = {
+                pool.submit(contextvars.copy_context().run, get, f"{base}{path}"): base for base in bases
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    base = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as error:
+                        self._failed(base, error)
+                        continue
+                    with self._lock:
+                        self._winner = base
+                    self.unreachable.discard(base)
+                    return response
+            return None
+        finally:
+            # Losers still in flight finish in the background; nobody waits for them.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _failed(self, base: str, error: Exception) -> None:
+        # An HTTP error only means this file is not there; the base itself answered.
+        if not isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return
+        with self._lock:
+            if self._winner == base:
+                self._winner = None
+        self.unreachable.add(base)
+
+    def stats(self) -> dict:
+        return {"winner": self.winner, "unreachable": self.unreachable.stats()}
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+relative_urls = RelativeUrlResolver(unreachable_ttl=_env_number("ARK_UNREACHABLE_BASE_TTL", 300))
@@ -0,0 +1,143 @@
+"""Turn generated images into tool messages and a compact JSON summary.
+
+Ark returns each image either as a short-lived ``url`` or, with
+``response_format: b64_json``, as the base64-encoded file itself.
+``image_messages`` emits a URL as an image message and decodes base64 straight
+into a blob message, so nothing has to be downloaded again. ``summarize``
+keeps only the metadata for the JSON result: the base64 text is replaced by
+its decoded size unless ``include_base64`` is set, so megabytes of base64 do
+not go through the plugin message channel a second time.
+
+Ark's signed URLs expire after a while, and downstream nodes fetch them one
+at a time. Given a client, ``image_messages`` instead downloads every URL image on a
+bounded pool, streaming each into a spooled file, and attaches it as a blob as
+soon as it lands, so a multi-image result takes about as long as its slowest
+download.
+"""
+
+import base64
+import binascii
+import mimetypes
+from functools import partial
+from typing import Generator, Optional
+
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from ark.client import ArkClient
+from ark.download import DEFAULT_MAX_BYTES, SpooledDownload, blob_chunk_messages, download_to_spool
+from ark.fanout import fan_out
+from ark.telemetry import count, span
+
+MAX_DOWNLOAD_WORKERS = 8
+
+# Magic numbers of the formats Ark can return.
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"RIFF", "image/webp", ".webp"),
+)
+
+
+def sniff_image_type(content: bytes) -> tuple[str, str]:
+    """Mime type and file extension of ``content``; JPEG when unrecognized."""
+    for signature, mime_type, extension in SIGNATURES:
+        if content.startswith(signature):
+            return mime_type, extension
+    return "image/jpeg", ".jpg"
+
+
+def decode_image(image: dict) -> Optional[bytes]:
+    encoded = image.get("b64_json")
+    if not isinstance(encoded, str) or not encoded:
+        return None
+    try:
+        with span("decode"):
+            return base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def image_messages(
+    tool, images: list[dict], label: str = "generated_image", start: int = 1, client: Optional[ArkClient] = None
+) -> Generator[ToolInvokeMessage, None, Optional[list[dict]]]:
+    """One message per image: the URL as an image message, base64 decoded into a blob.
+
+    With ``client``, URL images are downloaded and attached as blobs instead,
+    and the per-image download timings are returned. Blob file names are
+    numbered from ``start``.
+    """
+    if client is not None:
+        return (yield from _attached_messages(tool, client, images, label, start))
+    for number, image in enumerate(images, start):
+        if image.get("url"):
+            yield tool.create_image_message(image["url"])
+            continue
+        content = decode_image(image)
+        if content is None:
+            continue
+        count("bytes_decoded", len(content))
+        mime_type, extension = sniff_image_type(content)
+        yield tool.create_blob_message(
+            content, meta={"mime_type": mime_type, "filename": f"{label}_{number}{extension}"}
+        )
+    return None
+
+
+def summarize(images: list[dict], include_base64: bool = False) -> list[dict]:
+    """Per-image metadata for the JSON result, without base64 unless asked for."""
+    if include_base64:
+        return images
+    summary = []
+    for image in images:
+        entry = {key: value for key, value in image.items() if key != "b64_json"}
+        encoded = image.get("b64_json")
+        if isinstance(encoded, str) and encoded:
+            entry["bytes"] = len(encoded) * 3 // 4 - encoded[-2:].count("=")
+        summary.append(entry)
+    return summary
+
+
+def _attached_messages(
+    tool, client: ArkClient, images: list[dict], label: str, start: int, max_bytes: int = DEFAULT_MAX_BYTES
+) -> Generator[ToolInvokeMessage, None, list[dict]]:
+    # An image that cannot be downloaded is returned as its URL instead.
+    numbered = list(enumerate(images, start))
+    for number, image in numbered:
+        if not image.get("url"):
+            yield from image_messages(tool, [image], label, start=number)
+
+    jobs = [(number, image["url"]) for number, image in numbered if image.get("url")]
+    workers = min(MAX_DOWNLOAD_WORKERS, client.config.pool_maxsize)
+    downloads = []
+    for outcome in fan_out(partial(_download, client, max_bytes), jobs, workers):
+        number, url = outcome.item
+        timing = {"image": number, "seconds": round(outcome.seconds, 3)}
+        if outcome.error is not None:
+            downloads.append({**timing, "error": str(outcome.error)})
+            yield tool.create_text_message(f"Could not attach image {number} ({str(outcome.error)}), returning its URL")
+            yield tool.create_image_message(url)
+            continue
+        with outcome.value as download:
+            mime_type, extension = _download_type(download)
+            downloads.append({**timing, "bytes": download.size, "mime_type": mime_type})
+            yield from blob_chunk_messages(
+                download, {"mime_type": mime_type, "filename": f"{label}_{number}{extension}"}
+            )
+    return sorted(downloads, key=lambda timing: timing["image"])
+
+
+def _download(client: ArkClient, max_bytes: int, job: tuple[int, str]) -> SpooledDownload:
+    with span("download"):
+        return download_to_spool(client.downloads, job[1], max_bytes=max_bytes, timeout=client.config.download_timeout)
+
+
+def _download_type(download: SpooledDownload) -> tuple[str, str]:
+    """Mime type from the response header, or from the file's magic number when it is not an image type."""
+    mime_type = (download.mime_type or "").split(";", 1)[0].strip().lower()
+    if mime_type.startswith("image/"):
+        for _, known_type, extension in SIGNATURES:
+            if known_type == mime_type:
+                return mime_type, extension
+        return mime_type, mimetypes.guess_extension(mime_type) or ".bin"
+    download.file.seek(0)
+    return sniff_image_type(download.file.read(16))
@@ -0,0 +1,320 @@
+"""Retries for Ark API calls that never create duplicate billed work.
+
+Failures are sorted by whether the request could have reached Ark:
+
+- *Not sent* (DNS failure, refused connection, connect timeout) and server
+  errors Ark answered explicitly (500, 502, 503) are always retried.
+- *Unconfirmed* (read timeout, connection dropped mid-request, 504): a GET is
+  simply retried. A POST that creates a video task is only retried after two
+  post-timeout lookups of recent tasks, a short delay apart (the task list can
+  lag behind creation), find nothing it could have created. A task is only
+  adopted when it is the single recent task with the same model, prompt and
+  settings that no plugin process on this host has claimed; when the lookup
+  cannot tell (several candidates, a candidate whose prompt Ark does not echo,
+  or a failed lookup) the call fails instead of risking a duplicate or someone
+  else's task. Other POSTs (image generation) are only retried when
+  ``retry_unconfirmed`` is enabled, because Ark cannot tell us whether the
+  first attempt was billed.
+
+Every attempt of one logical call carries the same ``X-Client-Request-Id``
+so retries can be correlated with Ark's logs. Delays back off exponentially
+with jitter; throttling (429) is handled separately by ``ark/ratelimit.py``.
+"""
+
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from ark import telemetry
+
+REQUEST_ID_HEADER = "X-Client-Request-Id"
+RETRY_STATUSES = (500, 502, 503)
+UNCONFIRMED_STATUSES = (504,)
+# Allowance for clock skew between this host and Ark when matching task creation times.
+CLOCK_SKEW = 120
+# Fields Ark echoes on the task object that must match the payload we sent.
+ECHOED_FIELDS = ("ratio", "duration", "generate_audio", "draft", "resolution", "seed")
+# Claimed task ids older than this are pruned from the shared ledger directory.
+LEDGER_MAX_AGE = 86400
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 20.0
+    jitter: float = 0.2
+    retry_unconfirmed: bool = False
+    # Wait before the second post-timeout lookup, for tasks the list does not show yet.
+    lookup_settle: float = 2.0
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.base_delay * 2 ** attempt, self.max_delay)
+        return max(delay + random.uniform(-delay * self.jitter, delay * self.jitter), 0.0)
+
+
+class TaskLedger:
+    """Ids of tasks known to have been created by a request, so a lookup never adopts them.
+
+    With a ``directory``, every claim is also a marker file created with
+    ``O_EXCL``, so claims are shared (and atomic) across the plugin processes
+    on this host; without one, or when the directory is not writable, only
+    this process's claims are known.
+    """
+
+    def __init__(self, directory: Optional[str] = None, limit: int = 10000, max_age: float = LEDGER_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._ids: dict[str, None] = {}
+        self._limit = limit
+        self._claims = 0
+
+    def claim(self, task_id: str) -> bool:
+        with self._lock:
+            if task_id in self._ids:
+                return False
+            self._remember(task_id)
+        return self._claim_file(task_id)
+
+    def known(self, task_id: str) -> bool:
+        with self._lock:
+            if task_id in self._ids:
+                return True
+        return self.directory is not None and os.path.exists(self._path(task_id))
+
+    def _remember(self, task_id: str) -> None:
+        self._ids[task_id] = None
+        if len(self._ids) > self._limit:
+            self._ids.pop(next(iter(self._ids)))
+
+    def _claim_file(self, task_id: str) -> bool:
+        if self.directory is None:
+            return True
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            os.close(os.open(self._path(task_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+        except FileExistsError:
+            return False
+        except OSError:
+            # Not shareable here; the in-memory claim still holds for this process.
+            return True
+        self._claims += 1
+        if self._claims % 1000 == 1:
+            self._prune()
+        return True
+
+    def _path(self, task_id: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", str(task_id)))
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.max_age
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+def _ledger_directory() -> Optional[str]:
+    directory = os.getenv("ARK_TASK_LEDGER_DIR")
+    if directory is None:
+        return os.path.join(tempfile.gettempdir(), "ark-task-ledger")
+    return directory or None
+
+
+task_ledger = TaskLedger(_ledger_directory())
+
+
+class UnconfirmedRequest(requests.exceptions.RequestException):
+    """A POST failed in a way that may or may not have created billed work."""
+
+
+class NotSent(requests.exceptions.ConnectionError):
+    """The connection failed before any of the request was sent."""
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def send_with_retries(
+    send: Callable[[], requests.Response],
+    policy: RetryPolicy,
+    method: str,
+    recover: Optional[Callable[[], Optional[requests.Response]]] = None,
+) -> requests.Response:
+    """Call ``send`` until it succeeds, fails permanently or runs out of retries.
+
+    ``recover`` is the post-timeout lookup for a creating POST: it returns the
+    response of the work that was created, ``None`` when it confirmed nothing
+    was created, and raises when it cannot tell.
+    """
+    attempt = 0
+    while True:
+        error: Optional[requests.exceptions.RequestException] = None
+        response = None
+        try:
+            response = send()
+        except requests.exceptions.RequestException as caught:
+            error = caught
+
+        if response is not None:
+            if response.status_code in RETRY_STATUSES:
+                outcome = "retry"
+            elif response.status_code in UNCONFIRMED_STATUSES:
+                outcome = "unconfirmed"
+            else:
+                return response
+        elif not _was_sent(error):
+            outcome = "retry"
+        elif isinstance(error, (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError)):
+            outcome = "unconfirmed"
+        else:
+            raise error
+
+        looked_up = False
+        if outcome == "unconfirmed" and method != "GET":
+            if recover is None and not policy.retry_unconfirmed:
+                return _give_up(error, response)
+            if recover is not None:
+                time.sleep(policy.delay(attempt))
+                recovered = _look_up(recover, error, response)
+                if recovered is None:
+                    # The task list can lag behind creation: look once more before sending again.
+                    time.sleep(policy.lookup_settle)
+                    recovered = _look_up(recover, error, response)
+                if recovered is not None:
+                    if response is not None:
+                        response.close()
+                    return recovered
+                looked_up = True
+
+        if attempt >= policy.max_retries:
+            return _give_up(error, response)
+        if response is not None:
+            response.close()
+        if not looked_up:
+            time.sleep(policy.delay(attempt))
+        attempt += 1
+        telemetry.count("retries")
+
+
+def recover_created_task(
+    client, path: str, payload: dict, since: float, base_url: Optional[str] = None
+) -> Optional[requests.Response]:
+    """Find the task an unconfirmed create call made, via the task list endpoint.
+
+    ``base_url`` is the endpoint the unconfirmed attempt went to; the lookup
+    must ask the same one.
+
+    Candidates are recent tasks with the same model and settings that no
+    request on this host has claimed. Returns a synthetic response for the
+    single candidate whose prompt matches, ``None`` when there is no candidate,
+    and raises ``UnconfirmedRequest`` when it cannot tell: several matches, a
+    candidate without an echoed prompt, or a match another request claimed
+    first.
+    """
+    url = f"{base_url}{path}" if base_url else path
+    response = client.get(url, params={"page_num": 1, "page_size": 50}, timeout=client.config.poll_timeout)
+    response.raise_for_status()
+    text = _content_text(payload.get("content"))
+    matches, unverified = [], []
+    for task in response.json().get("items") or []:
+        if (
+            (task.get("created_at") or 0) < since - CLOCK_SKEW
+            or not _same_model(task, payload)
+            or not all(_echoed(task, payload, key) for key in ECHOED_FIELDS)
+            or task_ledger.known(task.get("id"))
+        ):
+            continue
+        task_text = _content_text(task.get("content"))
+        if task_text is None:
+            unverified.append(task)
+        elif task_text == text:
+            matches.append(task)
+    if not matches and not unverified:
+        return None
+    if len(matches) != 1 or unverified:
+        raise UnconfirmedRequest(
+            f"{len(matches) + len(unverified)} recent task(s) could belong to the timed-out request"
+        )
+    task_id = matches[0]["id"]
+    if not task_ledger.claim(task_id):
+        raise UnconfirmedRequest(f"task {task_id} matching the timed-out request was claimed by another request")
+    recovered = requests.Response()
+    recovered.status_code = 200
+    recovered.headers["Content-Type"] = "application/json"
+    recovered._content = json.dumps({"id": task_id}).encode("utf-8")
+    recovered._content_consumed = True
+    recovered.url = url
+    return recovered
+
+
+def _look_up(
+    recover: Callable[[], Optional[requests.Response]],
+    error: Optional[Exception],
+    response: Optional[requests.Response],
+) -> Optional[requests.Response]:
+    try:
+        return recover()
+    except requests.exceptions.RequestException as lookup_error:
+        if isinstance(lookup_error, UnconfirmedRequest):
+            reason = str(lookup_error)
+        else:
+            reason = f"the task lookup failed ({lookup_error})"
+        raise UnconfirmedRequest(
+            f"Request outcome unknown ({error or response.status_code}) and {reason}; "
+            f"not retrying to avoid a duplicate task"
+        ) from error
+
+
+def _give_up(error: Optional[Exception], response: Optional[requests.Response]) -> requests.Response:
+    if error is not None:
+        raise error
+    return response
+
+
+def _echoed(task: dict, payload: dict, key: str) -> bool:
+    if key not in payload or key not in task or payload[key] in ("adaptive", -1):
+        # Unset, or resolved by Ark (adaptive ratio, random seed): nothing to compare.
+        return True
+    return task[key] == payload[key]
+
+
+def _same_model(task: dict, payload: dict) -> bool:
+    model, echoed = payload.get("model"), task.get("model")
+    # An endpoint id (ep-...) is echoed as the model behind it, so it cannot be compared.
+    if not model or not echoed or str(model).startswith("ep-"):
+        return True
+    return echoed == model
+
+
+def _content_text(content) -> Optional[str]:
+    """The prompt of a request's (or an echoed task's) content list; None when there is none."""
+    if not isinstance(content, list):
+        return None
+    texts = [item.get("text") for item in content if isinstance(item, dict) and item.get("type") == "text"]
+    return "\n".join(text for text in texts if isinstance(text, str)) if texts else None
+
+
+def _was_sent(error: requests.exceptions.RequestException) -> bool:
+    """False when the request provably never left this host."""
+    if isinstance(error, (requests.exceptions.ConnectTimeout, NotSent)):
+        return False
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], "reason", error.args[0])
+        return not isinstance(reason, NewConnectionError)
+    return True
@@ -0,0 +1,42 @@
+"""File parameters declared in a tool's YAML, and a cheap file id check.
+
+Reference image resolution only looks at parameters the tool declares with
+``type: file`` or ``type: files`` (plus the legacy variable names each tool
+lists explicitly), instead of probing every parameter that is not on a skip
+list. Strings are checked against the id format Dify uses (a UUID) before any
+file manager round trip.
+"""
+
+import functools
+import os
+import re
+
+import yaml
+
+FILE_TYPES = ("file", "files")
+FILE_ID_PATTERN = re.compile(r"^[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}$", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=None)
+def declared_file_parameters(tool_module_file: str) -> tuple[str, ...]:
+    """Names of the file-typed parameters in the YAML next to ``tool_module_file``."""
+    path = f"{os.path.splitext(tool_module_file)[0]}.yaml"
+    try:
+        with open(path, encoding="utf-8") as file:
+            spec = yaml.safe_load(file) or {}
+    except (OSError, yaml.YAMLError):
+        return ()
+    return tuple(
+        parameter["name"]
+        for parameter in spec.get("parameters") or []
+        if isinstance(parameter, dict) and parameter.get("type") in FILE_TYPES and parameter.get("name")
+    )
+
+
+def file_parameters(tool_module_file: str, legacy: tuple[str, ...] = ()) -> tuple[str, ...]:
+    """``legacy`` names first, in order, then the declared file parameters not already listed."""
+    return tuple(dict.fromkeys((*legacy, *declared_file_parameters(tool_module_file))))
+
+
+def looks_like_file_id(value: str) -> bool:
+    return bool(FILE_ID_PATTERN.match(value.strip()))
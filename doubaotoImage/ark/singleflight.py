@@ -0,0 +1,94 @@
+"""In-flight coalescing of identical Ark generation requests.
+
+When several workflow runs submit the same normalized payload at the same
+time, only the first (the leader) talks to Ark; the others attach to its
+``Flight`` and receive the same result once it settles. Nothing is cached
+after the flight completes, so later identical requests generate anew.
+
+Followers wait for as long as the leader takes: its rate-limit queueing and
+retries have their own limits, and ``finish`` settles a flight whose leader
+gave up, so a flight always settles.
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Optional
+
+from ark.payload import json_default
+
+
+class Flight:
+    def __init__(self):
+        self._done = threading.Event()
+        self._value: Any = None
+        self._error: Optional[BaseException] = None
+        self.waiters = 0
+
+    def resolve(self, value: Any) -> None:
+        self._value = value
+        self._done.set()
+
+    def reject(self, error: BaseException) -> None:
+        self._error = error
+        self._done.set()
+
+    @property
+    def settled(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        if not self._done.wait(timeout):
+            raise TimeoutError("timed out waiting for the in-flight request")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[str, Flight] = {}
+
+    def begin(self, key: str) -> tuple[Flight, bool]:
+        """Return the flight for ``key`` and whether the caller leads it."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            return flight, True
+
+    def finish(self, key: str, flight: Flight) -> None:
+        """Detach a settled (or abandoned) flight so new calls start fresh."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if not flight.settled:
+            flight.reject(RuntimeError("the in-flight request was abandoned"))
+
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """Run ``fn`` once per concurrent ``key``; return ``(result, shared)``."""
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait(), True
+        try:
+            flight.resolve(fn())
+        except BaseException as error:
+            flight.reject(error)
+            raise
+        finally:
+            self.finish(key, flight)
+        return flight.wait(), False
+
+
+def request_key(scope: str, payload: dict, *extra: Any) -> str:
+    """Hash a normalized payload (plus scope such as endpoint and account)."""
+    # Inline images hash by content digest instead of materializing the data URI.
+    normalized = json.dumps([scope, payload, *extra], sort_keys=True, ensure_ascii=False, default=json_default)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+generation_flights = SingleFlight()
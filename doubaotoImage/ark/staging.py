@@ -0,0 +1,475 @@
+"""Upload-once staging of reference images, passed to Ark by URL.
+
+An inline ``data:`` URI makes a request about a third larger than the image
+and resends the whole image on every run. With staging configured, each
+distinct image is stored once under its SHA-256 (``<digest>.<ext>``) in an
+HTTP-reachable store, and the payload carries the image's URL instead.
+Repeated runs reuse the URL; concurrent requests for the same image share one
+upload. ``Stager.stage_all`` keeps an image inline if staging it fails.
+
+Backends, chosen from the provider credentials by ``stager_for``:
+
+- ``HttpStaging`` (``staging_upload_url`` set) skips the upload when a HEAD
+  of ``staging_upload_url/<name>`` finds the object, otherwise PUTs it there.
+  Ark gets ``staging_url/<name>``. Works with any store that accepts plain
+  PUTs (WebDAV, nginx ``dav_methods PUT``, a bucket behind a signing proxy),
+  including ``LocalStore``. ``staging_token``, if set, is sent as a bearer
+  token.
+- ``LocalStaging`` (only ``staging_url`` set) writes into ``ARK_STAGING_DIR``
+  and serves it through a ``LocalStore`` embedded in the plugin process,
+  listening on ``ARK_STAGING_HOST``:``ARK_STAGING_PORT`` (default
+  ``0.0.0.0:8791``). ``staging_url`` must be the address at which Ark can
+  reach that port. The store only serves GET and HEAD, unless
+  ``ARK_STAGING_UPLOAD_TOKEN`` is set: then it also accepts PUTs bearing that
+  token, so it can stand in for an ``HttpStaging`` target in tests.
+- ``ARK_STAGING_BACKEND=package.module:factory`` plugs in anything else, for
+  example an object store SDK. ``factory(credentials)`` returns a
+  ``StagingBackend``, or None to keep images inline.
+
+Staged objects older than ``ARK_STAGING_TTL`` seconds (default 86400) are
+uploaded again rather than reused, and ``LocalStaging`` deletes them. The
+local directory is also capped at ``ARK_STAGING_MAX_MB`` (default 1024):
+least recently used objects are evicted to make room, and staged again when
+next needed.
+"""
+
+import abc
+import contextvars
+import hashlib
+import hmac
+import importlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from ark.client import download_session
+from ark.payload import InlineImage
+from ark.singleflight import SingleFlight
+from ark.telemetry import count, span
+
+logger = logging.getLogger(__name__)
+
+STAGING_PATH = "/ark/staging/"
+DEFAULT_PORT = 8791
+DEFAULT_TTL = 24 * 3600.0
+DEFAULT_MAX_MB = 1024
+MAX_STAGE_WORKERS = 4
+MAX_OBJECT_BYTES = 64 * 1024 * 1024
+UPLOAD_TIMEOUT = 60
+OBJECT_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+
+
+def object_name(image: InlineImage) -> str:
+    extension = mimetypes.guess_extension(image.mime_type) or ".bin"
+    return f"{image.digest}{extension}"
+
+
+class StagingBackend(abc.ABC):
+    """Stores an image under ``name`` and returns the URL Ark should fetch it from."""
+
+    @abc.abstractmethod
+    def put(self, name: str, image: InlineImage) -> str:
+        """Upload ``image`` (unless it is already there) and return its public URL."""
+
+    def holds(self, name: str) -> bool:
+        """Whether an object staged earlier is still there; remote stores are trusted until the TTL."""
+        return True
+
+
+class RawBody:
+    """Sized, re-iterable raw bytes of an image, so uploads send ``Content-Length``."""
+
+    def __init__(self, image: InlineImage):
+        self.image = image
+
+    def __len__(self) -> int:
+        return self.image.raw_size
+
+    def __iter__(self):
+        return self.image.iter_bytes()
+
+
+class HttpStaging(StagingBackend):
+    def __init__(self, upload_url: str, public_url: str, token: Optional[str] = None):
+        self.upload_url = upload_url.rstrip("/")
+        self.public_url = public_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    def put(self, name: str, image: InlineImage) -> str:
+        target = f"{self.upload_url}/{name}"
+        session = download_session()
+        response = session.request("HEAD", target, timeout=UPLOAD_TIMEOUT, headers=self.headers)
+        if response.status_code != 200:
+            response = session.request(
+                "PUT",
+                target,
+                timeout=UPLOAD_TIMEOUT,
+                data=RawBody(image),
+                headers={**self.headers, "Content-Type": image.mime_type},
+            )
+            response.raise_for_status()
+            count("bytes_staged", image.raw_size)
+        return f"{self.public_url}/{name}"
+
+
+class LocalStaging(StagingBackend):
+    def __init__(self, store: "LocalStore", public_url: str):
+        self.store = store
+        self.public_url = public_url.rstrip("/")
+
+    def put(self, name: str, image: InlineImage) -> str:
+        self.store.start()
+        if self.store.write(name, image.iter_bytes()):
+            count("bytes_staged", image.raw_size)
+        return f"{self.public_url}{STAGING_PATH}{name}"
+
+    def holds(self, name: str) -> bool:
+        path = self.store.path(name)
+        return path is not None and os.path.isfile(path)
+
+
+class Stager:
+    """Uploads each distinct image once per ``ttl`` through ``backend``."""
+
+    def __init__(self, backend: StagingBackend, ttl: float = DEFAULT_TTL, max_entries: int = 4096):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._urls: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._flights = SingleFlight()
+        self.uploads = 0
+        self.reused = 0
+
+    def stage(self, image: InlineImage) -> str:
+        name = object_name(image)
+        if url := self._lookup(name):
+            return url
+        url, shared = self._flights.do(name, lambda: self._upload(name, image))
+        if shared:
+            with self._lock:
+                self.reused += 1
+        return url
+
+    def stage_all(self, values: list) -> tuple[list, list[str]]:
+        """Replace every ``InlineImage`` in ``values`` by its staged URL.
+
+        Returns the new list and the errors of images that stayed inline.
+        """
+        images = [value for value in values if isinstance(value, InlineImage)]
+        if not images:
+            return list(values), []
+        with ThreadPoolExecutor(max_workers=min(len(images), MAX_STAGE_WORKERS)) as pool:
+            # Each worker runs in a copy of the caller's context so it records into the same trace.
+            futures = {
+                id(image): pool.submit(contextvars.copy_context().run, self.stage, image) for image in images
+            }
+            staged, errors = [], []
+            for value in values:
+                future = futures.get(id(value))
+                if future is None:
+                    staged.append(value)
+                    continue
+                try:
+                    staged.append(future.result())
+                except Exception as error:
+                    errors.append(str(error))
+                    staged.append(value)
+        return staged, errors
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"uploads": self.uploads, "reused": self.reused, "entries": len(self._urls)}
+
+    def _lookup(self, name: str) -> Optional[str]:
+        with self._lock:
+            entry = self._urls.get(name)
+            if entry is None:
+                return None
+            url, staged_at = entry
+            if time.monotonic() - staged_at > self.ttl:
+                del self._urls[name]
+                return None
+        # Evicted from a size-capped store since: stage it again.
+        if not self.backend.holds(name):
+            with self._lock:
+                self._urls.pop(name, None)
+            return None
+        with self._lock:
+            if name in self._urls:
+                self._urls.move_to_end(name)
+            self.reused += 1
+        count("staged_reused")
+        return url
+
+    def _upload(self, name: str, image: InlineImage) -> str:
+        with span("stage"):
+            url = self.backend.put(name, image)
+        with self._lock:
+            self.uploads += 1
+            self._urls[name] = (url, time.monotonic())
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+
+class LocalStore:
+    """Content-addressed files in ``directory``, served over HTTP.
+
+    GET and HEAD serve ``STAGING_PATH<name>``. With an ``upload_token``, PUT
+    stores a body bearing that token, and only if its SHA-256 matches the name,
+    so the store can be used as the target of ``HttpStaging`` as well; without
+    one, PUT is refused. The directory holds at most ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        host: str,
+        port: int,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+        upload_token: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.upload_token = upload_token
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._pruned_at = 0.0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}{STAGING_PATH}"
+
+    def start(self) -> None:
+        """Bind the server on first use; raises ``OSError`` if the port is taken."""
+        with self._lock:
+            if self._server is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            server = ThreadingHTTPServer((self.host, self.port), _handler_for(self))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="ark-staging", daemon=True).start()
+            self._server = server
+            self.port = server.server_address[1]
+
+    def path(self, name: str) -> Optional[str]:
+        if not OBJECT_NAME.match(name):
+            return None
+        return os.path.join(self.directory, name)
+
+    def write(self, name: str, chunks) -> bool:
+        """Store ``chunks`` as ``name``; False if it was already there."""
+        self._prune()
+        path = self.path(name)
+        if path is None:
+            raise ValueError(f"invalid staging object name: {name}")
+        if os.path.exists(path):
+            os.utime(path)
+            return False
+        digest = hashlib.sha256()
+        size = 0
+        handle = tempfile.NamedTemporaryFile(dir=self.directory, prefix=".upload-", delete=False)
+        try:
+            with handle:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > MAX_OBJECT_BYTES:
+                        raise ValueError("staging object too large")
+                    digest.update(chunk)
+                    handle.write(chunk)
+            if digest.hexdigest() != name.split(".", 1)[0]:
+                raise ValueError("content does not match its name")
+            with self._lock:
+                self._make_room(size)
+                os.replace(handle.name, path)
+        finally:
+            if os.path.exists(handle.name):
+                os.remove(handle.name)
+        return True
+
+    def authorized(self, authorization: Optional[str]) -> bool:
+        if not self.upload_token:
+            return False
+        return hmac.compare_digest((authorization or "").encode("utf-8"), f"Bearer {self.upload_token}".encode("utf-8"))
+
+    def _make_room(self, size: int) -> None:
+        """Evict least recently used objects until ``size`` more bytes fit; the caller holds the lock."""
+        if size > self.max_bytes:
+            raise ValueError("staging object larger than the staging directory")
+        objects = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and OBJECT_NAME.match(entry.name):
+                stat = entry.stat()
+                objects.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(object_size for _, object_size, _ in objects)
+        for _, object_size, path in sorted(objects):
+            if total + size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= object_size
+
+    def _prune(self) -> None:
+        now = time.time()
+        with self._lock:
+            if self.ttl <= 0 or now - self._pruned_at < 60:
+                return
+            self._pruned_at = now
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+
+def _handler_for(store: LocalStore) -> type:
+    class StagingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_HEAD(self) -> None:
+            self._serve(send_body=False)
+
+        def do_GET(self) -> None:
+            self._serve(send_body=True)
+
+        def do_PUT(self) -> None:
+            if not store.authorized(self.headers.get("Authorization")):
+                # The body is left unread, so the connection cannot be reused.
+                self.close_connection = True
+                return self._reply(401 if store.upload_token else 405)
+            path = self._object_path()
+            length = int(self.headers.get("Content-Length") or 0)
+            if path is None:
+                return self._reply(404)
+            if not length or length > MAX_OBJECT_BYTES:
+                return self._reply(411 if not length else 413)
+            try:
+                created = store.write(os.path.basename(path), self._read_body(length))
+            except (OSError, ValueError):
+                return self._reply(400)
+            self._reply(201 if created else 200)
+
+        def _read_body(self, length: int):
+            remaining = length
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+        def _serve(self, send_body: bool) -> None:
+            path = self._object_path()
+            if path is None or not os.path.isfile(path):
+                return self._reply(404)
+            if send_body:
+                # Downloads keep an object recently used, so a size cap evicts others first.
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+            self.send_response(200)
+            self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+            self.end_headers()
+            if send_body:
+                with open(path, "rb") as handle:
+                    shutil.copyfileobj(handle, self.wfile)
+
+        def _object_path(self) -> Optional[str]:
+            request_path = self.path.split("?", 1)[0]
+            if not request_path.startswith(STAGING_PATH):
+                return None
+            return store.path(request_path[len(STAGING_PATH):])
+
+        def _reply(self, status: int) -> None:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    return StagingHandler
+
+
+_stagers: dict[tuple, Optional[Stager]] = {}
+_stagers_lock = threading.Lock()
+
+
+def stager_for(credentials: dict) -> Optional[Stager]:
+    """The shared ``Stager`` for these credentials, or None to send images inline."""
+    public_url = (credentials.get("staging_url") or "").strip()
+    upload_url = (credentials.get("staging_upload_url") or "").strip()
+    token = credentials.get("staging_token") or None
+    factory = os.getenv("ARK_STAGING_BACKEND")
+    if not (factory or public_url):
+        return None
+
+    key = (factory, public_url, upload_url, token)
+    with _stagers_lock:
+        if key not in _stagers:
+            backend = _backend(factory, credentials, public_url, upload_url, token)
+            _stagers[key] = Stager(backend, ttl=_env_number("ARK_STAGING_TTL", DEFAULT_TTL)) if backend else None
+        return _stagers[key]
+
+
+def _backend(
+    factory: Optional[str], credentials: dict, public_url: str, upload_url: str, token: Optional[str]
+) -> Optional[StagingBackend]:
+    if factory:
+        module, _, name = factory.partition(":")
+        try:
+            return getattr(importlib.import_module(module), name)(credentials)
+        except Exception:
+            logger.exception("Cannot load ARK_STAGING_BACKEND %r", factory)
+            return None
+    if upload_url:
+        return HttpStaging(upload_url, public_url or upload_url, token)
+    return LocalStaging(local_store, public_url)
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _port() -> int:
+    try:
+        return int(os.getenv("ARK_STAGING_PORT", DEFAULT_PORT))
+    except ValueError:
+        return DEFAULT_PORT
+
+
+local_store = LocalStore(
+    os.getenv("ARK_STAGING_DIR") or os.path.join(tempfile.gettempdir(), "ark-staging"),
+    os.getenv("ARK_STAGING_HOST", "0.0.0.0"),
+    _port(),
+    ttl=_env_number("ARK_STAGING_TTL", DEFAULT_TTL),
+    max_bytes=int(_env_number("ARK_STAGING_MAX_MB", DEFAULT_MAX_MB) * 1024 * 1024),
+    upload_token=os.getenv("ARK_STAGING_UPLOAD_TOKEN") or None,
+)
@@ -0,0 +1,58 @@
+"""Server-sent events of streamed image generation.
+
+With ``"stream": true`` Ark answers ``/images/generations`` with an event
+stream instead of one JSON document. Each image of a sequential group is sent
+as soon as it is ready (``image_generation.partial_succeeded``, or
+``image_generation.partial_failed``), and a final
+``image_generation.completed`` event carries the usage. The stream ends with
+``data: [DONE]``.
+"""
+
+import json
+from typing import Generator
+
+import requests
+
+PARTIAL_SUCCEEDED = "image_generation.partial_succeeded"
+PARTIAL_FAILED = "image_generation.partial_failed"
+COMPLETED = "image_generation.completed"
+DONE = "[DONE]"
+# Fields of a partial event that describe the image itself.
+IMAGE_FIELDS = ("url", "b64_json", "size")
+
+
+def iter_events(response: requests.Response) -> Generator[dict, None, None]:
+    """Yield each JSON event of an SSE response until ``[DONE]`` or end of stream."""
+    data: list[str] = []
+    # chunk_size=None hands over each chunk as it arrives instead of waiting for a full block.
+    for raw_line in response.iter_lines(chunk_size=None):
+        line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+        if line:
+            # Comments (":" keep-alives) and the event/id/retry fields carry nothing we use.
+            if line.startswith("data:"):
+                data.append(line[5:].lstrip(" "))
+            continue
+        if not data:
+            continue
+        text, data = "\n".join(data), []
+        if text == DONE:
+            return
+        event = json.loads(text)
+        if isinstance(event, dict):
+            yield event
+    if data and "\n".join(data) != DONE:
+        event = json.loads("\n".join(data))
+        if isinstance(event, dict):
+            yield event
+
+
+def event_image(event: dict) -> dict:
+    """The image of a ``partial_succeeded`` event, shaped like an entry of ``data``."""
+    return {field: event[field] for field in IMAGE_FIELDS if event.get(field)}
+
+
+def event_error(event: dict) -> str:
+    error = event.get("error")
+    if isinstance(error, dict):
+        return error.get("message") or error.get("code") or "unknown error"
+    return str(error or "unknown error")
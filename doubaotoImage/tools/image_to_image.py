@@ -1,19 +1,30 @@
-import base64
 import json
-import os
-from typing import Generator, Optional
+from typing import Generator, Optional, Union
 from urllib.parse import urlparse
 
-import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from ark.cache import content_key, image_cache, missing_files
+from ark.client import IMAGES_PATH, ArkClient, download_session, get_client, metrics_fields
+from ark.imaging import ImagePolicy, preprocess_image
+from ark.payload import InlineImage
+from ark.relative import configured_bases, relative_urls
+from ark.results import image_messages, summarize
+from ark.schema import file_parameters, looks_like_file_id
+from ark.singleflight import generation_flights, request_key
+from ark.staging import stager_for
+from ark.telemetry import count, span, traced
+
+# Variable names older workflows map the input image to, before the YAML-declared file parameters.
+IMAGE_PARAMETERS = ("image", "reference_image", "sys.files", "sys_files")
+
 
 class ImageToImageTool(Tool):
+    @traced("image_to_image")
     def _invoke(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, None]:
         credentials = self.runtime.credentials or {}
-        api_key = credentials.get("ark_api_key")
-        base_url = credentials.get("base_url") or "https://ark.cn-beijing.volces.com"
+        client = get_client(credentials)
         model = tool_parameters.get("model") or "ep-20260125201054-pfrb4"
 
         prompt = tool_parameters.get("prompt")
@@ -21,13 +32,32 @@ class ImageToImageTool(Tool):
             yield self.create_text_message("prompt is required")
             return
 
-        image_input = yield from self._resolve_image_from_parameters(tool_parameters)
+        self._image_policy = ImagePolicy.from_parameters(tool_parameters, model)
+        self._image_reports = []
+        self._stager = None
+        with span("resolve_images"):
+            image_input = yield from self._resolve_image_from_parameters(tool_parameters)
         if not image_input:
             yield self.create_text_message(
                 "image is required or local file content could not be resolved"
             )
             return
 
+        if self._image_reports:
+            saved = sum(report["saved_bytes"] for report in self._image_reports)
+            yield self.create_text_message(
+                f"Preprocessed {len(self._image_reports)} reference image(s), saved {saved / 1024:.0f} KB"
+            )
+
+        # 配置了暂存地址时，参考图按内容哈希只上传一次，请求中改为传图片 URL
+        self._stager = stager_for(credentials)
+        if self._stager:
+            (image_input,), errors = self._stager.stage_all([image_input])
+            if errors:
+                yield self.create_text_message(
+                    f"Could not stage {len(errors)} image(s) ({errors[0]}), sending them inline"
+                )
+
         size = tool_parameters.get("size") or "4K"
         response_format = tool_parameters.get("response_format") or "url"
         watermark = tool_parameters.get("watermark")
@@ -43,24 +73,19 @@ class ImageToImageTool(Tool):
             "watermark": watermark,
         }
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-
-        url = f"{base_url.rstrip('/')}/api/v3/images/generations"
-
         yield self.create_text_message("正在调用豆包模型生成图片...")
 
-        response = requests.post(url, headers=headers, json=payload, timeout=120)
-        response.raise_for_status()
-        data = response.json()
+        if tool_parameters.get("coalesce", True):
+            # 相同请求并发时只调用一次接口，其余调用共享结果
+            flight_key = request_key(IMAGES_PATH, payload, client.base_url, client.key_digest)
+            data, _ = generation_flights.do(flight_key, lambda: self._generate(client, payload))
+        else:
+            data = self._generate(client, payload)
 
         images = data.get("data") or []
-        for image in images:
-            image_url = image.get("url")
-            if image_url:
-                yield self.create_image_message(image_url)
+        # 下载生成的图片并作为文件返回，避免签名 URL 过期；多张图片并行下载
+        attach = client if tool_parameters.get("attach_images", False) else None
+        downloads = yield from image_messages(self, images, client=attach)
 
         yield self.create_text_message("图片生成成功！返回 JSON 结果：")
 
@@ -69,28 +94,36 @@ class ImageToImageTool(Tool):
             {
                 "model": data.get("model"),
                 "created": data.get("created"),
-                "data": images,
+                "data": summarize(images, tool_parameters.get("include_base64", False)),
                 "usage": data.get("usage"),
+                "downloads": downloads,
+                **metrics_fields(
+                    client,
+                    image_cache=image_cache.stats(),
+                    image_preprocessing=self._image_reports,
+                    image_staging=self._stager.stats() if self._stager else None,
+                ),
             }
         )
 
-    def _resolve_image_from_parameters(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, Optional[str]]:
-        for key in ["image", "reference_image", "sys.files", "sys_files"]:
+    def _generate(self, client: ArkClient, payload: dict) -> dict:
+        with span("generate"):
+            response = client.post_json(IMAGES_PATH, payload, timeout=client.config.image_timeout)
+            response.raise_for_status()
+            return response.json()
+
+    def _resolve_image_from_parameters(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
+        # Only parameters declared as files in the YAML (plus the legacy
+        # variable names) are inspected; prompts and options never reach the
+        # file manager.
+        for key in file_parameters(__file__, IMAGE_PARAMETERS):
             resolved = yield from self._resolve_image_input(tool_parameters.get(key))
             if resolved:
                 return resolved
 
-        skip_keys = {"prompt", "size", "response_format", "watermark", "model"}
-        for key, value in tool_parameters.items():
-            if key in skip_keys:
-                continue
-            resolved = yield from self._resolve_image_input(value)
-            if resolved:
-                return resolved
-
         return None
 
-    def _resolve_image_input(self, image_parameter) -> Generator[ToolInvokeMessage, None, Optional[str]]:
+    def _resolve_image_input(self, image_parameter) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
         if not image_parameter:
             return None
 
@@ -122,7 +155,7 @@ class ImageToImageTool(Tool):
 
         return None
 
-    def _extract_image_input(self, image_input: dict) -> Generator[ToolInvokeMessage, None, Optional[str]]:
+    def _extract_image_input(self, image_input: dict) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
         transfer_method = image_input.get("transfer_method")
 
         if transfer_method == "remote_url":
@@ -158,7 +191,7 @@ class ImageToImageTool(Tool):
 
         return self._url_to_data_uri(image_input.get("url") or image_input.get("remote_url"))
 
-    def _extract_from_file_object(self, value) -> Generator[ToolInvokeMessage, None, Optional[str]]:
+    def _extract_from_file_object(self, value) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
         if value is None:
             return None
 
@@ -173,12 +206,14 @@ class ImageToImageTool(Tool):
         # SDK file model may expose a lazy-loaded bytes property `blob`.
         blob = self._safe_getattr(value, "blob")
         if isinstance(blob, bytes) and blob:
-            mime_type = self._normalize_image_mime_type(self._safe_getattr(value, "mime_type"))
-            return f"data:{mime_type};base64,{base64.b64encode(blob).decode('utf-8')}"
+            cache_key = self._cache_key(content_key(blob))
+            if cached := image_cache.get(cache_key):
+                return cached
+            return self._encode_image(blob, self._safe_getattr(value, "mime_type"), cache_key)
 
         return self._url_to_data_uri(self._safe_getattr(value, "url"))
 
-    def _url_to_data_uri(self, raw_url) -> Optional[str]:
+    def _url_to_data_uri(self, raw_url) -> Optional[Union[str, InlineImage]]:
         if not isinstance(raw_url, str) or not raw_url.strip():
             return None
 
@@ -188,25 +223,25 @@ class ImageToImageTool(Tool):
         if not (url.startswith("/") or self._looks_like_url_or_data_uri(url)):
             return None
 
-        candidates = [url]
-        if url.startswith("/"):
-            candidates = []
-            for env_key in ["DIFY_INNER_API_URL", "DIFY_API_URL", "DIFY_BASE_URL", "CONSOLE_API_URL"]:
-                base = os.getenv(env_key)
-                if isinstance(base, str) and base.strip():
-                    candidates.append(f"{base.rstrip('/')}{url}")
+        cache_key = self._cache_key(f"url:{url}")
+        if cached := image_cache.get(cache_key):
+            return cached
 
-        for candidate in candidates:
-            try:
-                response = requests.get(candidate, timeout=20)
+        def get(candidate: str):
+            with span("fetch_image"):
+                response = download_session().get(candidate, timeout=20)
                 response.raise_for_status()
-                content_type = response.headers.get("Content-Type")
-                mime_type = self._normalize_image_mime_type(content_type)
-                return f"data:{mime_type};base64,{base64.b64encode(response.content).decode('utf-8')}"
-            except Exception:
-                continue
+            return response
 
-        return None
+        try:
+            # Relative paths race every configured Dify base and reuse the one that answered last time.
+            response = relative_urls.fetch(url, get) if url.startswith("/") else get(url)
+            if response is None:
+                return None
+            count("bytes_downloaded", len(response.content))
+            return self._encode_image(response.content, response.headers.get("Content-Type"), cache_key)
+        except Exception:
+            return None
 
     def _safe_getattr(self, obj, attr: str):
         try:
@@ -229,19 +264,54 @@ class ImageToImageTool(Tool):
             return self._extract_file_id(nested_value)
         return None
 
-    def _file_id_to_data_uri(self, file_id: Optional[str]) -> Generator[ToolInvokeMessage, None, Optional[str]]:
-        if not file_id:
+    def _file_id_to_data_uri(self, file_id: Optional[str]) -> Generator[ToolInvokeMessage, None, Optional[Union[str, InlineImage]]]:
+        # Free text and ids that recently failed to resolve skip the file manager.
+        if not file_id or not looks_like_file_id(file_id):
             return None
+        file_key = self._file_key(file_id)
+        if file_key in missing_files:
+            return None
+
+        cache_key = self._cache_key(f"file:{file_key}")
+        if cached := image_cache.get(cache_key):
+            return cached
 
-        file_content, mime_type = yield from self._read_file_content(file_id)
+        count("file_lookups")
+        with span("read_file"):
+            file_content, mime_type = yield from self._read_file_content(file_id)
         if not file_content:
+            missing_files.add(file_key)
             return None
 
-        mime_type = self._normalize_image_mime_type(mime_type)
-        encoded = base64.b64encode(file_content).decode("utf-8")
-        return f"data:{mime_type};base64,{encoded}"
+        return self._encode_image(file_content, mime_type, cache_key)
+
+    def _file_key(self, file_id: str) -> str:
+        # A file id only resolves on the Dify instance, and for the user, it was looked up for.
+        session = getattr(self, "session", None)
+        base = getattr(session, "dify_plugin_daemon_url", None) or ",".join(configured_bases())
+        user_id = getattr(getattr(self, "runtime", None), "user_id", None)
+        return f"{base}|{user_id}|{file_id}"
+
+    def _cache_key(self, source_key: str) -> str:
+        # Preprocessing settings change the encoded output, so they are part of the key.
+        policy = getattr(self, "_image_policy", None) or ImagePolicy()
+        return f"{source_key}|{policy.cache_tag}"
+
+    def _encode_image(self, content: bytes, raw_mime_type: Optional[str], cache_key: str) -> InlineImage:
+        policy = getattr(self, "_image_policy", None) or ImagePolicy()
+        with span("encode"):
+            result = preprocess_image(content, self._normalize_image_mime_type(raw_mime_type), policy)
+            # Encoded once into memory or a temp file; the request body streams it.
+            image = InlineImage.from_bytes(result.content, self._normalize_image_mime_type(result.mime_type))
+        if result.report is not None and getattr(self, "_image_reports", None) is not None:
+            self._image_reports.append(result.report)
+        image_cache.put(cache_key, image)
+        return image
 
     def _read_file_content(self, file_id: str) -> Generator[ToolInvokeMessage, None, tuple[Optional[bytes], Optional[str]]]:
+        # Must stay a generator: callers `yield from` it, and iterating a
+        # plain tuple would leak the bytes as messages and return None.
+        yield from ()
         # Preferred path in current SDK runtimes.
         runtime = getattr(self, "runtime", None)
         file_manager = getattr(runtime, "file_manager", None) if runtime else None
@@ -1,19 +1,32 @@
+import time
 from typing import Generator
 
 import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from ark.client import IMAGES_PATH, ArkClient, get_client, metrics_fields
+from ark.fanout import DEFAULT_CONCURRENCY, MAX_BATCH_SIZE, fan_out, parse_prompts, sum_usage
+from ark.results import image_messages, summarize
+from ark.singleflight import generation_flights, request_key
+from ark.streaming import COMPLETED, PARTIAL_FAILED, PARTIAL_SUCCEEDED, event_error, event_image, iter_events
+from ark.telemetry import record_span, span, traced
+
 
 class TextToImageTool(Tool):
+    @traced("text_to_image")
     def _invoke(self, tool_parameters: dict) -> Generator[ToolInvokeMessage, None, None]:
         credentials = self.runtime.credentials or {}
-        api_key = credentials.get("ark_api_key")
-        base_url = credentials.get("base_url") or "https://ark.cn-beijing.volces.com"
+        client = get_client(credentials)
         model = tool_parameters.get("model") or "ep-20260125201054-pfrb4"
 
         prompt = tool_parameters.get("prompt")
-        if not prompt:
+        try:
+            prompts = parse_prompts(tool_parameters.get("prompts"))
+        except ValueError as e:
+            yield self.create_text_message(f"Invalid batch prompts: {str(e)}")
+            return
+        if not prompt and not prompts:
             yield self.create_text_message("prompt is required")
             return
 
@@ -38,27 +51,182 @@ class TextToImageTool(Tool):
                 "max_images": int(max_images)
             }
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
+        coalesce = tool_parameters.get("coalesce", True)
+        if prompts:
+            yield from self._invoke_batch(client, payload, prompts, coalesce, tool_parameters)
+            return
 
-        url = f"{base_url.rstrip('/')}/api/v3/images/generations"
-        response = requests.post(url, headers=headers, json=payload, timeout=120)
-        response.raise_for_status()
-        data = response.json()
+        if tool_parameters.get("stream", False):
+            yield from self._invoke_stream(client, payload, tool_parameters)
+            return
+
+        data = self._request(client, payload, coalesce)
 
         images = data.get("data") or []
-        for image in images:
-            image_url = image.get("url")
-            if image_url:
-                yield self.create_image_message(image_url)
+        # 下载生成的图片并作为文件返回，避免签名 URL 过期；多张图片并行下载
+        attach = client if tool_parameters.get("attach_images", False) else None
+        downloads = yield from image_messages(self, images, client=attach)
 
         yield self.create_json_message(
             {
                 "model": data.get("model"),
                 "created": data.get("created"),
-                "data": images,
+                "data": summarize(images, tool_parameters.get("include_base64", False)),
                 "usage": data.get("usage"),
+                "downloads": downloads,
+                **metrics_fields(client),
             }
         )
+
+    def _invoke_batch(
+        self, client: ArkClient, base_payload: dict, prompts: list[str], coalesce: bool, tool_parameters: dict
+    ) -> Generator[ToolInvokeMessage, None, None]:
+        """Generate every prompt in parallel and stream images as each call returns."""
+        if len(prompts) > MAX_BATCH_SIZE:
+            yield self.create_text_message(
+                f"Batch too large: {len(prompts)} prompts requested, at most {MAX_BATCH_SIZE} allowed"
+            )
+            return
+
+        concurrency = int(tool_parameters.get("batch_concurrency") or DEFAULT_CONCURRENCY)
+        # More workers than pooled connections would only queue on the pool.
+        concurrency = min(max(concurrency, 1), client.config.pool_maxsize, len(prompts))
+        yield self.create_text_message(f"Generating {len(prompts)} prompt(s), {concurrency} at a time")
+
+        attach = client if tool_parameters.get("attach_images", False) else None
+        started = time.monotonic()
+        results = []
+        calls = ({**base_payload, "prompt": prompt} for prompt in prompts)
+        for outcome in fan_out(lambda payload: self._request(client, payload, coalesce), list(calls), concurrency):
+            prompt = outcome.item["prompt"]
+            label = f"[{outcome.index + 1}/{len(prompts)}]"
+            if outcome.error is not None:
+                yield self.create_text_message(f"{label} Error generating image: {str(outcome.error)}")
+                results.append({
+                    "index": outcome.index,
+                    "prompt": prompt,
+                    "latency_seconds": round(outcome.seconds, 3),
+                    "error": str(outcome.error),
+                })
+                continue
+
+            images = outcome.value.get("data") or []
+            downloads = yield from image_messages(
+                self, images, label=f"generated_image_{outcome.index + 1}", client=attach
+            )
+            results.append({
+                "index": outcome.index,
+                "prompt": prompt,
+                "latency_seconds": round(outcome.seconds, 3),
+                "data": summarize(images, tool_parameters.get("include_base64", False)),
+                "downloads": downloads,
+                "usage": outcome.value.get("usage"),
+            })
+
+        elapsed = time.monotonic() - started
+        results.sort(key=lambda result: result["index"])
+        latencies = sorted(result["latency_seconds"] for result in results)
+        succeeded = [result for result in results if "error" not in result]
+        yield self.create_json_message(
+            {
+                "batch_size": len(prompts),
+                "succeeded": len(succeeded),
+                "failed": len(results) - len(succeeded),
+                "concurrency": concurrency,
+                "elapsed_seconds": round(elapsed, 3),
+                "prompts_per_second": round(len(results) / elapsed, 3) if elapsed else None,
+                "latency_seconds": {
+                    "min": latencies[0] if latencies else None,
+                    "p50": latencies[len(latencies) // 2] if latencies else None,
+                    "max": latencies[-1] if latencies else None,
+                },
+                "usage": sum_usage([result.get("usage") for result in succeeded]),
+                "results": results,
+                **metrics_fields(client),
+            }
+        )
+
+    def _invoke_stream(
+        self, client: ArkClient, payload: dict, tool_parameters: dict
+    ) -> Generator[ToolInvokeMessage, None, None]:
+        """Request a server-sent event stream and return each image as soon as it arrives."""
+        # 流式输出：组图每生成一张即返回，不等待整组完成；流式请求不参与相同请求合并
+        expected = (payload.get("sequential_image_generation_options") or {}).get("max_images")
+        if expected:
+            yield self.create_text_message(f"Streaming up to {expected} image(s) as they are generated")
+        else:
+            yield self.create_text_message("Streaming images as they are generated")
+
+        started = time.monotonic()
+        first_image_seconds = None
+        images, failures, usage, model, created = [], [], None, payload.get("model"), None
+        attach = client if tool_parameters.get("attach_images", False) else None
+        downloads = [] if attach else None
+        try:
+            response = client.post_json(
+                IMAGES_PATH, {**payload, "stream": True}, timeout=client.config.image_timeout, stream=True
+            )
+            try:
+                response.raise_for_status()
+                for event in iter_events(response):
+                    model = event.get("model") or model
+                    created = event.get("created") or created
+                    event_type = event.get("type")
+                    index = event.get("image_index", len(images) + len(failures))
+                    elapsed = time.monotonic() - started
+                    if event_type == PARTIAL_SUCCEEDED:
+                        if first_image_seconds is None:
+                            first_image_seconds = elapsed
+                            record_span("first_image", elapsed)
+                        image = event_image(event)
+                        images.append({"index": index, **image, "seconds": round(elapsed, 3)})
+                        attached = yield from image_messages(self, [image], start=index + 1, client=attach)
+                        if attached:
+                            downloads.extend(attached)
+                        yield self.create_text_message(
+                            f"Image {index + 1} ready after {elapsed:.1f}s ({len(images)} generated so far)"
+                        )
+                    elif event_type == PARTIAL_FAILED:
+                        failures.append({"index": index, "error": event_error(event)})
+                        yield self.create_text_message(f"Image {index + 1} failed: {event_error(event)}")
+                    elif event_type == COMPLETED:
+                        usage = event.get("usage")
+                    elif event.get("error"):
+                        failures.append({"index": None, "error": event_error(event)})
+                        yield self.create_text_message(f"Image generation failed: {event_error(event)}")
+                        break
+            finally:
+                response.close()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            failures.append({"index": None, "error": str(e)})
+            yield self.create_text_message(f"Image stream interrupted: {str(e)}")
+        record_span("generate", time.monotonic() - started)
+
+        yield self.create_json_message(
+            {
+                "model": model,
+                "created": created,
+                "data": summarize(images, tool_parameters.get("include_base64", False)),
+                "failed": failures,
+                # 流被中断时没有最终 usage，按已返回的图片数计
+                "usage": usage or {"generated_images": len(images)},
+                "downloads": downloads,
+                "first_image_seconds": round(first_image_seconds, 3) if first_image_seconds is not None else None,
+                "elapsed_seconds": round(time.monotonic() - started, 3),
+                **metrics_fields(client),
+            }
+        )
+
+    def _request(self, client: ArkClient, payload: dict, coalesce: bool) -> dict:
+        if not coalesce:
+            return self._generate(client, payload)
+        # 相同请求并发时只调用一次接口，其余调用共享结果
+        flight_key = request_key(IMAGES_PATH, payload, client.base_url, client.key_digest)
+        data, _ = generation_flights.do(flight_key, lambda: self._generate(client, payload))
+        return data
+
+    def _generate(self, client: ArkClient, payload: dict) -> dict:
+        with span("generate"):
+            response = client.post_json(IMAGES_PATH, payload, timeout=client.config.image_timeout)
+            response.raise_for_status()
+            return response.json()
@@ -0,0 +1,72 @@
+#!/bin/bash
+echo "=== DoubaoToImage 插件文件验证 ==="
+echo ""
+
+# 检查核心文件
+files=(
+    "manifest.yaml"
+    "provider/doubao_ark.yaml"
+    "provider/doubao_ark.py"
+    "tools/text_to_image.yaml"
+    "tools/text_to_image.py"
+    "tools/image_to_image.yaml"
+    "tools/image_to_image.py"
+    "_assets/icon.svg"
+    "requirements.txt"
+)
+
+all_exist=true
+for file in "${files[@]}"; do
+    if [ -f "$file" ]; then
+        echo "✓ $file"
+    else
+        echo "✗ $file (缺失)"
+        all_exist=false
+    fi
+done
+
+# 两个插件共用的 ark 模块必须逐字节一致（修改后需同步复制到另一个插件）
+shared=(
+    "__init__.py"
+    "aio.py"
+    "cache.py"
+    "client.py"
+    "download.py"
+    "endpoints.py"
+    "imaging.py"
+    "payload.py"
+    "ratelimit.py"
+    "relative.py"
+    "retry.py"
+    "schema.py"
+    "singleflight.py"
+    "staging.py"
+    "telemetry.py"
+)
+
+echo ""
+in_sync=true
+for module in "${shared[@]}"; do
+    if cmp -s "ark/$module" "../doubaoToVideo/ark/$module"; then
+        echo "✓ ark/$module 与 doubaoToVideo 一致"
+    else
+        echo "✗ ark/$module 与 ../doubaoToVideo/ark/$module 不一致"
+        in_sync=false
+    fi
+done
+
+echo ""
+if [ "$all_exist" = true ]; then
+    echo "✅ 所有核心文件存在"
+    echo ""
+    echo "📦 插件大小: $(du -sh . | cut -f1)"
+    echo "📦 ZIP包: ../doubaotoImage.zip ($(ls -lh ../doubaotoImage.zip | awk '{print $5}'))"
+else
+    echo "❌ 部分文件缺失，请检查"
+fi
+if [ "$in_sync" != true ]; then
+    echo "❌ 共用的 ark 模块与 doubaoToVideo 不一致，请同步后再打包"
+fi
+if [ "$all_exist" != true ] || [ "$in_sync" != true ]; then
+    exit 1
+fi
@@ -0,0 +1,54 @@
+"""Test setup: the video plugin's ``ark`` package and the mock Ark server.
+
+The image plugin ships byte-identical copies of the shared ``ark`` modules
+(``verify.sh`` checks that), so exercising them through the video plugin
+covers both.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "doubaoToVideo"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from mock_ark import MockArk, MockConfig  # noqa: E402
+
+
+@pytest.fixture
+def mock_ark():
+    """Start mock Ark servers configured with ``MockConfig`` fields; stopped after the test."""
+    servers = []
+
+    def start(**config) -> MockArk:
+        server = MockArk(MockConfig(**config)).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def client_for():
+    """Build an ``ArkClient`` for a mock server."""
+    from ark.client import ArkClient, ClientConfig
+
+    def build(server: MockArk, **config) -> ArkClient:
+        return ArkClient(server.url, "test-key", ClientConfig(**config))
+
+    return build
+
+
+@pytest.fixture(autouse=True)
+def task_ledger(tmp_path, monkeypatch):
+    """A fresh, test-local ledger of claimed task ids, shared like ``ARK_TASK_LEDGER_DIR``."""
+    from ark import client, retry
+
+    ledger = retry.TaskLedger(str(tmp_path / "ledger"))
+    monkeypatch.setattr(retry, "task_ledger", ledger)
+    monkeypatch.setattr(client, "task_ledger", ledger)
+    return ledger
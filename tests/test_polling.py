@@ -0,0 +1,47 @@
+import pytest
+
+from ark.batch import BatchItem, run_batch
+from ark.client import ClientConfig
+from ark.polling import PollPolicy, PollScheduler, poll_task
+from ark.tasks import create_task
+
+# The last scheduled delay ends at the 4s deadline; the task succeeds at 3.3s.
+DEADLINE_POLICY = PollPolicy(first_delay=0.2, base_interval=2, max_wait=4, jitter=0)
+PAYLOAD = {"model": "doubao-seedance-1-0-pro-250528", "content": [{"type": "text", "text": "a cat"}]}
+
+
+def test_poll_task_checks_status_at_deadline(mock_ark, client_for):
+    server = mock_ark(queue=0, run=3.3, create_latency=0)
+    client = client_for(server)
+    task_id = create_task(client, PAYLOAD)["id"]
+
+    scheduler = PollScheduler(DEADLINE_POLICY, PAYLOAD["model"])
+    events = list(poll_task(client, task_id, scheduler))
+
+    assert events[-1].status == "succeeded"
+    assert scheduler.elapsed() >= 3.3
+
+
+def test_batch_checks_status_at_deadline(mock_ark, client_for):
+    server = mock_ark(queue=0, run=3.3, create_latency=0)
+    client = client_for(server)
+    item = BatchItem(index=0, prompt="a cat", payload=PAYLOAD)
+
+    events = list(run_batch(client, [item], DEADLINE_POLICY, max_in_flight=1))
+
+    assert events[-1].kind == "finished"
+    assert item.status == "succeeded"
+    assert item.error is None
+
+
+def test_engine_polls_on_the_event_loop(mock_ark):
+    aio = pytest.importorskip("ark.aio")
+    server = mock_ark(queue=0, run=3.3, create_latency=0)
+    client = aio.get_engine_client(server.url, "test-key", ClientConfig())
+    task_id = create_task(client, PAYLOAD)["id"]
+
+    scheduler = PollScheduler(DEADLINE_POLICY, PAYLOAD["model"])
+    events = list(poll_task(client, task_id, scheduler))
+
+    assert events[-1].status == "succeeded"
+    assert server.polls_per_task[task_id] == len(events)
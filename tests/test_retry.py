@@ -0,0 +1,201 @@
+import threading
+
+import pytest
+import requests
+
+from ark import client as client_module
+from ark.client import VIDEO_TASKS_PATH
+from ark.retry import NotSent, RetryPolicy, TaskLedger, UnconfirmedRequest, recover_created_task, send_with_retries
+from ark.tasks import create_task
+
+MODEL = "doubao-seedance-1-0-pro-250528"
+FAST = RetryPolicy(max_retries=2, base_delay=0.01, jitter=0, lookup_settle=0.01)
+
+
+def payload(text: str = "a cat") -> dict:
+    return {"model": MODEL, "content": [{"type": "text", "text": text}], "ratio": "16:9", "duration": 5}
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # Short backoff; the settle delay still outlasts the first lookup so list-lag tests can see it.
+    def retry_policy(config):
+        return RetryPolicy(
+            max_retries=config.max_retries, base_delay=0.1, jitter=0, lookup_settle=0.5,
+            retry_unconfirmed=config.retry_unconfirmed,
+        )
+
+    monkeypatch.setattr(client_module.ClientConfig, "retry_policy", retry_policy)
+
+
+def post_unclaimed(server, body: dict) -> None:
+    """Create a task the way another host would: nothing is recorded in this host's ledger."""
+    try:
+        requests.post(f"{server.url}{VIDEO_TASKS_PATH}", json=body, timeout=5)
+    except requests.exceptions.ConnectionError:
+        pass
+
+
+class Sends:
+    """A scripted ``send``: each call returns or raises the next outcome."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        outcome = self.outcomes[self.calls]
+        self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response._content, response._content_consumed = b"", True
+        return response
+
+
+def test_server_errors_are_retried():
+    send = Sends(500, 503, 200)
+    assert send_with_retries(send, FAST, "POST").status_code == 200
+    assert send.calls == 3
+
+
+def test_unsent_post_is_retried():
+    send = Sends(NotSent("refused"), 200)
+    assert send_with_retries(send, FAST, "POST").status_code == 200
+    assert send.calls == 2
+
+
+def test_unconfirmed_post_without_lookup_is_not_retried():
+    send = Sends(requests.exceptions.ReadTimeout("slow"), 200)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        send_with_retries(send, FAST, "POST")
+    assert send.calls == 1
+
+
+def test_unconfirmed_get_is_retried():
+    send = Sends(requests.exceptions.ReadTimeout("slow"), 200)
+    assert send_with_retries(send, FAST, "GET").status_code == 200
+
+
+def test_post_is_resent_only_after_two_empty_lookups():
+    lookups = []
+    send = Sends(requests.exceptions.ReadTimeout("slow"), 200)
+    response = send_with_retries(send, FAST, "POST", lambda: lookups.append(1))
+    assert response.status_code == 200
+    assert send.calls == 2
+    assert len(lookups) == 2
+
+
+def test_ambiguous_lookup_fails_instead_of_resending():
+    def recover():
+        raise UnconfirmedRequest("2 recent task(s) could belong to the timed-out request")
+
+    send = Sends(requests.exceptions.ReadTimeout("slow"), 200)
+    with pytest.raises(UnconfirmedRequest):
+        send_with_retries(send, FAST, "POST", recover)
+    assert send.calls == 1
+
+
+def test_ledger_claims_once_across_processes(tmp_path):
+    first, second = TaskLedger(str(tmp_path)), TaskLedger(str(tmp_path))
+    assert first.claim("cgt-1")
+    assert not first.claim("cgt-1")
+    # A second plugin process shares the directory.
+    assert second.known("cgt-1")
+    assert not second.claim("cgt-1")
+
+
+def test_ledger_without_directory_is_process_local():
+    ledger = TaskLedger(None)
+    assert ledger.claim("cgt-1")
+    assert ledger.known("cgt-1")
+    assert not TaskLedger(None).known("cgt-1")
+
+
+def test_recover_adopts_the_single_matching_task(mock_ark, client_for, task_ledger):
+    server = mock_ark(create_latency=0)
+    client = client_for(server)
+    post_unclaimed(server, payload("a dog"))
+    post_unclaimed(server, payload())
+
+    response = recover_created_task(client, VIDEO_TASKS_PATH, payload(), since=0)
+
+    task_id = response.json()["id"]
+    assert server.tasks[task_id]["content"][0]["text"] == "a cat"
+    assert task_ledger.known(task_id)
+
+
+def test_recover_skips_tasks_claimed_elsewhere(mock_ark, client_for, task_ledger):
+    server = mock_ark(create_latency=0)
+    client = client_for(server)
+    post_unclaimed(server, payload())
+    TaskLedger(task_ledger.directory).claim(next(iter(server.tasks)))
+
+    assert recover_created_task(client, VIDEO_TASKS_PATH, payload(), since=0) is None
+
+
+def test_recover_refuses_several_candidates(mock_ark, client_for):
+    server = mock_ark(create_latency=0)
+    client = client_for(server)
+    post_unclaimed(server, payload())
+    post_unclaimed(server, payload())
+
+    with pytest.raises(UnconfirmedRequest):
+        recover_created_task(client, VIDEO_TASKS_PATH, payload(), since=0)
+
+
+def test_dropped_create_adopts_its_task(mock_ark, client_for):
+    server = mock_ark(create_latency=0, drop_rate=1.0)
+    client = client_for(server)
+
+    task_id = create_task(client, payload())["id"]
+
+    assert list(server.tasks) == [task_id]
+    assert server.counts["create_task"] == 1
+
+
+def test_dropped_create_waits_out_list_lag(mock_ark, client_for):
+    server = mock_ark(create_latency=0, drop_rate=1.0, list_lag=0.3)
+    client = client_for(server)
+
+    task_id = create_task(client, payload())["id"]
+
+    assert list(server.tasks) == [task_id]
+    assert server.counts["list_tasks"] == 2
+
+
+def test_dropped_create_with_another_candidate_fails(mock_ark, client_for):
+    server = mock_ark(create_latency=0)
+    post_unclaimed(server, payload())
+    server.config.drop_rate = 1.0
+    client = client_for(server)
+
+    with pytest.raises(UnconfirmedRequest):
+        create_task(client, payload())
+    assert len(server.tasks) == 2
+
+
+def test_concurrent_dropped_creates_never_duplicate(mock_ark, client_for):
+    server = mock_ark(create_latency=0.05, drop_rate=0.5, seed=7)
+    client = client_for(server)
+    outcomes = []
+
+    def create(text):
+        try:
+            outcomes.append(create_task(client, payload(text))["id"])
+        except UnconfirmedRequest as error:
+            outcomes.append(error)
+
+    # Half the calls share a prompt, so some lookups see more than one candidate.
+    threads = [threading.Thread(target=create, args=(f"prompt {index % 4}",)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    task_ids = [outcome for outcome in outcomes if isinstance(outcome, str)]
+    assert len(outcomes) == 8
+    assert len(task_ids) == len(set(task_ids))
+    # Every call created exactly one task: none was sent twice.
+    assert len(server.tasks) == 8
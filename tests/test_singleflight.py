@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from ark.singleflight import SingleFlight
+
+
+def _follow(flights: SingleFlight, key: str, results: list) -> threading.Thread:
+    def run():
+        try:
+            results.append(flights.do(key, lambda: pytest.fail("a follower ran the call")))
+        except Exception as error:
+            results.append(error)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_follower_waits_for_a_slow_leader():
+    flights = SingleFlight()
+    flight, leader = flights.begin("key")
+    assert leader
+    results = []
+    follower = _follow(flights, "key", results)
+
+    # Longer than any fixed follower timeout derived from small client timeouts.
+    time.sleep(0.5)
+    assert flight.waiters == 1
+    flight.resolve({"id": "shared"})
+    flights.finish("key", flight)
+    follower.join(5)
+
+    assert results == [({"id": "shared"}, True)]
+
+
+def test_follower_sees_an_abandoned_flight_fail():
+    flights = SingleFlight()
+    flight, _ = flights.begin("key")
+    results = []
+    follower = _follow(flights, "key", results)
+
+    while not flight.waiters:
+        time.sleep(0.01)
+    flights.finish("key", flight)
+    follower.join(5)
+
+    assert isinstance(results[0], RuntimeError)
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+from ark.payload import InlineImage
+from ark.staging import Stager, StagingBackend
+
+
+class SlowBackend(StagingBackend):
+    def __init__(self):
+        self.puts = []
+
+    def put(self, name: str, image: InlineImage) -> str:
+        time.sleep(0.2)
+        self.puts.append(name)
+        return f"https://staging.example/{name}"
+
+
+def test_backends_must_implement_put():
+    class Incomplete(StagingBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_concurrent_stages_upload_once():
+    backend = SlowBackend()
+    stager = Stager(backend)
+    image = InlineImage.from_bytes(b"\x89PNG not really", "image/png")
+    urls = []
+    threads = [threading.Thread(target=lambda: urls.append(stager.stage(image))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(backend.puts) == 1
+    assert urls == [f"https://staging.example/{backend.puts[0]}"] * 4
+    assert stager.stage(image) == urls[0]
+    assert len(backend.puts) == 1